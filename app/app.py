@@ -1,14 +1,103 @@
-from fastapi import FastAPI, File, UploadFile, Form
-from fastapi.responses import FileResponse
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import List
+
+from fastapi import Depends, FastAPI, File, UploadFile, Form, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from PIL import Image
-import torch
-import requests
-from transformers import TextStreamer
-from unsloth import FastVisionModel
 
-app = FastAPI()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.image_hash import phash
+from common.image_preprocessing import decode_image
+from common.metrics import add_gauge, gauge_callback, observe, start_profiler_if_enabled, timed
+from http_metrics import RequestMetricsMiddleware, metrics_response, profile_response
+from batching import BACKGROUND, MicroBatcher
+from jobs import JOBS_MAX_IMAGES, JOBS_MAX_UPLOAD_BYTES, JobRunner, JobStore, job_events, job_results
+from inference import MODEL_BACKEND, WARMUP_TOKENS, import_backend, load_model, generate_batch, stream_generate, warmup
+from lifecycle import FAILED, ModelLifecycle
+from result_cache import PerceptualResultCache
+from similar import SIMILAR_TOP_K, SimilarPatterns
+from uploads import BodySizeLimitMiddleware
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "8"))
+MAX_BATCH_WAIT_MS = float(os.getenv("MAX_BATCH_WAIT_MS", "20"))
+MAX_QUEUE = int(os.getenv("MAX_QUEUE", "256"))
+# Streams bypass the batcher and each hold a generation thread until it ends.
+MAX_STREAMS = int(os.getenv("MAX_STREAMS", "8"))
+
+# Loaded in the background by the lifespan hook, so the port is bound right away.
+model, tokenizer = None, None
+# Opened by the lifespan hook.
+job_runner = None
+lifecycle = ModelLifecycle()
+# Batched and streaming generation share the model; only one generate runs at a time.
+inference_lock = threading.Lock()
+stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+
+def load():
+    global model, tokenizer
+    lifecycle.phase("imports", import_backend, MODEL_BACKEND)
+    model, tokenizer = lifecycle.phase("weights", load_model)
+    if WARMUP_TOKENS > 0:
+        with inference_lock:
+            lifecycle.phase("warmup", warmup, model, tokenizer)
+
+
+def run_batch(requests):
+    images, prompts = zip(*requests)
+    observe("generate_batch_size", len(requests), buckets=(1, 2, 4, 8, 16, 32))
+    with inference_lock, timed("generate_batch"):
+        return generate_batch(model, tokenizer, list(images), list(prompts))
+
+
+batcher = MicroBatcher(run_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_BATCH_WAIT_MS, max_queue=MAX_QUEUE)
+result_cache = PerceptualResultCache()
+similar = SimilarPatterns()
+gauge_callback("inference_queue_depth", lambda: batcher.queue_depth)
+gauge_callback("result_cache_entries", lambda: result_cache.stats()["entries"])
+gauge_callback("result_cache_hit_rate", lambda: result_cache.stats()["hit_rate"])
+
+
+async def generate_job_item(image_bytes, prompt):
+    """One image of a batch job; queued behind every interactive request."""
+    try:
+        image = await asyncio.to_thread(decode_upload, io.BytesIO(image_bytes))
+    except Exception:
+        raise ValueError("Upload is not a readable image")
+    image_hash = await asyncio.to_thread(phash, image)
+    cached = result_cache.get(image_hash, prompt)
+    if cached is not None:
+        return cached
+    pattern = await batcher.submit((image, prompt), priority=BACKGROUND)
+    result_cache.put(image_hash, prompt, pattern)
+    return pattern
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global job_runner
+    await batcher.start()
+    start_profiler_if_enabled()
+    threading.Thread(target=lifecycle.run, args=(load,), name="model-loader", daemon=True).start()
+    threading.Thread(target=similar.load, name="similarity-loader", daemon=True).start()
+    job_runner = JobRunner(JobStore(), generate_job_item, ready=lambda: lifecycle.ready)
+    job_runner.store.purge()
+    gauge_callback("job_items_queued", job_runner.store.queued_items)
+    await job_runner.start()
+    yield
+    await job_runner.stop()
+    await batcher.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,6 +106,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(BodySizeLimitMiddleware, path_limits={"/jobs": JOBS_MAX_UPLOAD_BYTES})
+app.add_middleware(RequestMetricsMiddleware)
 
 # Serve HTML from static folder
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -25,21 +116,168 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 async def root():
     return FileResponse("static/index.html")
 
-# Load model once at startup
-model, tokenizer = FastVisionModel.from_pretrained("your-hf-username/your-lora-model", load_in_4bit=False)
-FastVisionModel.for_inference(model)
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model.to(device)
+@app.get("/healthz")
+async def liveness():
+    # The process is up and serving; only a failed load means it needs a restart.
+    status_code = 500 if lifecycle.state == FAILED else 200
+    return JSONResponse(lifecycle.status(), status_code=status_code)
+
+@app.get("/readyz")
+async def readiness():
+    return JSONResponse(lifecycle.status(), status_code=200 if lifecycle.ready else 503)
+
+def require_ready():
+    if not lifecycle.ready:
+        raise HTTPException(status_code=503, detail=f"Model is {lifecycle.state}", headers={"Retry-After": "5"})
+
+@app.get("/stats")
+async def stats():
+    return batcher.stats()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return result_cache.stats()
+
+@app.get("/metrics")
+async def metrics():
+    return metrics_response()
 
-@app.post("/generate")
+@app.get("/debug/profile")
+async def profile():
+    return profile_response()
+
+def decode_upload(upload):
+    with timed("decode_upload"):
+        return decode_image(upload)
+
+async def read_image(file):
+    # Decoding runs off the event loop; a 12 MP JPEG is decoded at reduced scale.
+    try:
+        return await asyncio.to_thread(decode_upload, file.file)
+    except Exception as e:
+        print(f"[WARNING] Rejected upload that is not a readable image: {e}")
+        raise HTTPException(status_code=400, detail="Upload is not a readable image")
+
+@app.post("/generate", dependencies=[Depends(require_ready)])
 async def generate_pattern(file: UploadFile = File(...), prompt: str = Form("")):
-    image_bytes = await file.read()
-    headers = {"Authorization": "Bearer hf_YOUR_TOKEN"}
-    response = requests.post(
-        "https://api-inference.huggingface.co/models/your-username/your-lora-model",
-        headers=headers,
-        files={"inputs": image_bytes},
-        data={"parameters": {"prompt": prompt}},
-    )
-    result = response.json()
-    return {"pattern": result.get("generated_text", "")}
+    image = await read_image(file)
+    image_hash = await asyncio.to_thread(phash, image)
+    cached = result_cache.get(image_hash, prompt)
+    if cached is not None:
+        return {"pattern": cached}
+
+    try:
+        pattern = await batcher.submit((image, prompt))
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Inference queue is full", headers={"Retry-After": "1"})
+    result_cache.put(image_hash, prompt, pattern)
+    return {"pattern": pattern}
+
+@app.post("/similar")
+async def similar_patterns(file: UploadFile = File(...), k: int = Form(SIMILAR_TOP_K)):
+    # Independent of the generation model: answers from the embedding index while it loads or runs.
+    if not similar.ready:
+        raise HTTPException(status_code=503, detail=similar.error or "Similarity index is loading",
+                            headers={"Retry-After": "5"})
+    start = time.perf_counter()
+    image = await read_image(file)
+    patterns = await asyncio.to_thread(similar.query, image, k)
+    return {"patterns": patterns, "took_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+@app.post("/jobs", status_code=202)
+async def submit_job(files: List[UploadFile] = File(...), prompt: str = Form("")):
+    """
+    Queue a batch of images for generation and return the job right away.
+
+    Accepted while the model is still loading; progress is on ``/jobs/{id}``
+    and ``/jobs/{id}/events``, results on ``/jobs/{id}/results``.
+    """
+    if len(files) > JOBS_MAX_IMAGES:
+        raise HTTPException(status_code=413, detail=f"At most {JOBS_MAX_IMAGES} images per job")
+    job = await asyncio.to_thread(job_runner.store.create, prompt, [(f.filename, f.file) for f in files])
+    job_runner.notify()
+    return job
+
+async def get_job_or_404(job_id):
+    job = await asyncio.to_thread(job_runner.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return await get_job_or_404(job_id)
+
+@app.get("/jobs/{job_id}/events")
+async def job_status_stream(request: Request, job_id: str):
+    await get_job_or_404(job_id)
+    return StreamingResponse(job_events(job_runner, job_id, request), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.get("/jobs/{job_id}/results")
+async def job_results_jsonl(job_id: str):
+    await get_job_or_404(job_id)
+    return StreamingResponse(job_results(job_runner.store, job_id), media_type="application/x-ndjson",
+                             headers={"Content-Disposition": f'attachment; filename="{job_id}.jsonl"'})
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    await get_job_or_404(job_id)
+    return await asyncio.to_thread(job_runner.store.cancel, job_id)
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/generate/stream", dependencies=[Depends(require_ready)])
+async def generate_pattern_stream(request: Request, file: UploadFile = File(...), prompt: str = Form("")):
+    """
+    Server-sent events variant of /generate.
+
+    Emits a ``token`` event per decoded chunk and a final ``done`` event with
+    time-to-first-token and total latency. Generation stops as soon as the
+    client disconnects. At most ``MAX_STREAMS`` generations (running or waiting
+    for the model) exist at once; beyond that the request gets a 503 like /generate.
+    """
+    start = time.perf_counter()
+    image = await read_image(file)
+    if not stream_slots.acquire(blocking=False):
+        raise HTTPException(status_code=503, detail="Too many streaming requests", headers={"Retry-After": "1"})
+    add_gauge("generate_streams_in_flight", 1)
+
+    def release_slot():
+        add_gauge("generate_streams_in_flight", -1)
+        stream_slots.release()
+
+    stop_event = threading.Event()
+    try:
+        streamer = stream_generate(model, tokenizer, image, prompt, stop_event, lock=inference_lock,
+                                   on_done=release_slot)
+    except Exception:
+        release_slot()
+        raise
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        chunks = iter(streamer)
+        first_token_ms = None
+        try:
+            while True:
+                chunk = await loop.run_in_executor(None, next, chunks, None)
+                if chunk is None:
+                    break
+                if await request.is_disconnected():
+                    print("[INFO] Client disconnected, stopping generation")
+                    return
+                if not chunk:
+                    continue
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - start) * 1000
+                yield sse("token", {"text": chunk})
+            total_ms = (time.perf_counter() - start) * 1000
+            print(f"[INFO] Streamed pattern: ttft={first_token_ms or 0:.0f}ms total={total_ms:.0f}ms")
+            yield sse("done", {"ttft_ms": round(first_token_ms or total_ms, 1), "total_ms": round(total_ms, 1)})
+        finally:
+            # Runs on normal completion, disconnect and cancellation alike.
+            stop_event.set()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
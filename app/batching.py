@@ -0,0 +1,140 @@
+import asyncio
+import itertools
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests into micro-batches for a single inference worker.
+
+    Requests are queued in-process; the worker takes the first waiting request,
+    then keeps collecting until ``max_batch_size`` requests are in hand or
+    ``max_wait_ms`` has passed, and runs ``run_batch`` once on a dedicated thread
+    so the event loop stays responsive. Each caller's future is resolved with its
+    own result (or the batch's exception).
+
+    Requests carry a priority: ``INTERACTIVE`` requests are always taken before
+    ``BACKGROUND`` ones (batch jobs), which only fill capacity left over. Only
+    interactive requests count against ``max_queue``; background submitters are
+    expected to bound their own concurrency.
+
+    Args:
+        run_batch (callable): Takes a list of request items, returns a list of results in the same order.
+        max_batch_size (int): Upper bound on requests per batch.
+        max_wait_ms (float): How long the first request of a batch waits for company.
+        max_queue (int): Interactive requests allowed to wait before ``submit`` raises ``asyncio.QueueFull``.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=20.0, max_queue=256):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self._queue = None
+        self._task = None
+        self._order = itertools.count()
+        self.waiting = Counter()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes = {}
+        self.busy_seconds = 0.0
+
+    async def start(self):
+        self._queue = asyncio.PriorityQueue()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=True)
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, item, priority=INTERACTIVE):
+        """
+        Queue one request and wait for its result.
+
+        Raises:
+            asyncio.QueueFull: If too many interactive requests are already waiting.
+        """
+        if priority == INTERACTIVE and self.waiting[INTERACTIVE] >= self.max_queue:
+            raise asyncio.QueueFull
+        future = asyncio.get_running_loop().create_future()
+        # The counter keeps equal priorities first-come, first-served.
+        self._queue.put_nowait((priority, next(self._order), item, future))
+        self.waiting[priority] += 1
+        return await future
+
+    def _take(self, entry):
+        priority, _, item, future = entry
+        self.waiting[priority] -= 1
+        return item, future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [self._take(await self._queue.get())]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without waiting.
+            try:
+                batch.append(self._take(self._queue.get_nowait()))
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._take(await asyncio.wait_for(self._queue.get(), timeout)))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Callers that went away (client disconnect, timeout) are not worth computing.
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self._executor, self.run_batch, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            finally:
+                self.busy_seconds += time.perf_counter() - start
+                self.batches += 1
+                self.items += len(batch)
+                self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "busy_seconds": round(self.busy_seconds, 3),
+            "queue_depth": self.queue_depth,
+            "background_waiting": self.waiting[BACKGROUND],
+        }
@@ -0,0 +1,111 @@
+"""
+Throughput vs. latency of the micro-batching engine on CPU.
+
+Loads a tiny stand-in vision-language model with the transformers backend and
+pushes concurrent requests through ``MicroBatcher`` for each batch-size / wait
+setting. ``--synthetic`` replaces the model with a sleep-based cost model
+(fixed cost per batch plus a cost per item) to check the scheduler alone.
+
+    cd app && python bench_batching.py --requests 64 --concurrency 16 --batch-sizes 1 4 8
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from PIL import Image
+
+from batching import MicroBatcher
+
+DEFAULT_STANDIN_MODEL = "trl-internal-testing/tiny-LlavaForConditionalGeneration"
+
+
+def percentile(sorted_values, q):
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def make_runner(args):
+    if args.synthetic:
+        def run_batch(requests):
+            time.sleep(args.batch_cost_ms / 1000 + len(requests) * args.item_cost_ms / 1000)
+            return ["pattern"] * len(requests)
+        return run_batch
+
+    import torch
+    from inference import load_model, generate_batch
+
+    torch.set_num_threads(args.threads)
+    model, processor = load_model(args.model, backend="transformers")
+
+    def run_batch(requests):
+        images, prompts = zip(*requests)
+        return generate_batch(model, processor, list(images), list(prompts), max_new_tokens=args.max_new_tokens)
+    return run_batch
+
+
+async def run_setting(run_batch, max_batch_size, max_wait_ms, total, concurrency, image):
+    batcher = MicroBatcher(run_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, max_queue=total)
+    await batcher.start()
+    latencies = []
+    remaining = list(range(total))
+
+    async def client():
+        while remaining:
+            remaining.pop()
+            start = time.perf_counter()
+            await batcher.submit((image, "Describe the crochet pattern."))
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stats = batcher.stats()
+    await batcher.stop()
+
+    latencies.sort()
+    return {
+        "max_batch_size": max_batch_size,
+        "max_wait_ms": max_wait_ms,
+        "requests_per_sec": round(total / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.5), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "mean_batch_size": round(stats["mean_batch_size"], 2),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark micro-batching on CPU.")
+    parser.add_argument("--model", default=DEFAULT_STANDIN_MODEL, help="Tiny HF vision-language checkpoint.")
+    parser.add_argument("--synthetic", action="store_true", help="Use a sleep-based cost model instead of a model.")
+    parser.add_argument("--batch-cost-ms", type=float, default=40.0, help="Synthetic fixed cost per batch.")
+    parser.add_argument("--item-cost-ms", type=float, default=5.0, help="Synthetic cost per request in a batch.")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--waits-ms", type=float, nargs="+", default=[5.0, 20.0])
+    parser.add_argument("--max-new-tokens", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--json", help="Write the results to this file.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    run_batch = make_runner(args)
+    image = Image.new("RGB", (224, 224), (200, 120, 90))
+
+    results = []
+    for max_batch_size in args.batch_sizes:
+        for max_wait_ms in args.waits_ms:
+            result = asyncio.run(run_setting(run_batch, max_batch_size, max_wait_ms, args.requests, args.concurrency, image))
+            print(result)
+            results.append(result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+CPU inference modes compared on a small stand-in checkpoint.
+
+Each mode is loaded through ``load_cpu_model`` in its own subprocess so peak RSS
+is measured cleanly: ``fp32`` (merged weights, no quantization) and ``int8``
+(merged weights, dynamically quantized linear layers). With ``--lora`` a randomly
+initialized LoRA adapter is created on top of the stand-in first, so both modes
+also go through the adapter merge the fine-tuned model needs.
+
+Reports greedy decoding tokens/sec, load time and peak RSS per mode, and the
+drift of each mode against fp32: cosine similarity and max abs difference of
+the next-token logits, whether the top-1 token agrees, and how many generated
+tokens match before the first divergence.
+
+    cd app && python bench_cpu.py --lora --max-new-tokens 64 --threads 4
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from bench_batching import DEFAULT_STANDIN_MODEL
+
+MODES = {"fp32": "none", "int8": "int8"}
+PROMPT = "Describe the crochet pattern."
+
+
+def make_image(size=336):
+    y, x = np.mgrid[0:size, 0:size]
+    pixels = np.stack([x * 255 // size, y * 255 // size, (x + y) * 127 // size], axis=-1).astype(np.uint8)
+    return Image.fromarray(pixels)
+
+
+def make_lora_adapter(base_model, output_dir):
+    """Save a randomly initialized LoRA adapter (and the processor) for ``base_model``."""
+    import torch
+    from peft import LoraConfig, get_peft_model
+    from transformers import AutoModelForVision2Seq, AutoProcessor
+
+    torch.manual_seed(0)
+    model = AutoModelForVision2Seq.from_pretrained(base_model, torch_dtype=torch.float32)
+    config = LoraConfig(r=8, lora_alpha=16, target_modules=["q_proj", "v_proj"], init_lora_weights=False)
+    get_peft_model(model, config).save_pretrained(output_dir)
+    AutoProcessor.from_pretrained(base_model).save_pretrained(output_dir)
+    return output_dir
+
+
+def run_worker(args):
+    """Load one mode, time greedy decoding and dump the results next to ``args.out``."""
+    import torch
+    from inference import configure_cpu_threads, load_cpu_model, prepare_inputs
+
+    threads = configure_cpu_threads(args.threads)
+    start = time.perf_counter()
+    model, processor = load_cpu_model(args.model, quantization=MODES[args.worker])
+    load_s = time.perf_counter() - start
+
+    inputs = prepare_inputs(model, processor, [make_image()], [PROMPT])
+    prompt_len = inputs["input_ids"].shape[1]
+    with torch.inference_mode():
+        logits = model(**inputs).logits[0, -1].float().numpy()
+        model.generate(**inputs, max_new_tokens=4, do_sample=False)
+        start = time.perf_counter()
+        output = model.generate(
+            **inputs, max_new_tokens=args.max_new_tokens, min_new_tokens=args.max_new_tokens, do_sample=False
+        )
+        elapsed = time.perf_counter() - start
+
+    np.save(args.out + ".npy", logits)
+    result = {
+        "mode": args.worker,
+        "threads": threads,
+        "load_s": round(load_s, 2),
+        "tokens_per_sec": round(args.max_new_tokens / elapsed, 2),
+        # ru_maxrss is in KiB on Linux.
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "tokens": output[0, prompt_len:].tolist(),
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+def drift(reference, result, ref_logits, logits):
+    matching = 0
+    for a, b in zip(reference["tokens"], result["tokens"]):
+        if a != b:
+            break
+        matching += 1
+    cosine = float(np.dot(ref_logits, logits) / (np.linalg.norm(ref_logits) * np.linalg.norm(logits)))
+    return {
+        "logits_cosine": round(cosine, 6),
+        "logits_max_abs_diff": round(float(np.abs(ref_logits - logits).max()), 4),
+        "top1_agrees": bool(ref_logits.argmax() == logits.argmax()),
+        "matching_prefix_tokens": matching,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare fp32 and int8 CPU inference.")
+    parser.add_argument("--model", default=DEFAULT_STANDIN_MODEL, help="Tiny HF vision-language checkpoint.")
+    parser.add_argument("--lora", action="store_true", help="Benchmark through a LoRA adapter merge.")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads; 0 uses every available core.")
+    parser.add_argument("--json", help="Write the results to this file.")
+    parser.add_argument("--worker", choices=list(MODES), help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.worker:
+        run_worker(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = make_lora_adapter(args.model, os.path.join(tmp, "adapter")) if args.lora else args.model
+        results, logits = {}, {}
+        for mode in args.modes:
+            out = os.path.join(tmp, f"{mode}.json")
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", mode, "--out", out, "--model", model,
+                 "--max-new-tokens", str(args.max_new_tokens), "--threads", str(args.threads)],
+                check=True,
+            )
+            with open(out, encoding="utf-8") as f:
+                results[mode] = json.load(f)
+            logits[mode] = np.load(out + ".npy")
+
+    if "fp32" in results:
+        for mode, result in results.items():
+            result["drift_vs_fp32"] = drift(results["fp32"], result, logits["fp32"], logits[mode])
+
+    for result in results.values():
+        summary = {k: v for k, v in result.items() if k != "tokens"}
+        print(json.dumps(summary))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(list(results.values()), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
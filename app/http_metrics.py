@@ -0,0 +1,63 @@
+import time
+
+from fastapi.responses import PlainTextResponse
+
+from common.metrics import PROFILER, add_gauge, observe, render_prometheus
+
+
+class RequestMetricsMiddleware:
+    """
+    Records ``http_request_seconds`` per method, route template and status, and
+    ``http_requests_in_flight``.
+
+    The duration runs until the last body chunk is sent, so streamed responses
+    are measured end to end. Requests that match no route are labelled
+    ``unmatched`` to keep the label set bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        recorded = False
+
+        def record():
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            route = scope.get("route")
+            observe("http_request_seconds", time.perf_counter() - start, method=scope["method"],
+                    route=getattr(route, "path", "unmatched"), status=status)
+
+        async def timed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        add_gauge("http_requests_in_flight", 1)
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            record()
+            add_gauge("http_requests_in_flight", -1)
+
+
+def metrics_response():
+    """Prometheus text exposition of every metric in the process."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+def profile_response():
+    """Collapsed stacks from the sampling profiler (empty unless PROFILE_SAMPLING=1)."""
+    header = f"# samples={PROFILER.samples} overhead={PROFILER.overhead():.5f}\n"
+    return PlainTextResponse(header + PROFILER.collapsed())
@@ -0,0 +1,287 @@
+import os
+import threading
+from contextlib import nullcontext
+
+MODEL_NAME = os.getenv("MODEL_NAME", "your-hf-username/your-lora-model")
+# "unsloth" for the fine-tuned LoRA model, "transformers" for plain HF checkpoints
+# such as a tiny stand-in vision-language model on CPU.
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "unsloth")
+# "auto" picks CUDA when available. On CPU the model is always loaded with
+# transformers (unsloth needs a GPU), LoRA adapters are merged into the base
+# weights and, with CPU_QUANTIZATION=int8, linear layers are quantized.
+INFERENCE_DEVICE = os.getenv("INFERENCE_DEVICE", "auto")
+CPU_QUANTIZATION = os.getenv("CPU_QUANTIZATION", "int8")
+# 0 uses one thread per core available to this process.
+CPU_THREADS = int(os.getenv("CPU_THREADS", "0"))
+MAX_NEW_TOKENS = int(os.getenv("MAX_NEW_TOKENS", "1024"))
+# Tokens generated once at startup to compile kernels and allocate caches; 0 skips warmup.
+WARMUP_TOKENS = int(os.getenv("WARMUP_TOKENS", "8"))
+
+DEFAULT_INSTRUCTION = (
+    "You are a crochet expert AI. Based on the input image, generate complete and original crochet "
+    "pattern instructions to recreate the item. Infer all necessary details such as stitch types, "
+    "materials, construction steps, and techniques. Provide clear, step-by-step guidance, and fill in "
+    "missing information using your crochet knowledge. Your output should be detailed, accurate, and "
+    "easy to follow."
+)
+
+
+def resolve_device(device=INFERENCE_DEVICE):
+    import torch
+
+    if device == "auto":
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    return torch.device(device)
+
+
+def import_backend(backend=MODEL_BACKEND, device=INFERENCE_DEVICE):
+    """Import the heavy inference libraries, so their cost shows up as its own startup phase."""
+    import torch  # noqa: F401
+    if backend == "unsloth" and resolve_device(device).type == "cuda":
+        import unsloth  # noqa: F401
+    else:
+        import transformers  # noqa: F401
+
+
+def configure_cpu_threads(num_threads=CPU_THREADS):
+    """
+    Pin torch's thread pools for CPU inference.
+
+    Intra-op threads default to the cores in this process's affinity mask (which
+    respects container CPU limits, unlike ``os.cpu_count``). Inter-op parallelism
+    buys nothing for a single generate loop and only oversubscribes the cores.
+
+    Returns:
+        int: Number of intra-op threads in use.
+    """
+    import torch
+
+    if num_threads <= 0:
+        num_threads = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Can only be set once, before any inter-op work has started.
+        pass
+    return num_threads
+
+
+def _adapter_base(model_name):
+    """Base checkpoint of a PEFT (LoRA) adapter, or None if ``model_name`` is a full model."""
+    try:
+        from peft import PeftConfig
+    except ImportError:
+        return None
+    try:
+        return PeftConfig.from_pretrained(model_name).base_model_name_or_path
+    except (OSError, ValueError):
+        return None
+
+
+def quantize_int8(model):
+    """
+    Dynamically quantize the model's linear layers to int8 for CPU inference.
+
+    Weights are stored as int8 and activations are quantized on the fly, which
+    cuts weight memory about 4x and runs the matmuls on int8 kernels. The output
+    projection stays in fp32 since it is the layer most sensitive to drift.
+    """
+    import torch
+    from torch.ao.quantization import default_dynamic_qconfig, quantize_dynamic
+
+    qconfig_spec = {
+        name: default_dynamic_qconfig
+        for name, module in model.named_modules()
+        if isinstance(module, torch.nn.Linear) and not name.endswith("lm_head")
+    }
+    return quantize_dynamic(model, qconfig_spec, dtype=torch.qint8, inplace=True)
+
+
+def load_cpu_model(model_name, quantization=CPU_QUANTIZATION):
+    """
+    Load a model for CPU serving with transformers.
+
+    If ``model_name`` is a LoRA adapter its base model is loaded in fp32, the
+    adapter applied and merged into the base weights, so generation runs on plain
+    linear layers that can then be quantized.
+
+    Returns:
+        tuple: (model, processor).
+    """
+    import torch
+    from transformers import AutoModelForVision2Seq, AutoProcessor
+
+    base_name = _adapter_base(model_name)
+    model = AutoModelForVision2Seq.from_pretrained(
+        base_name or model_name, torch_dtype=torch.float32, low_cpu_mem_usage=True
+    )
+    if base_name:
+        from peft import PeftModel
+        model = PeftModel.from_pretrained(model, model_name).merge_and_unload()
+    model.eval()
+    try:
+        processor = AutoProcessor.from_pretrained(model_name)
+    except (OSError, ValueError):
+        # Adapters saved without their processor use the base model's.
+        if not base_name:
+            raise
+        processor = AutoProcessor.from_pretrained(base_name)
+
+    if quantization == "int8":
+        model = quantize_int8(model)
+    elif quantization not in ("", "none"):
+        raise ValueError(f"Unknown CPU_QUANTIZATION: {quantization}")
+    return model, processor
+
+
+def load_model(model_name=MODEL_NAME, backend=MODEL_BACKEND, device=INFERENCE_DEVICE):
+    """
+    Load the vision-language model and its processor for inference.
+
+    Safetensors checkpoints are preferred and memory-mapped, and weights are
+    materialized straight into the model instead of over a random initialization.
+    On CPU the model goes through ``load_cpu_model`` instead.
+
+    Returns:
+        tuple: (model, processor). For unsloth the processor is what unsloth calls the tokenizer.
+    """
+    device = resolve_device(device)
+    if device.type == "cpu":
+        threads = configure_cpu_threads()
+        print(f"[INFO] CPU inference with {threads} threads, quantization={CPU_QUANTIZATION}")
+        model, processor = load_cpu_model(model_name)
+    elif backend == "unsloth":
+        from unsloth import FastVisionModel
+        model, processor = FastVisionModel.from_pretrained(model_name, load_in_4bit=False, low_cpu_mem_usage=True)
+        FastVisionModel.for_inference(model)
+    else:
+        from transformers import AutoModelForVision2Seq, AutoProcessor
+        processor = AutoProcessor.from_pretrained(model_name)
+        model = AutoModelForVision2Seq.from_pretrained(model_name, low_cpu_mem_usage=True)
+        model.eval()
+    if device.type != "cpu":
+        model.to(device)
+
+    # Batched generation with a decoder-only LM needs left padding.
+    tokenizer = getattr(processor, "tokenizer", processor)
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    return model, processor
+
+
+def build_prompt(processor, instruction):
+    """Render the chat template for one image followed by the instruction."""
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {"type": "image"},
+                {"type": "text", "text": instruction or DEFAULT_INSTRUCTION},
+            ],
+        }
+    ]
+    return processor.apply_chat_template(messages, add_generation_prompt=True)
+
+
+def prepare_inputs(model, processor, images, instructions):
+    """Tokenize a batch of (image, instruction) pairs and move it to the model's device."""
+    texts = [build_prompt(processor, instruction) for instruction in instructions]
+    inputs = processor(
+        images=images,
+        text=texts,
+        add_special_tokens=False,
+        padding=True,
+        return_tensors="pt",
+    )
+    return inputs.to(model.device)
+
+
+def generate_batch(model, processor, images, instructions, max_new_tokens=MAX_NEW_TOKENS, **generate_kwargs):
+    """
+    Run one batched ``generate`` call for several uploads.
+
+    Args:
+        model: Vision-language model from ``load_model``.
+        processor: Matching processor.
+        images (list): PIL images, one per request.
+        instructions (list): Prompt per request; empty strings use the default instruction.
+        max_new_tokens (int): Generation budget per sequence.
+
+    Returns:
+        list: Generated text per request, without the prompt.
+    """
+    import torch
+
+    inputs = prepare_inputs(model, processor, images, instructions)
+    with torch.inference_mode():
+        output = model.generate(**inputs, max_new_tokens=max_new_tokens, use_cache=True, **generate_kwargs)
+    new_tokens = output[:, inputs["input_ids"].shape[1]:]
+    return processor.batch_decode(new_tokens, skip_special_tokens=True)
+
+
+def warmup(model, processor, max_new_tokens=WARMUP_TOKENS):
+    """Run one short generation on a blank image so the first real request is not the slow one."""
+    from PIL import Image
+
+    image = Image.new("RGB", (448, 448), (255, 255, 255))
+    generate_batch(model, processor, [image], [""], max_new_tokens=max_new_tokens)
+
+
+def stream_generate(model, processor, image, instruction, stop_event, lock=None,
+                    max_new_tokens=MAX_NEW_TOKENS, on_done=None, **generate_kwargs):
+    """
+    Start generation for one upload on a background thread and stream its text.
+
+    Generation checks ``stop_event`` after every token, so setting it (e.g. when
+    the client disconnects) ends the ``generate`` call at the next step.
+
+    Args:
+        model: Vision-language model from ``load_model``.
+        processor: Matching processor.
+        image: PIL image.
+        instruction (str): Prompt; empty uses the default instruction.
+        stop_event (threading.Event): Set to abort generation.
+        lock (threading.Lock): Held while generating, to serialize with batched calls.
+        max_new_tokens (int): Generation budget.
+        on_done (callable): Called on the generation thread once it has finished, however it ended.
+
+    Returns:
+        TextIteratorStreamer: Iterator yielding decoded text chunks as they are produced.
+    """
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+    class StopOnEvent(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), stop_event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+    tokenizer = getattr(processor, "tokenizer", processor)
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+
+    def run():
+        try:
+            with lock or nullcontext():
+                if stop_event.is_set():
+                    return
+                inputs = prepare_inputs(model, processor, [image], [instruction])
+                with torch.inference_mode():
+                    model.generate(
+                        **inputs,
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([StopOnEvent()]),
+                        max_new_tokens=max_new_tokens,
+                        use_cache=True,
+                        **generate_kwargs,
+                    )
+        except Exception as e:
+            print(f"[ERROR] Streaming generation failed: {e}")
+        finally:
+            # Unblocks the consumer even if generate raised before finishing.
+            streamer.end()
+            if on_done is not None:
+                on_done()
+
+    threading.Thread(target=run, name="stream-generate", daemon=True).start()
+    return streamer
@@ -0,0 +1,354 @@
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+from common.metrics import inc, timed
+
+JOBS_DIR = os.getenv("JOBS_DIR", "job_data")
+JOBS_CONCURRENCY = int(os.getenv("JOBS_CONCURRENCY", "4"))
+JOBS_MAX_IMAGES = int(os.getenv("JOBS_MAX_IMAGES", "1000"))
+JOBS_MAX_UPLOAD_BYTES = int(os.getenv("JOBS_MAX_UPLOAD_BYTES", str(1024 * 1024 * 1024)))
+JOBS_RETENTION_HOURS = float(os.getenv("JOBS_RETENTION_HOURS", "168"))
+JOBS_KEEPALIVE_SECONDS = 15.0
+JOBS_RESULTS_PAGE = 500
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, CANCELLED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    prompt TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    cancelled INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    filename TEXT,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    seconds REAL,
+    UNIQUE (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS items_by_status ON items (status, id);
+"""
+
+
+class JobStore:
+    """
+    Persistent queue of batch generation jobs in ``<root>/jobs.sqlite``.
+
+    A job is one row in ``jobs`` plus one row per uploaded image in ``items``;
+    the images themselves are kept under ``<root>/<job id>/`` until their item
+    finishes. Items are handed out in submission order across jobs. Items a
+    crash or restart left ``running`` are queued again when the store opens.
+    """
+
+    def __init__(self, root=JOBS_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, "jobs.sqlite"), check_same_thread=False,
+                                    isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        requeued = self.conn.execute("UPDATE items SET status = ? WHERE status = ?", (QUEUED, RUNNING)).rowcount
+        if requeued:
+            print(f"[INFO] Requeued {requeued} job item(s) interrupted by the last shutdown")
+        # Items that were running when their job was cancelled are not worth redoing.
+        for row in self.conn.execute("SELECT id FROM jobs WHERE status = ?", (CANCELLED,)).fetchall():
+            self.cancel(row["id"])
+
+    @staticmethod
+    def _job(row):
+        job = dict(row)
+        job["remaining"] = job["total"] - job["done"] - job["failed"] - job["cancelled"]
+        return job
+
+    def create(self, prompt, uploads):
+        """
+        Store the uploaded images and queue a job for them.
+
+        Args:
+            prompt (str): Prompt used for every image of the job.
+            uploads (list): (filename, file object) pairs.
+
+        Returns:
+            dict: The new job.
+        """
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.root, job_id)
+        os.makedirs(job_dir)
+        items = []
+        for idx, (filename, upload) in enumerate(uploads):
+            path = os.path.join(job_dir, f"{idx:05d}")
+            with open(path, "wb") as f:
+                shutil.copyfileobj(upload, f)
+            items.append((job_id, idx, filename, path, QUEUED))
+
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("INSERT INTO jobs (id, prompt, status, total, created_at) VALUES (?, ?, ?, ?, ?)",
+                              (job_id, prompt, QUEUED, len(items), time.time()))
+            self.conn.executemany("INSERT INTO items (job_id, idx, filename, path, status) VALUES (?, ?, ?, ?, ?)",
+                                  items)
+        inc("jobs_submitted_total")
+        inc("job_items_submitted_total", len(items))
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row is not None else None
+
+    def claim(self):
+        """
+        Mark the oldest queued item as running and return it, or None if the queue is empty.
+        """
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN")
+            row = self.conn.execute(
+                "SELECT items.id, items.job_id, items.idx, items.path, jobs.prompt FROM items "
+                "JOIN jobs ON jobs.id = items.job_id WHERE items.status = ? ORDER BY items.id LIMIT 1",
+                (QUEUED,),
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE items SET status = ? WHERE id = ?", (RUNNING, row["id"]))
+            self.conn.execute("UPDATE jobs SET status = ?, started_at = ? WHERE id = ? AND status = ?",
+                              (RUNNING, time.time(), row["job_id"], QUEUED))
+        return dict(row)
+
+    def finish(self, item, result=None, error=None, seconds=None):
+        """
+        Record the outcome of a claimed item and delete its image.
+
+        Returns:
+            tuple: (job after the update, whether this item completed the job).
+        """
+        status = FAILED if error is not None else DONE
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("UPDATE items SET status = ?, result = ?, error = ?, seconds = ? WHERE id = ?",
+                              (status, result, error, seconds, item["id"]))
+            counter = "failed" if error is not None else "done"
+            self.conn.execute(f"UPDATE jobs SET {counter} = {counter} + 1 WHERE id = ?", (item["job_id"],))
+            completed = self.conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? "
+                "WHERE id = ? AND status = ? AND done + failed + cancelled >= total",
+                (DONE, time.time(), item["job_id"], RUNNING),
+            ).rowcount > 0
+        if os.path.exists(item["path"]):
+            os.remove(item["path"])
+        return self.get(item["job_id"]), completed
+
+    def cancel(self, job_id):
+        """
+        Drop the queued items of a job; items already running still finish.
+
+        Returns:
+            dict: The job, or None if it does not exist.
+        """
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN")
+            paths = [row["path"] for row in self.conn.execute(
+                "SELECT path FROM items WHERE job_id = ? AND status = ?", (job_id, QUEUED))]
+            self.conn.execute("UPDATE items SET status = ? WHERE job_id = ? AND status = ?",
+                              (CANCELLED, job_id, QUEUED))
+            self.conn.execute("UPDATE jobs SET cancelled = cancelled + ? WHERE id = ?", (len(paths), job_id))
+            self.conn.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)",
+                              (CANCELLED, time.time(), job_id, QUEUED, RUNNING))
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        return self.get(job_id)
+
+    def results(self, job_id, after=-1, limit=JOBS_RESULTS_PAGE):
+        """Finished items of a job with an index above ``after``, in index order."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT idx, filename, status, result, error, seconds FROM items "
+                "WHERE job_id = ? AND idx > ? AND status NOT IN (?, ?) ORDER BY idx LIMIT ?",
+                (job_id, after, QUEUED, RUNNING, limit),
+            ).fetchall()
+        return [
+            {"index": row["idx"], "filename": row["filename"], "status": row["status"],
+             "pattern": row["result"], "error": row["error"], "seconds": row["seconds"]}
+            for row in rows
+        ]
+
+    def queued_items(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM items WHERE status = ?", (QUEUED,)).fetchone()[0]
+
+    def purge(self, max_age_hours=JOBS_RETENTION_HOURS):
+        """Delete finished jobs older than ``max_age_hours`` with their results and files."""
+        cutoff = time.time() - max_age_hours * 3600
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN")
+            job_ids = [row["id"] for row in self.conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (*FINISHED, cutoff))]
+            for job_id in job_ids:
+                self.conn.execute("DELETE FROM items WHERE job_id = ?", (job_id,))
+                self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        for job_id in job_ids:
+            shutil.rmtree(os.path.join(self.root, job_id), ignore_errors=True)
+        if job_ids:
+            print(f"[INFO] Purged {len(job_ids)} job(s) older than {max_age_hours:g}h")
+        return len(job_ids)
+
+    def close(self):
+        self.conn.close()
+
+
+class JobRunner:
+    """
+    Works through the queued items of a ``JobStore`` with ``concurrency`` asyncio workers.
+
+    ``process(image_bytes, prompt)`` is the app's generation coroutine for one
+    image. It is expected to schedule its work below interactive requests, so
+    the runner only soaks up capacity /generate leaves unused. Workers hold off
+    while ``ready()`` is False, e.g. during model load; a failed item is recorded
+    with its error and the job carries on.
+
+    Args:
+        store (JobStore): Queue to work from.
+        process (callable): Coroutine function returning the pattern for one image.
+        concurrency (int): Items in progress at once.
+        ready (callable): Whether the app can generate yet.
+        poll_interval (float): Seconds between queue checks when idle or not ready.
+    """
+
+    def __init__(self, store, process, concurrency=JOBS_CONCURRENCY, ready=lambda: True, poll_interval=1.0):
+        self.store = store
+        self.process = process
+        self.concurrency = concurrency
+        self.ready = ready
+        self.poll_interval = poll_interval
+        self._tasks = []
+        self._work = None
+        self._change = None
+
+    async def start(self):
+        self._work = asyncio.Event()
+        self._change = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        # Items in progress stay "running" in the store and are requeued on the next start.
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.store.close()
+
+    def notify(self):
+        """Wake idle workers after a submission."""
+        self._work.set()
+
+    def _changed(self):
+        change, self._change = self._change, asyncio.Event()
+        change.set()
+
+    async def wait_for_change(self, timeout):
+        """Wait until any job makes progress; returns False on timeout."""
+        try:
+            await asyncio.wait_for(self._change.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _worker(self):
+        while True:
+            if not self.ready():
+                await asyncio.sleep(self.poll_interval)
+                continue
+            item = await asyncio.to_thread(self.store.claim)
+            if item is None:
+                self._work.clear()
+                try:
+                    await asyncio.wait_for(self._work.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(item)
+
+    async def _run(self, item):
+        start = time.perf_counter()
+        result = error = None
+        try:
+            with timed("job_item", profile=False):
+                image_bytes = await asyncio.to_thread(_read_bytes, item["path"])
+                result = await self.process(image_bytes, item["prompt"])
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"[WARNING] Job {item['job_id']} image {item['idx']} failed: {error}")
+        seconds = round(time.perf_counter() - start, 3)
+        job, completed = await asyncio.to_thread(self.store.finish, item, result, error, seconds)
+        self._changed()
+        if completed:
+            print(f"[INFO] Job {job['id']} finished: {job['done']} done, {job['failed']} failed "
+                  f"in {job['finished_at'] - job['created_at']:.1f}s")
+
+
+def _read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def job_events(runner, job_id, request):
+    """
+    Server-sent events for one job: ``progress`` whenever its counts change and
+    a final ``done`` once it has finished or was cancelled.
+    """
+    last = None
+    while True:
+        job = await asyncio.to_thread(runner.store.get, job_id)
+        if job is None:
+            return
+        if job["status"] in FINISHED:
+            yield _sse("done", job)
+            return
+        if job != last:
+            yield _sse("progress", job)
+            last = job
+        if await request.is_disconnected():
+            return
+        if not await runner.wait_for_change(JOBS_KEEPALIVE_SECONDS):
+            yield ": keepalive\n\n"
+
+
+async def job_results(store, job_id):
+    """JSON lines of the finished items of a job, read from the store a page at a time."""
+    after = -1
+    while True:
+        rows = await asyncio.to_thread(store.results, job_id, after)
+        for row in rows:
+            yield json.dumps(row) + "\n"
+        if len(rows) < JOBS_RESULTS_PAGE:
+            return
+        after = rows[-1]["index"]
@@ -0,0 +1,75 @@
+import threading
+import time
+
+STARTING = "starting"
+READY = "ready"
+FAILED = "failed"
+
+
+class ModelLifecycle:
+    """
+    Tracks cold start of the model server: which phase it is in and how long each took.
+
+    ``run`` is meant for a background thread so the server binds its port and
+    answers liveness checks while weights are still loading. ``phase`` wraps each
+    step of the loader so the cold-start breakdown can be logged and served.
+    """
+
+    def __init__(self):
+        self.state = STARTING
+        self.current_phase = None
+        self.phases = {}
+        self.error = None
+        self.started_at = time.perf_counter()
+        self._ready = threading.Event()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def phase(self, name, fn, *args, **kwargs):
+        """
+        Run one startup step and record its duration under ``name``.
+
+        ``current_phase`` is only cleared when the step succeeds, so after a failure
+        the startup log and ``status()`` still name the phase that failed.
+        """
+        self.current_phase = name
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            self.phases[name] = round(time.perf_counter() - start, 3)
+        self.current_phase = None
+        return result
+
+    def run(self, load):
+        """
+        Run the loader, then mark the server ready (or failed).
+
+        Args:
+            load (callable): Performs the startup phases via ``phase``.
+        """
+        try:
+            load()
+        except Exception as e:
+            self.state = FAILED
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"[ERROR] Model startup failed during {self.current_phase or 'startup'}: {self.error}")
+            return
+        self.state = READY
+        self._ready.set()
+        breakdown = " ".join(f"{name}={seconds:.2f}s" for name, seconds in self.phases.items())
+        print(f"[INFO] Model ready: {breakdown} total={self.uptime():.2f}s")
+
+    def uptime(self):
+        return time.perf_counter() - self.started_at
+
+    def status(self):
+        return {
+            "state": self.state,
+            "phase": self.current_phase,
+            "phases": dict(self.phases),
+            "uptime_s": round(self.uptime(), 3),
+            "error": self.error,
+        }
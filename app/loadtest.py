@@ -0,0 +1,177 @@
+"""
+Load generator for the /generate endpoint against a local stub upstream.
+
+Starts a stub inference server that answers after a fixed delay, launches the
+app with UPSTREAM_URL pointing at it (unless --target is given) and fires
+concurrent multipart uploads, then reports latency percentiles and requests/sec.
+
+    cd app && python loadtest.py --requests 400 --concurrency 50 --upstream-latency 0.2
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from PIL import Image
+
+
+def make_stub_upstream(latency):
+    stub = FastAPI()
+
+    @stub.post("/")
+    async def infer(request: Request):
+        await request.body()
+        await asyncio.sleep(latency)
+        return [{"generated_text": "stub pattern: ch 10, sc in each st across"}]
+
+    return stub
+
+
+def make_photo(width, height, quality=92):
+    """Photo-sized JPEG with smooth gradients and sensor-like noise, as a phone would upload."""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 / width, y * 255 / height, (x + y) * 127 / (width + height)], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def start_in_thread(asgi_app, port):
+    config = uvicorn.Config(asgi_app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def wait_until_up(url, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_load(target, total, concurrency, payload, path="/generate"):
+    """
+    Send ``total`` uploads with at most ``concurrency`` in flight.
+
+    Returns:
+        dict: Latency percentiles (ms), requests/sec and status code counts.
+    """
+    latencies = []
+    statuses = {}
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=target, timeout=120.0, limits=limits) as client:
+        async def user():
+            while True:
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                start = time.perf_counter()
+                try:
+                    response = await client.post(
+                        path, files={"file": ("garment.jpg", payload, "image/jpeg")}, data={"prompt": ""}
+                    )
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(total / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "statuses": {str(k): v for k, v in statuses.items()},
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load-test /generate against a stub upstream.")
+    parser.add_argument("--requests", type=int, default=200, help="Total number of requests.")
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent clients.")
+    parser.add_argument("--upstream-latency", type=float, default=0.2, help="Stub inference delay in seconds.")
+    parser.add_argument("--upstream-port", type=int, default=8701)
+    parser.add_argument("--app-port", type=int, default=8700)
+    parser.add_argument("--app", default="main:app", help="ASGI app to launch (module:attribute, run from app/).")
+    parser.add_argument("--target", help="Base URL of an already running app; skips launching one.")
+    parser.add_argument("--image-size", default="4032x3024", help="WIDTHxHEIGHT of the uploaded JPEG.")
+    parser.add_argument("--cache", action="store_true", help="Leave the result cache on (every upload is identical).")
+    parser.add_argument("--json", help="Write the results to this file.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    start_in_thread(make_stub_upstream(args.upstream_latency), args.upstream_port)
+    upstream_url = f"http://127.0.0.1:{args.upstream_port}/"
+
+    process = None
+    target = args.target
+    if target is None:
+        env = dict(os.environ, UPSTREAM_URL=upstream_url)
+        if not args.cache:
+            env["RESULT_CACHE_SIZE"] = "0"
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", args.app, "--port", str(args.app_port), "--log-level", "warning"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        )
+        target = f"http://127.0.0.1:{args.app_port}"
+        wait_until_up(target + "/")
+
+    try:
+        width, height = (int(v) for v in args.image_size.split("x"))
+        payload = make_photo(width, height)
+        print(f"[INFO] Uploading a {width}x{height} JPEG of {len(payload) / 1e6:.1f} MB")
+        results = asyncio.run(run_load(target, args.requests, args.concurrency, payload))
+        results["upstream_latency_s"] = args.upstream_latency
+        print(json.dumps(results, indent=2))
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from common.image_hash import hamming
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "3600"))
+RESULT_CACHE_MAX_DISTANCE = int(os.getenv("RESULT_CACHE_MAX_DISTANCE", "4"))
+
+
+def normalize_prompt(prompt):
+    """Lower-case and collapse whitespace so trivial prompt edits still hit."""
+    return " ".join((prompt or "").lower().split())
+
+
+class PerceptualResultCache:
+    """
+    In-memory LRU/TTL cache of generation results keyed by perceptual image hash.
+
+    A lookup first tries the exact (hash, prompt) key and then, if
+    ``max_distance`` > 0, any entry with the same prompt whose hash is within that
+    Hamming distance, which catches resized or recompressed copies of the same
+    photo. Memory is bounded by entry count and by the total size of stored results.
+
+    Args:
+        max_entries (int): Maximum number of cached results.
+        max_bytes (int): Maximum total size of cached result strings.
+        ttl (float): Seconds a result stays valid.
+        max_distance (int): Largest Hamming distance treated as the same image.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, max_bytes=RESULT_CACHE_MAX_BYTES,
+                 ttl=RESULT_CACHE_TTL, max_distance=RESULT_CACHE_MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._entries = OrderedDict()  # (hash, prompt) -> (result, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _drop(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _find_near(self, image_hash, prompt, now):
+        best_key, best_distance = None, self.max_distance + 1
+        for key, (_, expires_at, _) in self._entries.items():
+            if key[1] != prompt or expires_at < now:
+                continue
+            distance = hamming(key[0], image_hash)
+            if distance < best_distance:
+                best_key, best_distance = key, distance
+        return best_key
+
+    def get(self, image_hash, prompt):
+        """
+        Look up a result for an image hash and (normalized) prompt.
+
+        Returns:
+            The cached result, or None on a miss.
+        """
+        prompt = normalize_prompt(prompt)
+        now = time.monotonic()
+        with self._lock:
+            key = (image_hash, prompt)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < now:
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self.exact_hits += 1
+            elif self.max_distance > 0:
+                key = self._find_near(image_hash, prompt, now)
+                if key is not None:
+                    entry = self._entries[key]
+                    self.near_hits += 1
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, image_hash, prompt, result):
+        """Store a result, evicting least recently used entries beyond the bounds."""
+        size = len(str(result).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        key = (image_hash, normalize_prompt(prompt))
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (result, time.monotonic() + self.ttl, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            hits = self.exact_hits + self.near_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "exact_hits": self.exact_hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,68 @@
+import os
+import time
+
+from common.embeddings import load_embedder
+from common.metrics import timed
+from common.similarity_index import SimilarityIndex
+
+SIMILARITY_INDEX_DIR = os.getenv("SIMILARITY_INDEX_DIR", "../data_collection/processed/embedding_index")
+SIMILAR_TOP_K = int(os.getenv("SIMILAR_TOP_K", "5"))
+SIMILAR_MAX_K = 50
+SIMILAR_NPROBE = int(os.getenv("SIMILAR_NPROBE", "8"))
+
+
+class SimilarPatterns:
+    """
+    Nearest existing patterns for an uploaded photo, from the index built by
+    ``data_collection/preprocesing/build_embeddings.py``.
+
+    ``load`` reads the index and the embedder the index was built with; it is
+    meant for a background thread, and ``ready`` stays False if there is no index.
+    """
+
+    def __init__(self, index_dir=SIMILARITY_INDEX_DIR, nprobe=SIMILAR_NPROBE):
+        self.index_dir = index_dir
+        self.nprobe = nprobe
+        self.index = None
+        self.embedder = None
+        self.error = None
+
+    @property
+    def ready(self):
+        return self.index is not None and self.embedder is not None
+
+    def load(self):
+        start = time.perf_counter()
+        try:
+            index = SimilarityIndex.load(self.index_dir)
+            self.embedder = load_embedder(index.info["backend"], index.info["model"])
+        except FileNotFoundError:
+            self.error = f"No similarity index in {self.index_dir}"
+            print(f"[WARNING] {self.error}; /similar is disabled.")
+            return
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"[ERROR] Failed to load the similarity index: {self.error}")
+            return
+        self.index = index
+        print(f"[INFO] Similarity index ready: {len(index)} patterns, {index.info['backend']} embeddings, "
+              f"{index.nlist} lists, {time.perf_counter() - start:.2f}s")
+
+    def query(self, image, k=SIMILAR_TOP_K):
+        """
+        Return the ``k`` most similar indexed patterns, best first, each with its score.
+        """
+        k = max(1, min(k, SIMILAR_MAX_K))
+        with timed("similar_query"):
+            vector = self.embedder.embed([image])[0]
+            return [
+                dict(self.index.items[row], score=round(min(score, 1.0), 4))
+                for row, score in self.index.search(vector, k, self.nprobe)
+            ]
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "patterns": len(self.index) if self.index is not None else 0,
+            "error": self.error,
+        }
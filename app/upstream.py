@@ -0,0 +1,132 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+import httpx
+
+UPSTREAM_URL = os.getenv(
+    "UPSTREAM_URL", "https://api-inference.huggingface.co/models/Salesforce/blip-image-captioning-base"
+)
+HF_API_TOKEN = os.getenv("HF_API_TOKEN", "")
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "60"))
+UPSTREAM_MAX_IN_FLIGHT = int(os.getenv("UPSTREAM_MAX_IN_FLIGHT", "16"))
+UPSTREAM_MAX_WAITING = int(os.getenv("UPSTREAM_MAX_WAITING", "64"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "10"))
+UPSTREAM_RESERVED_SLOTS = int(os.getenv("UPSTREAM_RESERVED_SLOTS", "2"))
+
+
+class Saturated(Exception):
+    """Raised when no upstream slot can be obtained; the caller should answer 503."""
+
+
+class ConcurrencyGate:
+    """
+    Bounds in-flight upstream calls and the queue of callers waiting for a slot.
+
+    When every slot is busy and ``max_waiting`` callers are already queued, new
+    callers are rejected immediately instead of piling up behind a slow upstream.
+    Callers that do queue give up after ``queue_timeout`` seconds.
+
+    Background work (batch jobs) goes through ``background_slot`` instead and
+    never competes with interactive callers; ``reserved`` slots are kept free
+    for them even while batch jobs are running.
+    """
+
+    def __init__(self, max_in_flight, max_waiting, queue_timeout, reserved=0):
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        self.reserved = max(0, min(reserved, max_in_flight - 1))
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise Saturated("upstream queue is full")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Saturated("timed out waiting for an upstream slot")
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def background_slot(self, poll_interval=0.05):
+        """
+        Take a slot only while no interactive caller is waiting and the reserved
+        slots stay free; waits as long as that takes instead of rejecting.
+        """
+        while self.waiting or self.in_flight >= self.max_in_flight - self.reserved:
+            await asyncio.sleep(poll_interval)
+        await self._semaphore.acquire()
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+
+class UpstreamClient:
+    """
+    Pooled, keep-alive async client for the hosted inference endpoint.
+
+    One instance is created per process in the app lifespan so every request
+    reuses the same connection pool.
+    """
+
+    def __init__(
+        self,
+        url=UPSTREAM_URL,
+        token=HF_API_TOKEN,
+        timeout=UPSTREAM_TIMEOUT,
+        max_in_flight=UPSTREAM_MAX_IN_FLIGHT,
+        max_waiting=UPSTREAM_MAX_WAITING,
+        queue_timeout=UPSTREAM_QUEUE_TIMEOUT,
+        reserved=UPSTREAM_RESERVED_SLOTS,
+    ):
+        self.url = url
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        self.client = httpx.AsyncClient(
+            headers=headers,
+            timeout=httpx.Timeout(timeout, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=max_in_flight,
+                max_keepalive_connections=max_in_flight,
+                keepalive_expiry=30.0,
+            ),
+        )
+        self.gate = ConcurrencyGate(max_in_flight, max_waiting, queue_timeout, reserved)
+
+    async def post_json(self, payload, background=False):
+        """
+        Send a JSON payload upstream once a slot is free.
+
+        Args:
+            payload (dict): JSON body.
+            background (bool): Batch job call; waits behind interactive calls instead of being rejected.
+
+        Raises:
+            Saturated: If the gate rejects an interactive call.
+            httpx.HTTPError: On transport errors and timeouts.
+        """
+        slot = self.gate.background_slot() if background else self.gate.slot()
+        async with slot:
+            return await self.client.post(self.url, json=payload)
+
+    async def aclose(self):
+        await self.client.aclose()
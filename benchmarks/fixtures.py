@@ -0,0 +1,126 @@
+"""
+Deterministic synthetic inputs for the benchmark suite.
+
+Everything is generated from a seed, so two runs with the same arguments
+benchmark byte-identical files. The folder layout mirrors the real pipeline:
+category folders named like the scraper's URL-encoded project types.
+"""
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+CATEGORIES = ("Tops", "Onesies+%26+Rompers", "Sweaters+%26+Cardigans")
+STITCHES = ("ch", "sc", "hdc", "dc", "tr", "sl st", "sc2tog", "dc2tog", "FPdc", "BPdc")
+YARN_WEIGHTS = ("fingering", "sport", "DK", "worsted", "aran", "bulky")
+
+
+def pattern_text(seed, rows=60):
+    """Crochet instructions in the shape the extractor sees: title, materials, numbered rows."""
+    rng = np.random.default_rng(seed)
+    title = f"Pattern {seed} {rng.choice(['Cardigan', 'Top', 'Romper', 'Tunic', 'Vest'])}"
+    lines = [
+        title,
+        f"Skill level: {rng.choice(['Easy', 'Intermediate', 'Experienced'])}",
+        f"Materials: {rng.integers(2, 9)} balls of {rng.choice(YARN_WEIGHTS)} weight yarn, "
+        f"{rng.choice(['4', '4.5', '5', '5.5', '6'])} mm (H-8) hook, stitch markers.",
+        f"Gauge: {rng.integers(12, 20)} sts and {rng.integers(8, 16)} rows = 4 in / 10 cm.",
+        "BACK",
+        f"Ch {rng.integers(40, 90)}.",
+    ]
+    count = int(rng.integers(40, 90))
+    for row in range(1, rows + 1):
+        stitches = rng.choice(STITCHES, size=3)
+        repeat = int(rng.integers(2, 6))
+        lines.append(
+            f"Row {row}: Ch 1, {stitches[0]} in first st, *{stitches[1]} in next {repeat} sts, "
+            f"{stitches[2]} in next st; rep from * across, turn. ({count} sts)"
+        )
+        if row % 12 == 0:
+            lines.append(f"Rows {row + 1}-{row + 4}: Rep Row {row}. Fasten off.")
+    return "\n".join(lines) + "\n"
+
+
+def cover_image(seed, width=1200, height=1600):
+    """Photo-like RGB cover: soft background, a garment-shaped block and sensor noise."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    background = rng.integers(150, 230, 3)
+    pixels = np.empty((height, width, 3), dtype=np.float32)
+    pixels[:] = background
+    pixels += (y / height * 30)[..., None]
+    colour = rng.integers(20, 200, 3)
+    top, bottom = int(height * 0.15), int(height * rng.uniform(0.6, 0.9))
+    half_width = (width * rng.uniform(0.2, 0.35)) * (1 + 0.3 * (y - top) / height)
+    garment = (y > top) & (y < bottom) & (np.abs(x - width / 2) < half_width)
+    stripes = np.sin(y / rng.uniform(4, 12)) * 20
+    pixels[garment] = colour + stripes[garment][:, None]
+    pixels += rng.normal(0, 6, pixels.shape)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def jpeg_bytes(image, quality=90):
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def _category_path(root, index, name):
+    directory = os.path.join(root, CATEGORIES[index % len(CATEGORIES)])
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, name)
+
+
+def make_texts(root, count, seed=0):
+    """Write ``count`` instruction .txt files; returns their paths."""
+    paths = []
+    for i in range(count):
+        path = _category_path(root, i, f"pattern_{i:05d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(pattern_text(seed + i))
+        paths.append(path)
+    return paths
+
+
+def make_images(root, count, seed=0, ext=".png", size=(600, 800)):
+    """Write ``count`` cover images (PNG like the extractor's output, or JPEG); returns their paths."""
+    paths = []
+    for i in range(count):
+        path = _category_path(root, i, f"pattern_{i:05d}{ext}")
+        cover_image(seed + i, *size).save(path)
+        paths.append(path)
+    return paths
+
+
+def make_pdfs(root, count, seed=0, pages=3):
+    """
+    Write ``count`` pattern PDFs: an embedded JPEG cover on page one and the
+    instructions flowing over ``pages`` pages. Needs reportlab.
+
+    Returns:
+        list: Paths of the PDFs.
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    page_width, page_height = letter
+    paths = []
+    for i in range(count):
+        path = _category_path(root, i, f"pattern_{i:05d}.pdf")
+        pdf = canvas.Canvas(path, pagesize=letter)
+        cover = ImageReader(io.BytesIO(jpeg_bytes(cover_image(seed + i))))
+        pdf.drawImage(cover, 72, page_height - 72 - 400, width=300, height=400)
+        lines = pattern_text(seed + i).splitlines()
+        per_page = -(-len(lines) // pages)
+        for page in range(pages):
+            text = pdf.beginText(72, page_height - 500 if page == 0 else page_height - 72)
+            text.setFont("Helvetica", 8)
+            for line in lines[page * per_page:(page + 1) * per_page]:
+                text.textLine(line)
+            pdf.drawText(text)
+            pdf.showPage()
+        pdf.save()
+        paths.append(path)
+    return paths
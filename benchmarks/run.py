@@ -0,0 +1,418 @@
+"""
+Benchmark suite for the data pipeline stages and the serving path.
+
+Runs every case on deterministic synthetic fixtures (see ``fixtures.py``) and
+writes one JSON file per run, so runs on different commits can be compared:
+
+* ``import_*``: cold import time of each stage module.
+* ``pdf_extract_*``: ``pdf_processor.process_pdf`` in single-open and render mode.
+* ``text_structure_*``: ``text_preprocessing`` with the rule-based and spaCy extractors.
+* ``dedup_fingerprint``: MinHash + pHash fingerprinting and duplicate matching.
+* ``image_load``: decoding and downscaling phone-sized photos for the model.
+* ``image_describe``: the concurrent description client against a local stub API.
+* ``serving_generate``: app startup, then /generate under load against a stub
+  upstream (p50/p95/p99 latency, requests/sec).
+
+Every case except serving runs in its own subprocess, so peak RSS and import
+costs are not shared between cases.
+
+    python benchmarks/run.py --scale 50
+    python benchmarks/run.py --cases pdf_extract_single serving_generate --compare benchmarks/results/base.json
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(REPO_ROOT, "app")
+SOURCE_DIRS = [
+    REPO_ROOT,
+    APP_DIR,
+    os.path.join(REPO_ROOT, "data_collection"),
+    os.path.join(REPO_ROOT, "data_collection", "scrapper"),
+    os.path.join(REPO_ROOT, "data_collection", "scrapper", "pdf_process"),
+    os.path.join(REPO_ROOT, "data_collection", "preprocesing"),
+]
+sys.path.extend(SOURCE_DIRS)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+# Case name -> (module, working directory it is normally run from).
+IMPORTS = {
+    "pdf_processor": ("pdf_processor", os.path.join(REPO_ROOT, "data_collection")),
+    "text_preprocessing": ("text_preprocessing", os.path.join(REPO_ROOT, "data_collection")),
+    "image_preprocessing": ("image_preprocessing", os.path.join(REPO_ROOT, "data_collection")),
+    "dedup": ("dedup", os.path.join(REPO_ROOT, "data_collection")),
+    "app_main": ("main", APP_DIR),
+}
+# Metric -> True if higher is better; only these are compared between runs.
+COMPARED_METRICS = {
+    "items_per_sec": True,
+    "requests_per_sec": True,
+    "import_s": False,
+    "startup_s": False,
+    "peak_rss_mb": False,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+}
+
+
+class Skip(Exception):
+    """Raised by a case whose optional dependency is not installed."""
+
+
+def peak_rss_mb(pid=None):
+    """
+    High-water RSS of a process in MiB.
+
+    Read from /proc where available: ru_maxrss survives exec on Linux, so a
+    worker would otherwise report its parent's peak.
+    """
+    try:
+        with open(f"/proc/{pid or os.getpid()}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if pid is not None:
+        return None
+    # ru_maxrss is in KiB on Linux.
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def throughput(items, seconds, **extra):
+    return dict(items=items, seconds=round(seconds, 3),
+                items_per_sec=round(items / seconds, 2) if seconds > 0 else 0.0, **extra)
+
+
+def bench_import(fixture_dir, module, cwd):
+    os.chdir(cwd)
+    start = time.perf_counter()
+    __import__(module)
+    return {"import_s": round(time.perf_counter() - start, 3)}
+
+
+def bench_pdf_extract(fixture_dir, mode):
+    from pdf_processor import process_pdf
+
+    input_root = os.path.join(fixture_dir, "pdfs")
+    pdfs = sorted(glob.glob(os.path.join(input_root, "**", "*.pdf"), recursive=True))
+    output = tempfile.mkdtemp(dir=fixture_dir)
+    failed = 0
+    start = time.perf_counter()
+    for path in pdfs:
+        _, error, _ = process_pdf(path, mode, input_root, os.path.join(output, "text"), os.path.join(output, "image"))
+        failed += bool(error)
+    seconds = time.perf_counter() - start
+    shutil.rmtree(output)
+    return throughput(len(pdfs), seconds, failed=failed)
+
+
+def bench_text_structure(fixture_dir, extractor):
+    from text_preprocessing import get_nlp, read_text, structure_text_instructions
+
+    if extractor == "spacy":
+        try:
+            get_nlp()
+        except (ImportError, OSError) as e:
+            raise Skip(f"spaCy model unavailable: {e}")
+    paths = sorted(glob.glob(os.path.join(fixture_dir, "texts", "**", "*.txt"), recursive=True))
+    texts = [read_text(path) for path in paths]
+    start = time.perf_counter()
+    for text in texts:
+        structure_text_instructions(text, extractor)
+    seconds = time.perf_counter() - start
+    return throughput(len(texts), seconds, kchars_per_sec=round(sum(map(len, texts)) / seconds / 1000, 1))
+
+
+def bench_dedup(fixture_dir):
+    from dedup import collect_patterns, find_duplicates, fingerprint
+
+    patterns = collect_patterns(os.path.join(fixture_dir, "texts"), os.path.join(fixture_dir, "images"))
+    start = time.perf_counter()
+    signatures, image_hashes = {}, {}
+    for pid, (text_path, image_path) in patterns.items():
+        signature, image_hash = fingerprint(text_path, image_path)
+        if signature is not None:
+            signatures[pid] = signature
+        if image_hash is not None:
+            image_hashes[pid] = image_hash
+    fingerprinted = time.perf_counter()
+    find_duplicates(signatures, image_hashes, 0.8, 0.5, 4)
+    seconds = time.perf_counter() - start
+    return throughput(len(patterns), seconds, match_s=round(time.perf_counter() - fingerprinted, 3))
+
+
+def bench_image_load(fixture_dir):
+    from common.image_preprocessing import load_image
+
+    paths = sorted(glob.glob(os.path.join(fixture_dir, "photos", "**", "*.jpg"), recursive=True))
+    start = time.perf_counter()
+    for path in paths:
+        load_image(path)
+    return throughput(len(paths), time.perf_counter() - start)
+
+
+def bench_image_describe(fixture_dir, concurrency=8, latency=0.05):
+    from fastapi import FastAPI, Request
+    from image_preprocessing import process_image_directory_concurrent
+    from loadtest import start_in_thread
+
+    stub = FastAPI()
+
+    @stub.post("/v1/chat/completions")
+    async def complete(request: Request):
+        await request.body()
+        await asyncio.sleep(latency)
+        return {"choices": [{"message": {"content": "Stub description of a crocheted garment."}}]}
+
+    port = free_port()
+    start_in_thread(stub, port)
+    input_root = os.path.join(fixture_dir, "images")
+    output = tempfile.mkdtemp(dir=fixture_dir)
+    start = time.perf_counter()
+    processed = process_image_directory_concurrent(
+        input_root, output, api_key="benchmark", api_base=f"http://127.0.0.1:{port}/v1",
+        concurrency=concurrency, rate=1000.0, use_cache=False, report_every=10 ** 9,
+    )
+    seconds = time.perf_counter() - start
+    shutil.rmtree(output)
+    described = sum(len(paths) for paths in processed.values())
+    return throughput(described, seconds, concurrency=concurrency, stub_latency_s=latency)
+
+
+CASES = {
+    **{f"import_{name}": (bench_import, {"module": module, "cwd": cwd}) for name, (module, cwd) in IMPORTS.items()},
+    "pdf_extract_single": (bench_pdf_extract, {"mode": "single"}),
+    "pdf_extract_render": (bench_pdf_extract, {"mode": "render"}),
+    "text_structure_crochet": (bench_text_structure, {"extractor": "crochet"}),
+    "text_structure_spacy": (bench_text_structure, {"extractor": "spacy"}),
+    "dedup_fingerprint": (bench_dedup, {}),
+    "image_load": (bench_image_load, {}),
+    "image_describe": (bench_image_describe, {}),
+    "serving_generate": (None, {}),
+}
+
+
+def free_port():
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def bench_serving(requests, concurrency, upstream_latency, image_size):
+    """Start main:app against a stub upstream, then load-test /generate."""
+    import httpx
+    from loadtest import make_photo, make_stub_upstream, run_load, start_in_thread
+
+    upstream_port, app_port = free_port(), free_port()
+    start_in_thread(make_stub_upstream(upstream_latency), upstream_port)
+    env = dict(os.environ, UPSTREAM_URL=f"http://127.0.0.1:{upstream_port}/", RESULT_CACHE_SIZE="0")
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+    target = f"http://127.0.0.1:{app_port}"
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"App exited with code {process.returncode} during startup")
+            try:
+                httpx.get(target + "/", timeout=1.0)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.02)
+        startup_s = time.perf_counter() - start
+        width, height = image_size
+        results = asyncio.run(run_load(target, requests, concurrency, make_photo(width, height)))
+        results.update(
+            startup_s=round(startup_s, 3),
+            peak_rss_mb=peak_rss_mb(process.pid),
+            upstream_latency_s=upstream_latency,
+            image_size=f"{width}x{height}",
+        )
+        return results
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def prepare_fixtures(root, scale, seed):
+    """Generate every fixture set the cases read; sizes are multiples of ``scale``."""
+    start = time.perf_counter()
+    counts = {"pdfs": scale, "texts": scale * 4, "images": scale * 2, "photos": max(1, scale // 5)}
+    fixtures.make_pdfs(os.path.join(root, "pdfs"), counts["pdfs"], seed)
+    fixtures.make_texts(os.path.join(root, "texts"), counts["texts"], seed)
+    fixtures.make_images(os.path.join(root, "images"), counts["images"], seed)
+    fixtures.make_images(os.path.join(root, "photos"), counts["photos"], seed, ext=".jpg", size=(4032, 3024))
+    print(f"[INFO] Generated fixtures {counts} in {time.perf_counter() - start:.1f}s")
+    return counts
+
+
+def run_case(name, fixture_dir, verbose=False):
+    """Run one case in a fresh interpreter and return its metrics."""
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as out:
+        out_path = out.name
+    try:
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", name, "--fixtures", fixture_dir,
+             "--out", out_path],
+            cwd=REPO_ROOT, stdout=None if verbose else subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        if result.returncode != 0:
+            return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed"}
+        with open(out_path, encoding="utf-8") as f:
+            return json.load(f)
+    finally:
+        os.remove(out_path)
+
+
+def run_repeated(name, fixture_dir, repeat, verbose=False):
+    """Run a case ``repeat`` times and keep the median of every numeric metric."""
+    runs = [run_case(name, fixture_dir, verbose) for _ in range(repeat)]
+    if any("error" in run or "skipped" in run for run in runs):
+        return runs[0]
+    merged = dict(runs[0])
+    for key, value in merged.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            merged[key] = statistics.median(run[key] for run in runs)
+    if repeat > 1:
+        merged["repeat"] = repeat
+    return merged
+
+
+def run_worker(name, fixture_dir, out_path):
+    function, kwargs = CASES[name]
+    try:
+        metrics = function(fixture_dir, **kwargs)
+        metrics["peak_rss_mb"] = peak_rss_mb()
+    except Skip as e:
+        metrics = {"skipped": str(e)}
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(metrics, f)
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": cpus,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(baseline, current, threshold):
+    """Print the relative change of every compared metric; return the names of regressed ones."""
+    regressions = []
+    print(f"[INFO] Compared with {baseline['environment'].get('commit') or 'baseline'}:")
+    for case, metrics in current["results"].items():
+        before = baseline["results"].get(case, {})
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = before.get(metric), metrics.get(metric)
+            if not isinstance(old, (int, float)) or not isinstance(new, (int, float)) or old == 0:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = "  REGRESSION" if worse > threshold else ""
+            if flag:
+                regressions.append(f"{case}.{metric}")
+            print(f"       {case + '.' + metric:<45}{old:>12}{new:>12}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages and the serving path.")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES), help="Cases to run.")
+    parser.add_argument("--scale", type=int, default=50, help="Fixture PDFs; other fixture sets scale with it.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic fixtures.")
+    parser.add_argument("--fixtures", help="Fixture directory to reuse (generated if empty).")
+    parser.add_argument("--requests", type=int, default=200, help="Requests sent by the serving case.")
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent clients in the serving case.")
+    parser.add_argument("--upstream-latency", type=float, default=0.2, help="Stub inference delay in seconds.")
+    parser.add_argument("--image-size", default="1600x1200", help="WIDTHxHEIGHT of the uploaded JPEG.")
+    parser.add_argument("--output", help="Result file; defaults to benchmarks/results/<timestamp>.json.")
+    parser.add_argument("--compare", help="Earlier result file to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change reported as a regression.")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with 1 if any metric regressed.")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Runs per subprocess case; the median of each metric is reported.")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the benchmarked code.")
+    parser.add_argument("--worker", choices=list(CASES), help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.worker:
+        run_worker(args.worker, args.fixtures, args.out)
+        return
+
+    fixture_dir = os.path.abspath(args.fixtures or tempfile.mkdtemp(prefix="crochet-bench-"))
+    os.makedirs(fixture_dir, exist_ok=True)
+    counts = None
+    if not os.listdir(fixture_dir):
+        counts = prepare_fixtures(fixture_dir, args.scale, args.seed)
+
+    report = {
+        "environment": environment(),
+        "config": {"scale": args.scale, "seed": args.seed, "repeat": args.repeat, "fixtures": counts},
+        "results": {},
+    }
+    try:
+        for name in args.cases:
+            print(f"[INFO] Running {name}...")
+            if name == "serving_generate":
+                width, height = (int(v) for v in args.image_size.split("x"))
+                try:
+                    metrics = bench_serving(args.requests, args.concurrency, args.upstream_latency, (width, height))
+                except Exception as e:
+                    metrics = {"error": f"{type(e).__name__}: {e}"}
+            else:
+                metrics = run_repeated(name, fixture_dir, args.repeat, args.verbose)
+            report["results"][name] = metrics
+            print(f"       {json.dumps(metrics)}")
+    finally:
+        if not args.fixtures:
+            shutil.rmtree(fixture_dir, ignore_errors=True)
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[SUCCESS] Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions and args.fail_on_regression:
+            print(f"[ERROR] {len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
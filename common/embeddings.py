@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+
+# "clip" embeds with a CLIP image tower via transformers; "histogram" is a
+# dependency-free colour descriptor, good enough for near-identical covers and
+# for exercising the index without a model download.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "clip")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "openai/clip-vit-base-patch32")
+# Longest side images are decoded to before embedding; CLIP crops to 224 anyway.
+EMBEDDING_IMAGE_SIDE = int(os.getenv("EMBEDDING_IMAGE_SIDE", "448"))
+
+HISTOGRAM_BINS = 8
+
+
+def normalize_rows(vectors):
+    """L2-normalize each row, so dot products are cosine similarities."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class ClipEmbedder:
+    """
+    Image embeddings from a CLIP vision tower on CPU.
+
+    Args:
+        model_name (str): Hugging Face CLIP checkpoint.
+        num_threads (int): Intra-op threads; 0 leaves torch's default.
+    """
+
+    backend = "clip"
+
+    def __init__(self, model_name=EMBEDDING_MODEL, num_threads=0):
+        import torch
+        from transformers import CLIPImageProcessor, CLIPModel
+
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+        self.model_name = model_name
+        self.processor = CLIPImageProcessor.from_pretrained(model_name)
+        self.model = CLIPModel.from_pretrained(model_name, torch_dtype=torch.float32, low_cpu_mem_usage=True).eval()
+        self.dim = self.model.config.projection_dim
+
+    def embed(self, images):
+        """
+        Embed a batch of RGB images.
+
+        Returns:
+            numpy.ndarray: (len(images), dim) float32 array of unit vectors.
+        """
+        import torch
+
+        inputs = self.processor(images=list(images), return_tensors="pt")
+        with torch.inference_mode():
+            features = self.model.get_image_features(**inputs)
+        return normalize_rows(features.numpy())
+
+
+class HistogramEmbedder:
+    """
+    Joint RGB colour histogram (``HISTOGRAM_BINS`` per channel) under the
+    Hellinger mapping, so cosine similarity compares colour distributions.
+    """
+
+    backend = "histogram"
+
+    def __init__(self, model_name=None, num_threads=0):
+        self.model_name = f"rgb{HISTOGRAM_BINS}"
+        self.dim = HISTOGRAM_BINS ** 3
+
+    def embed(self, images):
+        vectors = np.empty((len(images), self.dim), dtype=np.float32)
+        for i, image in enumerate(images):
+            pixels = np.asarray(image.convert("RGB").resize((64, 64)), dtype=np.uint16)
+            quantized = pixels * HISTOGRAM_BINS // 256
+            codes = (quantized[..., 0] * HISTOGRAM_BINS + quantized[..., 1]) * HISTOGRAM_BINS + quantized[..., 2]
+            counts = np.bincount(codes.ravel(), minlength=self.dim).astype(np.float32)
+            vectors[i] = np.sqrt(counts / counts.sum())
+        return normalize_rows(vectors)
+
+
+EMBEDDERS = {"clip": ClipEmbedder, "histogram": HistogramEmbedder}
+
+
+def load_embedder(backend=EMBEDDING_BACKEND, model_name=EMBEDDING_MODEL, num_threads=0):
+    """
+    Build the embedder for a backend name.
+
+    Raises:
+        ValueError: If the backend is unknown.
+    """
+    if backend not in EMBEDDERS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {sorted(EMBEDDERS)}")
+    return EMBEDDERS[backend](model_name, num_threads=num_threads)
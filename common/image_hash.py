@@ -0,0 +1,44 @@
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+_DCT_SIZE = HASH_SIZE * 4
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def phash(image):
+    """
+    64-bit perceptual hash (pHash) of a PIL image.
+
+    The image is reduced to 32x32 grayscale, transformed with a 2-D DCT and the
+    8x8 lowest frequencies are thresholded against their median. Resizing,
+    recompression and small colour shifts change only a few bits.
+
+    Args:
+        image (PIL.Image.Image): Image to hash.
+
+    Returns:
+        int: Hash as an unsigned 64-bit integer.
+    """
+    small = image.convert("L").resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS)
+    pixels = np.asarray(small, dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    # The DC term only tracks overall brightness; leave it out of the median.
+    median = np.median(low.flatten()[1:])
+    bits = (low > median).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def hamming(a, b):
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")
@@ -0,0 +1,87 @@
+import io
+import os
+
+from PIL import Image, ImageOps
+
+# Longest side fed to the model. Llama 3.2 Vision tiles images into at most
+# 2x2 tiles of 560 px, so anything larger is thrown away by the processor.
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1120"))
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", "85"))
+
+
+def convert_to_rgb(image):
+    """Convert image to RGB format if not already in RGB, flattening transparency onto white."""
+    if image.mode == "RGB":
+        return image
+    image_rgba = image.convert("RGBA")
+    background = Image.new("RGBA", image_rgba.size, (255, 255, 255))
+    alpha_composite = Image.alpha_composite(background, image_rgba)
+    return alpha_composite.convert("RGB")
+
+
+def fit_within(image, max_side=IMAGE_MAX_SIDE):
+    """Downscale so the longest side is at most ``max_side``; smaller images are returned as is."""
+    width, height = image.size
+    scale = max_side / max(width, height)
+    if scale >= 1:
+        return image
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    # Same filter and reducing gap as Image.thumbnail; the model's processor resizes again anyway.
+    return image.resize(size, Image.BICUBIC, reducing_gap=2.0)
+
+
+def normalize_image(image, max_side=IMAGE_MAX_SIDE):
+    """
+    Bring an opened image into the form the model expects.
+
+    Applies the EXIF orientation, flattens to RGB and downscales to ``max_side``.
+    For JPEGs the decoder is asked for a reduced scale first (``draft``), so a
+    12 MP phone photo is never decoded at full resolution.
+
+    Args:
+        image (PIL.Image.Image): Image as returned by ``Image.open`` (not yet loaded).
+        max_side (int): Longest side of the result in pixels.
+
+    Returns:
+        PIL.Image.Image: RGB image.
+    """
+    if max_side:
+        # draft keeps the image at least this large, and the box is square so
+        # it holds for either orientation.
+        image.draft("RGB", (max_side, max_side))
+    image = ImageOps.exif_transpose(image)
+    image = convert_to_rgb(image)
+    if max_side:
+        image = fit_within(image, max_side)
+    return image
+
+
+def load_image(path, max_side=IMAGE_MAX_SIDE):
+    """Open and normalize an image file (see ``normalize_image``)."""
+    with Image.open(path) as image:
+        return normalize_image(image, max_side)
+
+
+def decode_image(data, max_side=IMAGE_MAX_SIDE):
+    """
+    Decode and normalize an encoded image (see ``normalize_image``).
+
+    Args:
+        data (bytes or file object): Encoded image. Passing the upload's file
+            object directly avoids holding a second copy of the raw bytes.
+        max_side (int): Longest side of the result in pixels.
+
+    Raises:
+        PIL.UnidentifiedImageError: If the data is not an image PIL can read.
+    """
+    if isinstance(data, (bytes, bytearray)):
+        data = io.BytesIO(data)
+    with Image.open(data) as image:
+        return normalize_image(image, max_side)
+
+
+def encode_jpeg(image, quality=JPEG_QUALITY):
+    """Re-encode an RGB image as a compact JPEG."""
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
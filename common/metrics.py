@@ -0,0 +1,368 @@
+"""
+Lightweight in-process metrics shared by the data pipeline and the apps.
+
+Three kinds of series, each identified by a name plus keyword labels:
+
+* counters (``inc``): successes, failures, retries, bytes;
+* gauges (``add_gauge``/``set_gauge``): work in flight, queue depths;
+* histograms (``observe``): durations, bucketed so quantiles can be estimated.
+
+``timed(stage)`` wraps a unit of work and records all three at once:
+``stage_seconds``, ``stage_total{outcome=success|failure}`` and
+``stage_in_flight``. The apps serve ``render_prometheus()`` on ``/metrics``;
+batch jobs call ``write_summary(job)`` at the end of a run.
+
+``SamplingProfiler`` is the opt-in profiler (``PROFILE_SAMPLING=1``): a
+background thread that periodically samples the stacks of threads currently
+inside a ``timed`` stage and aggregates them as collapsed stacks, ready for a
+flame graph.
+"""
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+METRICS_DIR = os.getenv("METRICS_DIR", "processed/metrics")
+PROFILE_SAMPLING = os.getenv("PROFILE_SAMPLING", "0") == "1"
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+PROFILE_MAX_DEPTH = 48
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with count, sum and max."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": round(self.quantile(0.50), 6),
+            "p95": round(self.quantile(0.95), 6),
+            "p99": round(self.quantile(0.99), 6),
+            "max": round(self.max, 6),
+        }
+
+
+class Registry:
+    """Thread-safe store of every counter, gauge and histogram in the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._callbacks = {}
+        self._help = {}
+        self.started_at = time.time()
+
+    def describe(self, name, text):
+        """Set the HELP text of a metric."""
+        self._help[name] = text
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def add_gauge(self, name, delta, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def gauge_callback(self, name, fn, **labels):
+        """Register a gauge whose value is read from ``fn()`` at collection time."""
+        with self._lock:
+            self._callbacks[(name, _label_key(labels))] = fn
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def _snapshot(self):
+        """Copy every series; gauge callbacks run outside the lock, since they may take their own."""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            callbacks = dict(self._callbacks)
+            histograms = {key: (h.buckets, list(h.counts), h.count, h.sum, h.summary())
+                          for key, h in self._histograms.items()}
+        for key, fn in callbacks.items():
+            try:
+                gauges[key] = fn()
+            except Exception:
+                continue
+        return counters, gauges, histograms
+
+    def render_prometheus(self):
+        """Text exposition format served on ``/metrics``."""
+        counters, gauges, histograms = self._snapshot()
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, key), value in sorted(counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(key)} {value}")
+        for (name, key), value in sorted(gauges.items()):
+            header(name, "gauge")
+            lines.append(f"{name}{_format_labels(key)} {value}")
+        for (name, key), (buckets, counts, count, total, _) in sorted(histograms.items()):
+            header(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', str(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{name}_count{_format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """All series as a JSON-friendly dict keyed by ``name{labels}``."""
+        counters, gauges, histograms = self._snapshot()
+        return {
+            "uptime_s": round(time.time() - self.started_at, 3),
+            "counters": {name + _format_labels(key): value for (name, key), value in sorted(counters.items())},
+            "gauges": {name + _format_labels(key): value for (name, key), value in sorted(gauges.items())},
+            "histograms": {name + _format_labels(key): h[-1] for (name, key), h in sorted(histograms.items())},
+        }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+            self.started_at = time.time()
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for code running inside ``timed`` stages.
+
+    Every ``interval`` seconds a daemon thread snapshots the stacks of the
+    threads that are inside a stage (via ``sys._current_frames``) and counts
+    each distinct stack, prefixed with the stage name. Threads outside any
+    stage are never walked, so the cost scales with the hot work only; the
+    time spent sampling is tracked and reported as ``overhead``.
+
+    Args:
+        interval (float): Seconds between samples.
+        max_depth (int): Innermost frames kept per stack.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL_MS / 1000, max_depth=PROFILE_MAX_DEPTH):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self.sampling_seconds = 0.0
+        self.active = {}  # thread id -> innermost stage
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._started = time.perf_counter()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _stack(self, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            start = time.perf_counter()
+            active = dict(self.active)
+            if active:
+                frames = sys._current_frames()
+                for thread_id, stage in active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        self.stacks[f"{stage};{self._stack(frame)}"] += 1
+                        self.samples += 1
+                del frames
+            self.sampling_seconds += time.perf_counter() - start
+
+    def overhead(self):
+        """Share of wall time spent sampling (it holds the GIL while it does)."""
+        if self._started is None:
+            return 0.0
+        return self.sampling_seconds / max(time.perf_counter() - self._started, 1e-9)
+
+    def collapsed(self):
+        """Collapsed-stack text (``stage;frame;frame count`` per line) for flame graph tools."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, n=20):
+        """Most sampled innermost frames per stage, with their share of the samples."""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            parts = stack.split(";")
+            leaves[f"{parts[0]} {parts[-1]}"] += count
+        total = sum(leaves.values()) or 1
+        return [{"frame": frame, "samples": count, "share": round(count / total, 4)}
+                for frame, count in leaves.most_common(n)]
+
+
+REGISTRY = Registry()
+PROFILER = SamplingProfiler()
+
+inc = REGISTRY.inc
+set_gauge = REGISTRY.set_gauge
+add_gauge = REGISTRY.add_gauge
+gauge_callback = REGISTRY.gauge_callback
+observe = REGISTRY.observe
+render_prometheus = REGISTRY.render_prometheus
+
+
+def start_profiler_if_enabled():
+    """Start the shared profiler when ``PROFILE_SAMPLING=1``; returns it, or None."""
+    if PROFILE_SAMPLING:
+        return PROFILER.start()
+    return None
+
+
+def record(stage, seconds, outcome="success", metric="stage"):
+    """Record a stage run measured elsewhere, e.g. timings reported back by a worker process."""
+    observe(f"{metric}_seconds", seconds, stage=stage)
+    inc(f"{metric}_total", outcome=outcome, stage=stage)
+
+
+def retry(stage, metric="stage"):
+    inc(f"{metric}_retries_total", stage=stage)
+
+
+@contextmanager
+def timed(stage, metric="stage", profile=True):
+    """
+    Time a unit of work as ``stage``: duration histogram, success/failure
+    counter and in-flight gauge. An exception counts as a failure and is re-raised.
+
+    Pass ``profile=False`` around ``await``s: the event loop thread runs other
+    requests meanwhile, so its samples would be attributed to the wrong stage.
+    """
+    thread_id = threading.get_ident()
+    previous = PROFILER.active.get(thread_id)
+    if profile and PROFILER.running:
+        PROFILER.active[thread_id] = stage
+    add_gauge(f"{metric}_in_flight", 1, stage=stage)
+    outcome = "failure"
+    start = time.perf_counter()
+    try:
+        yield
+        outcome = "success"
+    finally:
+        record(stage, time.perf_counter() - start, outcome, metric)
+        add_gauge(f"{metric}_in_flight", -1, stage=stage)
+        if profile and previous is None:
+            PROFILER.active.pop(thread_id, None)
+        elif profile:
+            PROFILER.active[thread_id] = previous
+
+
+def write_summary(job, directory=METRICS_DIR, **extra):
+    """
+    Write the registry (and profile, if sampling) of a finished batch job.
+
+    Produces ``<directory>/<job>.json`` and, when the profiler ran,
+    ``<directory>/<job>.collapsed`` for flame graph tools.
+
+    Returns:
+        str: Path of the JSON summary.
+    """
+    os.makedirs(directory, exist_ok=True)
+    summary = {"job": job, "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"), **extra, **REGISTRY.summary()}
+    if PROFILER.samples:
+        summary["profile"] = {
+            "samples": PROFILER.samples,
+            "interval_ms": PROFILER.interval * 1000,
+            "overhead": round(PROFILER.overhead(), 5),
+            "top": PROFILER.top(),
+        }
+        with open(os.path.join(directory, f"{job}.collapsed"), "w", encoding="utf-8") as f:
+            f.write(PROFILER.collapsed())
+    path = os.path.join(directory, f"{job}.json")
+    partial = path + ".partial"
+    with open(partial, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(partial, path)
+    print(f"[INFO] Metrics summary written to {path}")
+    return path
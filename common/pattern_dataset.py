@@ -0,0 +1,321 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image
+
+from common.image_preprocessing import IMAGE_MAX_SIDE, load_image
+from common.shard_writer import ShardReader
+
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "cache/image_store")
+# Bump when load_image or the store layout changes, so stores built the old way are not reused.
+PREPROCESSING_VERSION = 3
+# Rewrite the pixel file once more than this fraction of it belongs to superseded images.
+COMPACT_DEAD_FRACTION = 0.25
+
+INSTRUCTION = (
+    "You are a crochet expert AI. Based on the input image, generate complete and original crochet "
+    "pattern instructions to recreate the item. Infer all necessary details such as stitch types, "
+    "materials, construction steps, and techniques. Provide clear, step-by-step guidance, and fill in "
+    "missing information using your crochet knowledge. Your output should be detailed, accurate, and "
+    "easy to follow."
+)
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _decode(image_path, max_side):
+    """Worker: preprocess one image and return its RGB pixels."""
+    image = load_image(image_path, max_side)
+    return np.ascontiguousarray(np.asarray(image.convert("RGB"), dtype=np.uint8))
+
+
+class ImageStore:
+    """
+    Preprocessed training images in one flat, memory-mapped uint8 file.
+
+    Each source image is run through ``load_image`` once and its pixels appended
+    to the pixel file at their real size, with no padding; a JSON index keyed by
+    source path keeps each image's byte offset, height and width, and names the
+    pixel file. A store directory is specific to the transform parameters, so
+    changing ``max_side`` or the preprocessing builds a new one.
+
+    Images are rebuilt only when the source file's size or mtime changes. The new
+    pixels are appended and the old ones become dead bytes; once they pass
+    ``COMPACT_DEAD_FRACTION`` of the file, ``build`` copies the live images into a
+    new pixel file and switches the index over to it.
+
+    Args:
+        root (str): Directory holding one sub-directory per transform setting.
+        max_side (int): Longest image side, as passed to ``load_image``.
+    """
+
+    def __init__(self, root=IMAGE_STORE_DIR, max_side=IMAGE_MAX_SIDE):
+        self.max_side = max_side
+        params = json.dumps({"max_side": max_side, "version": PREPROCESSING_VERSION}, sort_keys=True)
+        key = hashlib.sha1(params.encode("utf-8")).hexdigest()[:12]
+        self.dir = os.path.join(root, f"side{max_side}-{key}")
+        os.makedirs(self.dir, exist_ok=True)
+        self.index_path = os.path.join(self.dir, "index.json")
+        self.data_name = "images.bin"
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            self.data_name, self.index = saved["data"], saved["images"]
+        # Pixel files the index does not name are left over from an interrupted compaction.
+        for name in os.listdir(self.dir):
+            if name.startswith("images") and name.endswith(".bin") and name != self.data_name:
+                os.remove(os.path.join(self.dir, name))
+        self._array = None
+
+    @property
+    def data_path(self):
+        return os.path.join(self.dir, self.data_name)
+
+    @property
+    def array(self):
+        if self._array is None:
+            self._array = np.memmap(self.data_path, dtype=np.uint8, mode="r")
+        return self._array
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self.index
+
+    def _needs_build(self, path):
+        entry = self.index.get(path)
+        if entry is None:
+            return True
+        try:
+            return [entry["size"], entry["mtime_ns"]] != list(_file_signature(path))
+        except OSError:
+            return False
+
+    def _save_index(self):
+        partial = self.index_path + ".partial"
+        with open(partial, "w", encoding="utf-8") as f:
+            json.dump({"data": self.data_name, "images": self.index}, f)
+        os.replace(partial, self.index_path)
+
+    def _compact(self):
+        """Copy the live images into a fresh pixel file if too much of the current one is dead."""
+        total = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        live = sum(entry["height"] * entry["width"] * 3 for entry in self.index.values())
+        if total - live <= total * COMPACT_DEAD_FRACTION:
+            return
+        old_path = self.data_path
+        new_name = f"images-{time.time_ns()}.bin"
+        old = np.memmap(old_path, dtype=np.uint8, mode="r")
+        index = {}
+        with open(os.path.join(self.dir, new_name), "wb") as data:
+            for path, entry in sorted(self.index.items(), key=lambda item: item[1]["offset"]):
+                length = entry["height"] * entry["width"] * 3
+                index[path] = dict(entry, offset=data.tell())
+                data.write(old[entry["offset"]:entry["offset"] + length].tobytes())
+        del old
+        # The index switch is the commit point; the old file is only removed after it.
+        self.data_name, self.index, self._array = new_name, index, None
+        self._save_index()
+        os.remove(old_path)
+        print(f"[INFO] Compacted image store: {total / 1e6:.1f} MB -> {live / 1e6:.1f} MB")
+
+    def build(self, paths, workers=None):
+        """
+        Preprocess every image in ``paths`` that is missing or changed, in parallel.
+
+        Args:
+            paths (iterable): Source image paths.
+            workers (int): Worker processes; None uses one per CPU.
+
+        Returns:
+            int: Number of images (re)built.
+        """
+        todo = []
+        for path in dict.fromkeys(os.path.abspath(p) for p in paths):
+            if not os.path.exists(path):
+                print(f"[WARNING] Image not found: {path}")
+            elif self._needs_build(path):
+                todo.append(path)
+        if not todo:
+            print(f"[INFO] Image store up to date: {len(self.index)} images in {self.dir}")
+            return 0
+
+        self._array = None
+        start = time.perf_counter()
+        built = 0
+        # Workers only decode; the pixels are appended here, in completion order.
+        with ProcessPoolExecutor(max_workers=workers) as executor, open(self.data_path, "ab") as data:
+            futures = {executor.submit(_decode, path, self.max_side): path for path in todo}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    pixels = future.result()
+                except Exception as e:
+                    print(f"[ERROR] Failed to preprocess {path}: {e}")
+                    self.index.pop(path, None)
+                    continue
+                offset = data.tell()
+                data.write(pixels.tobytes())
+                height, width = pixels.shape[:2]
+                size, mtime_ns = _file_signature(path)
+                self.index[path] = {
+                    "offset": offset, "height": height, "width": width, "size": size, "mtime_ns": mtime_ns,
+                }
+                built += 1
+        self._save_index()
+
+        elapsed = time.perf_counter() - start
+        print(f"[SUCCESS] Preprocessed {built} images in {elapsed:.1f}s ({built / elapsed:.1f} images/sec)")
+        self._compact()
+        return built
+
+    def get(self, path):
+        """
+        Return the preprocessed image for a source path.
+
+        Raises:
+            KeyError: If the image is not in the store.
+        """
+        entry = self.index[os.path.abspath(path)]
+        height, width = entry["height"], entry["width"]
+        pixels = self.array[entry["offset"]:entry["offset"] + height * width * 3]
+        return Image.fromarray(pixels.reshape(height, width, 3))
+
+
+def shard_entry(record, image_root):
+    """
+    Turn a structured-instructions shard record into a dataset entry.
+
+    The cover is the extractor's PNG next to the text's relative path; the
+    pattern text is the title followed by the structured steps.
+    """
+    steps = "\n".join(record.get("steps", []))
+    title = record.get("title", "")
+    if title and not steps.startswith(title):
+        steps = f"{title}\n{steps}"
+    source = record["source"]
+    return {
+        "source": source,
+        "image": os.path.splitext(source)[0] + ".png",
+        "image_path": os.path.join(image_root, os.path.splitext(source)[0] + ".png"),
+        "cleaned_pattern": steps,
+    }
+
+
+def format_sample(image, pattern_text, instruction=INSTRUCTION):
+    """Build one chat-formatted fine-tuning sample (user: instruction + image, assistant: pattern)."""
+    return {
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": instruction},
+                    {"type": "image", "image": image},
+                ],
+            },
+            {
+                "role": "assistant",
+                "content": [{"type": "text", "text": pattern_text}],
+            },
+        ],
+    }
+
+
+class PatternDataset:
+    """
+    Fine-tuning samples that read their image from an ``ImageStore`` on access.
+
+    Indexing returns a sample dict as ``format_sample`` builds it; slicing,
+    ``shuffle`` and ``split`` return new datasets over the same entries, so
+    reordering never touches image data.
+
+    Args:
+        entries (list): Records with an ``image`` path and ``cleaned_pattern`` text.
+        image_root (str): Directory the images live in; only the basename of ``image`` is used.
+        store (ImageStore): Preprocessed image store.
+        indices (list): Positions of ``entries`` in this view; None means all of them.
+    """
+
+    def __init__(self, entries, image_root, store, indices=None, instruction=INSTRUCTION):
+        self._entries = entries
+        self.image_root = image_root
+        self.store = store
+        self.indices = list(range(len(entries))) if indices is None else list(indices)
+        self.instruction = instruction
+
+    @classmethod
+    def from_json(cls, json_path, image_root, store=None, workers=None, instruction=INSTRUCTION):
+        """
+        Load pattern records, build the image store for them and drop records without an image.
+        """
+        with open(json_path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        return cls._build(entries, image_root, store, workers, instruction)
+
+    @classmethod
+    def from_shards(cls, shard_dir, image_root, store=None, workers=None, instruction=INSTRUCTION):
+        """
+        Load pattern records from the shards written by ``text_preprocessing.py
+        --output-format jsonl|parquet``, one sequential pass per shard, and build
+        the image store for their covers (``image_root`` is the extractor's image folder).
+        """
+        reader = ShardReader(shard_dir)
+        try:
+            entries = [shard_entry(record, image_root) for record in reader]
+        finally:
+            reader.close()
+        return cls._build(entries, image_root, store, workers, instruction)
+
+    @classmethod
+    def _build(cls, entries, image_root, store, workers, instruction):
+        store = store or ImageStore()
+        dataset = cls(entries, image_root, store, instruction=instruction)
+        store.build((dataset.image_path(entry) for entry in entries), workers=workers)
+        keep = [i for i, entry in enumerate(entries) if dataset.image_path(entry) in store]
+        if len(keep) < len(entries):
+            print(f"[WARNING] Skipping {len(entries) - len(keep)} records without a usable image")
+        return dataset._view(keep)
+
+    def _view(self, indices):
+        return PatternDataset(self._entries, self.image_root, self.store, indices, self.instruction)
+
+    def image_path(self, entry):
+        # Shard entries keep their category folder; the JSON export only has a file name.
+        if "image_path" in entry:
+            return entry["image_path"]
+        return os.path.join(self.image_root, os.path.basename(entry["image"]))
+
+    @property
+    def entries(self):
+        """Source records in this view's order."""
+        return [self._entries[i] for i in self.indices]
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._view(self.indices[index])
+        entry = self._entries[self.indices[index]]
+        image = self.store.get(self.image_path(entry))
+        return format_sample(image, entry["cleaned_pattern"], self.instruction)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def shuffle(self, seed=None):
+        indices = list(self.indices)
+        np.random.default_rng(seed).shuffle(indices)
+        return self._view(indices)
+
+    def split(self, ratio):
+        """Split into (first ``ratio`` of the samples, the rest)."""
+        split_index = int(len(self) * ratio)
+        return self[:split_index], self[split_index:]
@@ -0,0 +1,194 @@
+import json
+import mmap
+import os
+from typing import Dict, Iterator, List, Optional
+
+INDEX_FILE = "index.json"
+FORMATS = ("jsonl", "parquet")
+
+
+class ShardWriter:
+    """
+    Stream records into size-bounded JSONL or Parquet shards with an offset index.
+
+    Records are appended to the current shard until it reaches ``max_shard_bytes``
+    (or ``max_records``), then the shard is finalized and renamed into place. On
+    close an ``index.json`` maps every record key to its shard and byte offset
+    (JSONL) or row number (Parquet), so ``ShardReader`` can fetch a single record
+    without scanning.
+
+    Args:
+        output_dir: Directory for the shards and the index.
+        prefix: File name prefix of every shard.
+        fmt: "jsonl" or "parquet" (needs pyarrow).
+        max_shard_bytes: Approximate upper bound on the size of one shard.
+        max_records: Optional upper bound on records per shard.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        prefix: str = "part",
+        fmt: str = "jsonl",
+        max_shard_bytes: int = 64 * 1024 * 1024,
+        max_records: Optional[int] = None
+    ):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown shard format {fmt!r}, expected one of {FORMATS}")
+        if fmt == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError as e:
+                raise ImportError("Parquet shards need pyarrow: pip install pyarrow") from e
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.fmt = fmt
+        self.max_shard_bytes = max_shard_bytes
+        self.max_records = max_records
+
+        self.shards: List[str] = []
+        self.records: List[list] = []
+        self._file = None
+        self._rows: List[str] = []
+        self._shard_bytes = 0
+        self._shard_records = 0
+
+    def _shard_name(self) -> str:
+        return f"{self.prefix}-{len(self.shards):05d}.{self.fmt}"
+
+    def _open_shard(self) -> None:
+        self.shards.append(self._shard_name())
+        self._shard_bytes = 0
+        self._shard_records = 0
+        if self.fmt == "jsonl":
+            self._file = open(self._partial_path(), "wb")
+
+    def _partial_path(self) -> str:
+        return os.path.join(self.output_dir, self.shards[-1] + ".partial")
+
+    def _close_shard(self) -> None:
+        if not self.shards or (self._file is None and not self._rows):
+            return
+        final_path = os.path.join(self.output_dir, self.shards[-1])
+        if self.fmt == "jsonl":
+            self._file.close()
+            self._file = None
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.table({"json": self._rows})
+            pq.write_table(table, self._partial_path(), row_group_size=256)
+            self._rows = []
+        os.replace(self._partial_path(), final_path)
+
+    def write(self, key: str, record: Dict) -> None:
+        """
+        Append one record.
+
+        Args:
+            key: Unique identifier used for random access (e.g. the source path).
+            record: JSON-serializable record.
+        """
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        data = line.encode("utf-8") + b"\n"
+
+        full = self._shard_bytes >= self.max_shard_bytes or (
+            self.max_records is not None and self._shard_records >= self.max_records
+        )
+        if not self.shards or full:
+            self._close_shard()
+            self._open_shard()
+
+        shard_id = len(self.shards) - 1
+        if self.fmt == "jsonl":
+            self.records.append([key, shard_id, self._shard_bytes, len(data)])
+            self._file.write(data)
+        else:
+            self.records.append([key, shard_id, self._shard_records, len(data)])
+            self._rows.append(line)
+        self._shard_bytes += len(data)
+        self._shard_records += 1
+
+    def close(self) -> None:
+        """Finalize the last shard and write the index atomically."""
+        self._close_shard()
+        index = {"format": self.fmt, "shards": self.shards, "records": self.records}
+        index_path = os.path.join(self.output_dir, INDEX_FILE)
+        with open(index_path + ".partial", "w", encoding="utf-8") as f:
+            json.dump(index, f, separators=(",", ":"))
+        os.replace(index_path + ".partial", index_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardReader:
+    """
+    Random-access and sequential reader for a directory written by ``ShardWriter``.
+
+    JSONL shards are memory-mapped and individual records are sliced out by
+    offset; Parquet shards are opened memory-mapped through pyarrow.
+
+    Args:
+        output_dir: Directory containing the shards and ``index.json``.
+    """
+
+    def __init__(self, output_dir: str):
+        with open(os.path.join(output_dir, INDEX_FILE), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        self.output_dir = output_dir
+        self.fmt = index["format"]
+        self.shards = index["shards"]
+        self.records = index["records"]
+        self._positions = {key: i for i, (key, *_) in enumerate(self.records)}
+        self._maps: Dict[int, object] = {}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def keys(self) -> List[str]:
+        return [record[0] for record in self.records]
+
+    def _shard(self, shard_id: int):
+        if shard_id not in self._maps:
+            path = os.path.join(self.output_dir, self.shards[shard_id])
+            if self.fmt == "jsonl":
+                with open(path, "rb") as f:
+                    self._maps[shard_id] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                import pyarrow.parquet as pq
+                self._maps[shard_id] = pq.read_table(path, memory_map=True).column("json")
+        return self._maps[shard_id]
+
+    def __getitem__(self, i: int) -> Dict:
+        _, shard_id, position, length = self.records[i]
+        shard = self._shard(shard_id)
+        if self.fmt == "jsonl":
+            return json.loads(shard[position:position + length])
+        return json.loads(shard[position].as_py())
+
+    def get(self, key: str) -> Dict:
+        """Fetch a record by the key it was written with."""
+        return self[self._positions[key]]
+
+    def __iter__(self) -> Iterator[Dict]:
+        """Read every record with one sequential pass per shard."""
+        for shard_id, name in enumerate(self.shards):
+            path = os.path.join(self.output_dir, name)
+            if self.fmt == "jsonl":
+                with open(path, "rb") as f:
+                    for line in f:
+                        yield json.loads(line)
+            else:
+                for value in self._shard(shard_id):
+                    yield json.loads(value.as_py())
+
+    def close(self) -> None:
+        for shard in self._maps.values():
+            if isinstance(shard, mmap.mmap):
+                shard.close()
+        self._maps = {}
@@ -0,0 +1,183 @@
+import json
+import os
+
+import numpy as np
+
+from common.embeddings import normalize_rows
+
+# Below this many vectors an exact scan is already sub-millisecond; no clustering.
+IVF_MIN_ITEMS = 10000
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+# Indexes whose float32 vectors fit in this budget are upcast in memory once;
+# larger ones stay memory-mapped as float16 and only probed lists are upcast.
+IN_MEMORY_MAX_BYTES = int(os.getenv("SIMILARITY_IN_MEMORY_MAX_BYTES", str(512 * 1024 * 1024)))
+SCAN_CHUNK = 8192
+
+
+def _assign(vectors, centroids):
+    """Index of the most similar centroid for every row, in chunks to bound memory."""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), SCAN_CHUNK):
+        chunk = np.asarray(vectors[start:start + SCAN_CHUNK], dtype=np.float32)
+        labels[start:start + SCAN_CHUNK] = (chunk @ centroids.T).argmax(axis=1)
+    return labels
+
+
+def spherical_kmeans(vectors, nlist, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    Cluster unit vectors by cosine similarity, training on a sample of the rows.
+
+    Returns:
+        numpy.ndarray: (nlist, dim) float32 unit centroids.
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * KMEANS_SAMPLE_PER_LIST)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        filled = np.bincount(labels, minlength=nlist) > 0
+        # Empty lists keep their previous centroid.
+        centroids[filled] = normalize_rows(sums[filled])
+    return centroids
+
+
+class SimilarityIndex:
+    """
+    Cosine-similarity index over unit embeddings stored as float16.
+
+    Small corpora are searched exactly with one matrix-vector product. From
+    ``IVF_MIN_ITEMS`` vectors on, an inverted-file index is built: vectors are
+    clustered with spherical k-means and stored grouped by cluster, so a query
+    only scores the ``nprobe`` lists whose centroids are closest to it.
+
+    On disk (one directory): ``vectors.npy`` (float16, grouped by list),
+    ``centroids.npy`` and ``offsets.npy`` (IVF only), ``items.json`` (one
+    record per row, in row order) and ``info.json`` (embedder and sizes).
+
+    Args:
+        vectors (numpy.ndarray): (n, dim) unit vectors, float16 or float32.
+        items (list): Metadata record for each row.
+        centroids (numpy.ndarray): (nlist, dim) centroids, or None for exact search.
+        offsets (numpy.ndarray): Start row of each list plus the end, or None.
+        info (dict): Free-form description stored with the index.
+    """
+
+    def __init__(self, vectors, items, centroids=None, offsets=None, info=None):
+        if len(vectors) != len(items):
+            raise ValueError(f"{len(vectors)} vectors but {len(items)} items")
+        self.vectors = vectors
+        self.items = items
+        self.centroids = centroids
+        self.offsets = offsets
+        self.info = dict(info or {})
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def nlist(self):
+        return 0 if self.centroids is None else len(self.centroids)
+
+    @classmethod
+    def build(cls, vectors, items, nlist=None, info=None, seed=0):
+        """
+        Build an index from embeddings.
+
+        Args:
+            vectors (numpy.ndarray): (n, dim) embeddings; normalized here.
+            items (list): Metadata record for each row.
+            nlist (int): Number of IVF lists; None picks ~sqrt(n) above
+                ``IVF_MIN_ITEMS`` and exact search below, 0 forces exact search.
+        """
+        vectors = normalize_rows(vectors)
+        if nlist is None:
+            nlist = int(np.sqrt(len(vectors))) if len(vectors) >= IVF_MIN_ITEMS else 0
+        nlist = min(nlist, len(vectors))
+        centroids = offsets = None
+        if nlist > 1:
+            centroids = spherical_kmeans(vectors, nlist, seed=seed)
+            labels = _assign(vectors, centroids)
+            order = np.argsort(labels, kind="stable")
+            vectors = vectors[order]
+            items = [items[i] for i in order]
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=nlist))]).astype(np.int64)
+        info = dict(info or {}, count=len(items), dim=int(vectors.shape[1]) if len(vectors) else 0, nlist=nlist)
+        return cls(vectors.astype(np.float16), items, centroids, offsets, info)
+
+    def save(self, path):
+        """Write the index files into ``path``; each file is replaced atomically."""
+        os.makedirs(path, exist_ok=True)
+        arrays = {"vectors": self.vectors}
+        if self.centroids is not None:
+            arrays.update(centroids=self.centroids.astype(np.float32), offsets=self.offsets)
+        for name, array in arrays.items():
+            partial = os.path.join(path, f"{name}.partial.npy")
+            np.save(partial, array)
+            os.replace(partial, os.path.join(path, f"{name}.npy"))
+        for name in ("centroids", "offsets"):
+            if self.centroids is None and os.path.exists(os.path.join(path, f"{name}.npy")):
+                os.remove(os.path.join(path, f"{name}.npy"))
+        for name, data in (("items", self.items), ("info", self.info)):
+            partial = os.path.join(path, f"{name}.json.partial")
+            with open(partial, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(partial, os.path.join(path, f"{name}.json"))
+
+    @classmethod
+    def load(cls, path, in_memory_max_bytes=IN_MEMORY_MAX_BYTES):
+        """
+        Open an index written by ``save``.
+
+        Raises:
+            FileNotFoundError: If ``path`` holds no index.
+        """
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        if vectors.size * 4 <= in_memory_max_bytes:
+            vectors = np.asarray(vectors, dtype=np.float32)
+        with open(os.path.join(path, "items.json"), "r", encoding="utf-8") as f:
+            items = json.load(f)
+        with open(os.path.join(path, "info.json"), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        centroids = offsets = None
+        if os.path.exists(os.path.join(path, "centroids.npy")):
+            centroids = np.load(os.path.join(path, "centroids.npy"))
+            offsets = np.load(os.path.join(path, "offsets.npy"))
+        return cls(vectors, items, centroids, offsets, info)
+
+    def _ranges(self, query, nprobe):
+        if self.centroids is None:
+            return [(0, len(self.items))]
+        lists = np.argsort(-(self.centroids @ query))[:nprobe]
+        return [(self.offsets[i], self.offsets[i + 1]) for i in lists]
+
+    def search(self, query, k=5, nprobe=8):
+        """
+        Find the rows most similar to a query embedding.
+
+        Args:
+            query (numpy.ndarray): (dim,) embedding; normalized here.
+            k (int): Number of results.
+            nprobe (int): IVF lists scanned; more is slower but closer to exact.
+
+        Returns:
+            list: (row, cosine similarity) pairs, best first.
+        """
+        query = normalize_rows(query)
+        rows, scores = [], []
+        for start, end in self._ranges(query, nprobe):
+            for chunk_start in range(start, end, SCAN_CHUNK):
+                chunk_end = min(chunk_start + SCAN_CHUNK, end)
+                chunk = np.asarray(self.vectors[chunk_start:chunk_end], dtype=np.float32)
+                rows.append(np.arange(chunk_start, chunk_end))
+                scores.append(chunk @ query)
+        if not rows:
+            return []
+        rows, scores = np.concatenate(rows), np.concatenate(scores)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top]
@@ -0,0 +1,491 @@
+"""
+Incremental runner for the whole data collection pipeline.
+
+    scrape -> extract -> dedup -> structure
+                               -> describe
+
+Every pattern (one PDF) is an item. For each stage and item the runner stores a
+content hash of the stage inputs (source bytes, stage settings and code version)
+in a SQLite state file; an item is only recomputed when that hash changed, its
+last run did not finish, or its output is gone. Because downstream stages hash
+the *content* of upstream outputs, re-extracting a PDF that yields the same text
+does not restructure it, and a new cover only re-describes that pattern.
+
+Dedup is the one global step: it needs every extracted pattern before it can
+pick canonical ids. After it, structuring (CPU, process pool) and description
+(network, thread pool) are independent and run side by side.
+
+Run from ``data_collection/``:
+
+    python pipeline.py --extractor crochet
+    python pipeline.py --stages scrape extract dedup structure describe
+"""
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+import subprocess
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+PIPELINE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRAPPER_DIR = os.path.join(PIPELINE_DIR, "scrapper")
+sys.path.append(SCRAPPER_DIR)
+sys.path.append(os.path.join(SCRAPPER_DIR, "pdf_process"))
+sys.path.append(os.path.join(PIPELINE_DIR, "preprocesing"))
+
+from manifest import file_sha256, STATUS_DONE, STATUS_EMPTY, STATUS_FAILED, STATUS_DUPLICATE
+from pdf_processor import output_paths, process_pdf, remove_stale_partials
+from dedup import DEDUP_MAP_PATH, build_canonical_map, collect_patterns, is_duplicate, load_canonical_map, pattern_id
+from text_preprocessing import EXTRACTORS, structure_text_instructions
+from image_preprocessing import (
+    MODEL_NAME, OPENAI_API_BASE, OPENAI_API_KEY, _collect_image_tasks, category_prompt, request_image_description
+)
+from rate_limiter import AdaptiveTokenBucket
+from description_cache import get_default_cache
+
+sys.path.append(os.path.dirname(PIPELINE_DIR))
+from common import metrics
+
+STAGES = ("scrape", "extract", "dedup", "structure", "describe")
+DEFAULT_STAGES = STAGES[1:]
+STATE_PATH = "processed/pipeline_state.sqlite"
+
+# Bump a stage's version when its code changes output, so every item is redone.
+STAGE_VERSIONS = {"extract": 1, "dedup": 1, "structure": 1, "describe": 1}
+
+STATUS_SKIPPED = "skipped"
+FINISHED_STATUSES = (STATUS_DONE, STATUS_EMPTY)
+SUMMARY_STATUSES = (STATUS_DONE, STATUS_SKIPPED, STATUS_DUPLICATE, STATUS_EMPTY, STATUS_FAILED)
+
+
+def hash_inputs(*parts):
+    """Stable hash of a stage's inputs (content hashes, settings, version)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class PipelineState:
+    """
+    SQLite record of the input hash and outcome of every (stage, item).
+
+    Also caches file content hashes by size and mtime, so unchanged files are
+    only stat-ed on later runs. Only the parent process writes to it.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            " stage TEXT NOT NULL,"
+            " item TEXT NOT NULL,"
+            " input_hash TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " error TEXT,"
+            " seconds REAL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (stage, item))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " sha256 TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+    def file_hash(self, path):
+        """Content hash of a file, recomputed only when its size or mtime moved."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = self.conn.execute("SELECT size, mtime_ns, sha256 FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[:2] == (stat.st_size, stat.st_mtime_ns):
+            return row[2]
+        sha256 = file_sha256(path)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+            (path, stat.st_size, stat.st_mtime_ns, sha256)
+        )
+        return sha256
+
+    def is_current(self, stage, item, input_hash, outputs=()):
+        """
+        True if the item already finished this stage for the same inputs.
+
+        Args:
+            outputs (iterable): Files the stage writes; a done item with none of
+                them left on disk is redone.
+        """
+        row = self.conn.execute(
+            "SELECT input_hash, status FROM items WHERE stage = ? AND item = ?", (stage, item)
+        ).fetchone()
+        if row is None or row[0] != input_hash or row[1] not in FINISHED_STATUSES:
+            return False
+        return row[1] == STATUS_EMPTY or any(os.path.exists(path) for path in outputs)
+
+    def record(self, stage, item, input_hash, status, error=None, seconds=None):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO items (stage, item, input_hash, status, error, seconds, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (stage, item, input_hash, status, error, seconds, time.time())
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+class StageStats:
+    """Per-stage item counts, failures and wall time for the final summary."""
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = Counter()
+        self.failures = []
+        self.started = None
+        self.finished = None
+
+    def start(self):
+        if self.started is None:
+            self.started = time.perf_counter()
+
+    def add(self, status, item=None, error=None, seconds=None):
+        self.counts[status] += 1
+        if status == STATUS_FAILED:
+            self.failures.append((item, error))
+        self.finished = time.perf_counter()
+        metrics.inc("pipeline_items_total", stage=self.name, status=status)
+        if seconds is not None:
+            metrics.observe("pipeline_item_seconds", seconds, stage=self.name)
+
+    @property
+    def wall(self):
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+    @property
+    def processed(self):
+        return self.counts[STATUS_DONE] + self.counts[STATUS_EMPTY] + self.counts[STATUS_FAILED]
+
+
+def print_summary(stats):
+    """Print item counts, wall time and throughput per stage, then the failures."""
+    print("[INFO] Pipeline summary:")
+    header = "".join(f"{status:>10}" for status in SUMMARY_STATUSES)
+    print(f"       {'stage':<11}{header}{'wall s':>9}{'items/s':>9}")
+    for stage in stats.values():
+        counts = "".join(f"{stage.counts[status]:>10}" for status in SUMMARY_STATUSES)
+        throughput = stage.processed / stage.wall if stage.wall > 0 else 0.0
+        print(f"       {stage.name:<11}{counts}{stage.wall:>9.1f}{throughput:>9.2f}")
+    for stage in stats.values():
+        if stage.failures:
+            print(f"[ERROR] {stage.name}: {len(stage.failures)} failed item(s)")
+            for item, error in stage.failures[:10]:
+                print(f"        {item}: {error}")
+
+
+def list_pdfs(input_root):
+    """Map pattern id -> PDF path for every PDF under the input root."""
+    pdfs = glob.glob(os.path.join(input_root, "**", "*.pdf"), recursive=True)
+    return {pattern_id(path, input_root): path for path in sorted(pdfs)}
+
+
+def scrape_stage(input_root, crawler, pages, stats):
+    """Run the scraper with downloads pointed at the pipeline's input folder."""
+    stats.start()
+    before = len(list_pdfs(input_root))
+    env = dict(os.environ, PDF_DOWNLOAD_DIR=os.path.join(os.path.abspath(input_root), "{project_type}"))
+    result = subprocess.run(
+        [sys.executable, "main.py", "--crawler", crawler, "--pages", str(pages)], cwd=SCRAPPER_DIR, env=env
+    )
+    new = len(list_pdfs(input_root)) - before
+    stats.counts[STATUS_DONE] += max(new, 0)
+    if result.returncode != 0:
+        stats.add(STATUS_FAILED, "scraper", f"exit code {result.returncode}")
+    stats.finished = time.perf_counter()
+
+
+def exact_pairs(state, pdfs):
+    """(duplicate id, original id) for byte-identical PDFs, plus each PDF's content hash."""
+    originals, pairs, hashes = {}, [], {}
+    for pid, path in pdfs.items():
+        hashes[pid] = state.file_hash(path)
+        original = originals.setdefault(hashes[pid], pid)
+        if original != pid:
+            pairs.append((pid, original))
+    return pairs, hashes
+
+
+def extract_stage(pool, state, pdfs, roots, mode, force, stats):
+    """Extract text and cover of every new or changed PDF; identical copies are extracted once."""
+    input_root, text_root, image_root = roots
+    pairs, hashes = exact_pairs(state, pdfs)
+    duplicates = dict(pairs)
+
+    futures = {}
+    stats.start()
+    for pid, path in pdfs.items():
+        input_hash = hash_inputs("extract", STAGE_VERSIONS["extract"], hashes[pid], mode)
+        if pid in duplicates:
+            state.record("extract", pid, input_hash, STATUS_DUPLICATE, f"identical to {duplicates[pid]}")
+            stats.add(STATUS_DUPLICATE)
+            continue
+        if not force and state.is_current("extract", pid, input_hash, output_paths(path, *roots)):
+            stats.add(STATUS_SKIPPED)
+            continue
+        future = pool.submit(process_pdf, path, mode, input_root, text_root, image_root)
+        futures[future] = (pid, input_hash, time.perf_counter())
+
+    print(f"[INFO] extract: {len(futures)} of {len(pdfs)} PDFs to process")
+    for future in as_completed(futures):
+        pid, input_hash, submitted = futures[future]
+        try:
+            statuses, error, timings = future.result()
+        except Exception as e:
+            statuses, error, timings = {}, str(e), {}
+        for name, (wall, _) in timings.items():
+            metrics.record(name, wall, metric="pdf_stage")
+        if error:
+            status = STATUS_FAILED
+        elif all(value == STATUS_EMPTY for value in statuses.values()):
+            status = STATUS_EMPTY
+        else:
+            status = STATUS_DONE
+        seconds = time.perf_counter() - submitted
+        state.record("extract", pid, input_hash, status, error, seconds)
+        stats.add(status, pid, error, seconds)
+    return pairs
+
+
+def dedup_stage(state, text_root, image_root, output, exact, workers, force, stats):
+    """Rebuild the canonical-id map when any extracted text or cover changed."""
+    stats.start()
+    patterns = collect_patterns(text_root, image_root)
+    contents = []
+    for pid in sorted(patterns):
+        text_path, image_path = patterns[pid]
+        contents.append((
+            pid,
+            state.file_hash(text_path) if text_path else "",
+            state.file_hash(image_path) if image_path else "",
+        ))
+    input_hash = hash_inputs("dedup", STAGE_VERSIONS["dedup"], json.dumps(contents), json.dumps(sorted(exact)))
+
+    if not force and state.is_current("dedup", "*", input_hash, (output,)):
+        canonical = load_canonical_map(output)
+        stats.add(STATUS_SKIPPED)
+    else:
+        start = time.perf_counter()
+        canonical = build_canonical_map(text_root, image_root, output, exact=exact, workers=workers)
+        state.record("dedup", "*", input_hash, STATUS_DONE, seconds=time.perf_counter() - start)
+        stats.add(STATUS_DONE)
+    stats.counts[STATUS_DUPLICATE] += sum(is_duplicate(pid, canonical) for pid in canonical)
+    return canonical
+
+
+def structured_path(text_path):
+    return os.path.splitext(text_path)[0] + "_structured.json"
+
+
+def structure_item(text_path, output_path, extractor):
+    """Worker: structure one instruction text and write it next to the text, as text_preprocessing does."""
+    with open(text_path, "r", encoding="utf-8") as f:
+        raw_text = f.read()
+    if not raw_text.strip():
+        return STATUS_EMPTY
+    structured = structure_text_instructions(raw_text, extractor)
+    tmp_path = f"{output_path}.partial-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(structured, f, indent=4)
+    os.replace(tmp_path, output_path)
+    return STATUS_DONE
+
+
+class Describer:
+    """Thread-pool side of the describe stage: shared session, rate limiter and cache."""
+
+    def __init__(self, concurrency, rate, api_base, max_retries, use_cache=True):
+        self.api_base = api_base
+        self.max_retries = max_retries
+        self.limiter = AdaptiveTokenBucket(rate=rate)
+        self.cache = get_default_cache() if use_cache else None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __call__(self, image_path, prompt, output_path):
+        description = request_image_description(
+            self.session,
+            image_path=image_path,
+            prompt=prompt,
+            limiter=self.limiter,
+            api_base=self.api_base,
+            max_retries=self.max_retries,
+            cache=self.cache
+        )
+        if not description:
+            return STATUS_EMPTY
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        tmp_path = f"{output_path}.partial"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(description)
+        os.replace(tmp_path, output_path)
+        return STATUS_DONE
+
+    def close(self):
+        self.session.close()
+
+
+def structure_tasks(state, text_root, canonical, extractor, force, stats):
+    """Yield (item, input hash, args) for canonical texts whose content or extractor changed."""
+    for text_path in sorted(glob.glob(os.path.join(text_root, "**", "*.txt"), recursive=True)):
+        pid = pattern_id(text_path, text_root)
+        input_hash = hash_inputs("structure", STAGE_VERSIONS["structure"], state.file_hash(text_path), extractor)
+        if is_duplicate(pid, canonical):
+            state.record("structure", pid, input_hash, STATUS_DUPLICATE)
+            stats.add(STATUS_DUPLICATE)
+            continue
+        output_path = structured_path(text_path)
+        if not force and state.is_current("structure", pid, input_hash, (output_path,)):
+            stats.add(STATUS_SKIPPED)
+            continue
+        yield pid, input_hash, (text_path, output_path, extractor)
+
+
+def describe_tasks(state, image_root, descriptions_root, canonical, force, stats):
+    """Yield (item, input hash, args) for canonical covers whose bytes or prompt changed."""
+    for category, image_path, output_path in _collect_image_tasks(image_root, descriptions_root):
+        pid = pattern_id(image_path, image_root)
+        prompt = category_prompt(category)
+        input_hash = hash_inputs(
+            "describe", STAGE_VERSIONS["describe"], state.file_hash(image_path), prompt, MODEL_NAME
+        )
+        if is_duplicate(pid, canonical):
+            state.record("describe", pid, input_hash, STATUS_DUPLICATE)
+            stats.add(STATUS_DUPLICATE)
+            continue
+        if not force and state.is_current("describe", pid, input_hash, (output_path,)):
+            stats.add(STATUS_SKIPPED)
+            continue
+        yield pid, input_hash, (image_path, prompt, output_path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the data collection pipeline incrementally.")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(DEFAULT_STAGES),
+                        help="Stages to run, in pipeline order (scrape is opt-in).")
+    parser.add_argument("--input", default="scrapper/input_file", help="Folder with the scraped PDFs.")
+    parser.add_argument("--text", default="processed/raw_instructions", help="Extracted text folder.")
+    parser.add_argument("--images", default="processed/raw_image", help="Extracted cover folder.")
+    parser.add_argument("--descriptions", default="descriptions", help="Image description folder.")
+    parser.add_argument("--dedup-map", default=DEDUP_MAP_PATH, help="Canonical-id map written by the dedup stage.")
+    parser.add_argument("--state", default=STATE_PATH, help="SQLite file with per-stage input hashes.")
+    parser.add_argument("--force", action="store_true", help="Recompute every selected stage.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes for extraction, fingerprinting and structuring.")
+    parser.add_argument("--mode", choices=("single", "render"), default="single", help="PDF extraction mode.")
+    parser.add_argument("--extractor", choices=EXTRACTORS, default="spacy", help="Entity extractor for structuring.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Description requests in flight.")
+    parser.add_argument("--rate", type=float, default=5.0, help="Initial description request rate (requests/sec).")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries per image on 429/5xx.")
+    parser.add_argument("--api-base", default=OPENAI_API_BASE, help="Base URL of the chat completions API.")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore the on-disk description cache.")
+    parser.add_argument("--crawler", choices=("selenium", "playwright"), default="playwright",
+                        help="Crawler used by the scrape stage.")
+    parser.add_argument("--pages", type=int, default=3, help="Listing pages per project type (scrape stage).")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    stages = [stage for stage in STAGES if stage in args.stages]
+    if "describe" in stages and not OPENAI_API_KEY:
+        print("[WARNING] OPENAI_API_KEY is not set, skipping the describe stage.")
+        stages.remove("describe")
+    stats = {stage: StageStats(stage) for stage in stages}
+    roots = (args.input, args.text, args.images)
+    for root in roots:
+        os.makedirs(root, exist_ok=True)
+    remove_stale_partials(args.text, args.images)
+    state = PipelineState(args.state)
+    metrics.start_profiler_if_enabled()
+    start = time.perf_counter()
+
+    if "scrape" in stats:
+        scrape_stage(args.input, args.crawler, args.pages, stats["scrape"])
+    pdfs = list_pdfs(args.input)
+    print(f"[INFO] {len(pdfs)} PDFs in {args.input}; running stages: {', '.join(stages)}")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        if "extract" in stats:
+            exact = extract_stage(pool, state, pdfs, roots, args.mode, args.force, stats["extract"])
+        else:
+            exact, _ = exact_pairs(state, pdfs)
+
+        if "dedup" in stats:
+            canonical = dedup_stage(state, args.text, args.images, args.dedup_map, exact, args.workers,
+                                    args.force, stats["dedup"])
+        else:
+            canonical = load_canonical_map(args.dedup_map)
+
+        # Structuring and description only depend on extraction, so both pools work at once.
+        futures = {}
+        describer = None
+        threads = None
+        if "structure" in stats:
+            stats["structure"].start()
+            for pid, input_hash, task in structure_tasks(state, args.text, canonical, args.extractor,
+                                                         args.force, stats["structure"]):
+                futures[pool.submit(structure_item, *task)] = ("structure", pid, input_hash, time.perf_counter())
+        if "describe" in stats:
+            stats["describe"].start()
+            describer = Describer(args.concurrency, args.rate, args.api_base, args.max_retries, not args.no_cache)
+            threads = ThreadPoolExecutor(max_workers=args.concurrency)
+            for pid, input_hash, task in describe_tasks(state, args.images, args.descriptions, canonical,
+                                                        args.force, stats["describe"]):
+                futures[threads.submit(describer, *task)] = ("describe", pid, input_hash, time.perf_counter())
+
+        print(f"[INFO] {len(futures)} structure/describe tasks queued")
+        for future in as_completed(futures):
+            stage, pid, input_hash, submitted = futures[future]
+            error = None
+            try:
+                status = future.result()
+            except Exception as e:
+                status, error = STATUS_FAILED, f"{type(e).__name__}: {e}"
+            seconds = time.perf_counter() - submitted
+            state.record(stage, pid, input_hash, status, error, seconds)
+            stats[stage].add(status, pid, error, seconds)
+
+        if threads is not None:
+            threads.shutdown()
+            describer.close()
+
+    state.close()
+    print(f"[SUCCESS] Pipeline finished in {time.perf_counter() - start:.1f}s")
+    print_summary(stats)
+    metrics.write_summary("pipeline", stages=stages, wall_seconds=round(time.perf_counter() - start, 3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.embeddings import EMBEDDING_BACKEND, EMBEDDING_IMAGE_SIDE, EMBEDDING_MODEL, load_embedder
+from common.image_preprocessing import load_image
+from common.similarity_index import SimilarityIndex
+from dedup import DEDUP_MAP_PATH, collect_patterns, is_duplicate, load_canonical_map
+
+INDEX_DIR = "processed/embedding_index"
+PREVIEW_CHARS = 500
+
+
+def pattern_record(pid, text_path):
+    """Metadata served with a match: id, category folder, title and the start of the instructions."""
+    text = ""
+    if text_path and os.path.exists(text_path):
+        with open(text_path, "r", encoding="utf-8", errors="ignore") as f:
+            text = f.read(PREVIEW_CHARS * 4)
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    category = unquote(pid.rsplit("/", 1)[0]).replace("+", " ") if "/" in pid else ""
+    return {
+        "id": pid,
+        "category": category,
+        "title": lines[0] if lines else os.path.basename(pid),
+        "preview": " ".join(lines)[:PREVIEW_CHARS],
+    }
+
+
+def embed_patterns(embedder, image_paths, batch_size=32, loaders=4):
+    """
+    Embed images in batches while the next batch is decoded in background threads.
+
+    Returns:
+        tuple: (float32 embeddings, list of booleans telling which paths decoded).
+    """
+    def load(path):
+        try:
+            return load_image(path, EMBEDDING_IMAGE_SIDE)
+        except Exception as e:
+            print(f"[WARNING] Could not read {path}: {e}")
+            return None
+
+    vectors, ok = [], []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=loaders) as pool:
+        batches = [image_paths[i:i + batch_size] for i in range(0, len(image_paths), batch_size)]
+        pending = pool.map(load, batches[0]) if batches else None
+        for number, batch in enumerate(batches):
+            images = list(pending)
+            if number + 1 < len(batches):
+                pending = pool.map(load, batches[number + 1])
+            ok.extend(image is not None for image in images)
+            images = [image for image in images if image is not None]
+            if images:
+                vectors.append(embedder.embed(images))
+            done = min((number + 1) * batch_size, len(image_paths))
+            if (number + 1) % 10 == 0 or done == len(image_paths):
+                elapsed = time.perf_counter() - start
+                print(f"[INFO] Embedded {done}/{len(image_paths)} images ({done / elapsed:.1f} images/sec)")
+    dim = embedder.dim
+    return (np.concatenate(vectors) if vectors else np.empty((0, dim), dtype=np.float32)), ok
+
+
+def recall_at_k(index, vectors, k=10, nprobe=8, queries=200, seed=0):
+    """Share of exact top-k neighbours the IVF search also returns, over sampled corpus queries."""
+    if index.nlist == 0 or len(vectors) == 0:
+        return 1.0
+    exact = SimilarityIndex(index.vectors, index.items)
+    rng = np.random.default_rng(seed)
+    found = total = 0
+    for row in rng.choice(len(vectors), min(queries, len(vectors)), replace=False):
+        truth = {r for r, _ in exact.search(vectors[row], k)}
+        found += len(truth & {r for r, _ in index.search(vectors[row], k, nprobe)})
+        total += len(truth)
+    return found / total
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Embed extracted cover images and build the similarity index.")
+    parser.add_argument("--images", default="processed/raw_image", help="Directory with extracted cover images.")
+    parser.add_argument("--text", default="processed/raw_instructions", help="Directory with extracted .txt files.")
+    parser.add_argument("--output", default=INDEX_DIR, help="Index directory served by the app's /similar endpoint.")
+    parser.add_argument("--dedup-map", default=DEDUP_MAP_PATH,
+                        help="Canonical-id map from dedup.py; near-duplicate patterns are left out.")
+    parser.add_argument("--backend", choices=("clip", "histogram"), default=EMBEDDING_BACKEND)
+    parser.add_argument("--model", default=EMBEDDING_MODEL, help="CLIP checkpoint (clip backend).")
+    parser.add_argument("--batch-size", type=int, default=32, help="Images per embedding call.")
+    parser.add_argument("--threads", type=int, default=0, help="Torch intra-op threads; 0 keeps the default.")
+    parser.add_argument("--nlist", type=int, default=None,
+                        help="IVF lists; default ~sqrt(n) for large corpora, 0 forces exact search.")
+    parser.add_argument("--nprobe", type=int, default=8, help="Lists probed when measuring recall.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    canonical_map = load_canonical_map(args.dedup_map)
+    patterns = collect_patterns(args.text, args.images)
+    ids = sorted(pid for pid, (_, image_path) in patterns.items()
+                 if image_path is not None and not is_duplicate(pid, canonical_map))
+    print(f"[INFO] Embedding {len(ids)} cover images with the {args.backend} backend...")
+
+    start = time.perf_counter()
+    embedder = load_embedder(args.backend, args.model, num_threads=args.threads)
+    loaded = time.perf_counter()
+    vectors, ok = embed_patterns(embedder, [patterns[pid][1] for pid in ids], args.batch_size)
+    ids = [pid for pid, good in zip(ids, ok) if good]
+    embedded = time.perf_counter()
+
+    items = [pattern_record(pid, patterns[pid][0]) for pid in ids]
+    info = {"backend": embedder.backend, "model": embedder.model_name, "image_side": EMBEDDING_IMAGE_SIDE}
+    index = SimilarityIndex.build(vectors, items, nlist=args.nlist, info=info)
+    index.save(args.output)
+    built = time.perf_counter()
+
+    size_mb = index.vectors.nbytes / (1024 * 1024)
+    print(f"[INFO] Model load {loaded - start:.1f}s, embedding {embedded - loaded:.1f}s, "
+          f"index build {built - embedded:.1f}s")
+    if index.nlist:
+        print(f"[INFO] IVF with {index.nlist} lists; recall@10 at nprobe={args.nprobe}: "
+              f"{recall_at_k(index, vectors, nprobe=args.nprobe):.3f}")
+    print(f"[SUCCESS] Indexed {len(index)} patterns ({size_mb:.1f} MiB float16) in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
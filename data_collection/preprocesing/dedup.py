@@ -0,0 +1,354 @@
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import zlib
+import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.image_hash import phash, hamming
+from common.metrics import inc, record, start_profiler_if_enabled, write_summary
+
+DEDUP_MAP_PATH = "processed/canonical_ids.json"
+
+NUM_PERM = 128
+BANDS = 32              # 32 bands x 4 rows: pairs above ~0.5 Jaccard almost always share a band
+SHINGLE_WORDS = 5
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+# Buckets larger than this (boilerplate text, blank covers) are only compared
+# against their first member, so one degenerate bucket cannot go quadratic.
+MAX_BUCKET_PAIRS = 100
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, MAX_HASH, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, MAX_HASH, size=NUM_PERM, dtype=np.uint64)
+
+
+def pattern_id(path, root):
+    """Stable pattern key: path relative to its stage root, without extension, with '/' separators."""
+    rel_path = os.path.splitext(os.path.relpath(path, root))[0]
+    return rel_path.replace(os.sep, "/")
+
+
+def shingle_hashes(text, k=SHINGLE_WORDS):
+    """32-bit hashes of the word k-shingles of normalized text."""
+    words = _WORD.findall(text.lower())
+    if len(words) < k:
+        shingles = {" ".join(words)} if words else set()
+    else:
+        shingles = {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+    return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+
+def minhash(hashes):
+    """
+    MinHash signature of a set of 32-bit shingle hashes.
+
+    Each permutation is h -> (a * h + b) mod p with the Mersenne prime p = 2^61 - 1;
+    a and b are below 2^32 so the products never overflow 64 bits.
+
+    Returns:
+        numpy.ndarray: ``NUM_PERM`` uint32 values, or None for an empty set.
+    """
+    if len(hashes) == 0:
+        return None
+    signature = np.full(NUM_PERM, MAX_HASH, dtype=np.uint64)
+    # Chunked so very long documents do not build a huge shingles x permutations matrix.
+    for start in range(0, len(hashes), 4096):
+        chunk = hashes[start:start + 4096, None]
+        permuted = ((chunk * _PERM_A + _PERM_B) % MERSENNE_PRIME) & MAX_HASH
+        np.minimum(signature, permuted.min(axis=0), out=signature)
+    return signature.astype(np.uint32)
+
+
+def fingerprint(text_path, image_path):
+    """Worker: MinHash signature of a pattern's text and pHash of its cover (None when missing)."""
+    signature = image_hash = None
+    if text_path and os.path.exists(text_path):
+        with open(text_path, "r", encoding="utf-8", errors="ignore") as f:
+            signature = minhash(shingle_hashes(f.read()))
+    if image_path and os.path.exists(image_path):
+        try:
+            with Image.open(image_path) as image:
+                image_hash = phash(image)
+        except Exception as e:
+            print(f"[WARNING] Could not hash {image_path}: {e}")
+    return signature, image_hash
+
+
+def collect_patterns(text_root, image_root):
+    """Map pattern id -> (text path, image path) over both extraction outputs."""
+    patterns = defaultdict(lambda: [None, None])
+    for root, slot, ext in ((text_root, 0, ".txt"), (image_root, 1, ".png")):
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                if filename.lower().endswith(ext):
+                    path = os.path.join(directory, filename)
+                    patterns[pattern_id(path, root)][slot] = path
+    return patterns
+
+
+def exact_duplicates(manifest_path):
+    """(duplicate id, original id) pairs recorded by pdf_processor, if its manifest exists."""
+    if not manifest_path or not os.path.exists(manifest_path):
+        return []
+    conn = sqlite3.connect(manifest_path)
+    try:
+        rows = conn.execute("SELECT path, duplicate_of FROM pdfs WHERE duplicate_of IS NOT NULL").fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    finally:
+        conn.close()
+    return [(os.path.splitext(path)[0].replace(os.sep, "/"), os.path.splitext(original)[0].replace(os.sep, "/"))
+            for path, original in rows]
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        self.parent.setdefault(item, item)
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+def bucket_pairs(buckets):
+    """Candidate pairs from LSH buckets, capped per bucket (see ``MAX_BUCKET_PAIRS``)."""
+    pairs = set()
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        if len(members) > MAX_BUCKET_PAIRS:
+            pairs.update((members[0], other) for other in members[1:])
+            continue
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                pairs.add((a, b))
+    return pairs
+
+
+def text_candidates(signatures):
+    """Pairs of ids whose MinHash signatures collide in at least one LSH band."""
+    rows = NUM_PERM // BANDS
+    buckets = defaultdict(list)
+    for pid, signature in signatures.items():
+        for band in range(BANDS):
+            buckets[(band, signature[band * rows:(band + 1) * rows].tobytes())].append(pid)
+    return bucket_pairs(buckets)
+
+
+def image_candidates(image_hashes, max_distance):
+    """
+    Pairs of ids whose hashes may be within ``max_distance`` bits.
+
+    The 64-bit hash is cut into ``max_distance + 1`` chunks; by the pigeonhole
+    principle two hashes that close agree exactly on at least one chunk.
+    """
+    chunks = max_distance + 1
+    bounds = np.linspace(0, 64, chunks + 1).astype(int)
+    buckets = defaultdict(list)
+    for pid, value in image_hashes.items():
+        for index in range(chunks):
+            width = bounds[index + 1] - bounds[index]
+            buckets[(index, (value >> int(bounds[index])) & ((1 << int(width)) - 1))].append(pid)
+    return bucket_pairs(buckets)
+
+
+def jaccard(a, b):
+    """Jaccard similarity estimated from two MinHash signatures."""
+    return float(np.mean(a == b))
+
+
+def find_duplicates(signatures, image_hashes, text_threshold, image_text_threshold, max_distance):
+    """
+    Group near-duplicate patterns.
+
+    Two patterns are linked when their instruction texts are at least
+    ``text_threshold`` similar, or when their covers are within ``max_distance``
+    bits and their texts are at least ``image_text_threshold`` similar (or one of
+    them has no text). Links are merged transitively with union-find.
+
+    Returns:
+        tuple: (UnionFind, dict of link counts by kind).
+    """
+    groups = UnionFind()
+    links = {"text": 0, "image": 0}
+    for a, b in text_candidates(signatures):
+        if jaccard(signatures[a], signatures[b]) >= text_threshold:
+            groups.union(a, b)
+            links["text"] += 1
+    for a, b in image_candidates(image_hashes, max_distance):
+        if hamming(image_hashes[a], image_hashes[b]) > max_distance:
+            continue
+        if a in signatures and b in signatures and jaccard(signatures[a], signatures[b]) < image_text_threshold:
+            continue
+        groups.union(a, b)
+        links["image"] += 1
+    return groups, links
+
+
+def choose_canonical(members, patterns):
+    """Prefer a member with both text and cover, then the alphabetically first id."""
+    return min(members, key=lambda pid: (-sum(path is not None for path in patterns.get(pid, ())), pid))
+
+
+def load_canonical_map(path=DEDUP_MAP_PATH):
+    """
+    Read the pattern id -> canonical id mapping written by this stage.
+
+    Returns:
+        dict: Empty if the dedup stage has not been run, so callers process everything.
+    """
+    if not path or not os.path.exists(path):
+        print(f"[INFO] No dedup map at {path}, processing every pattern.")
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["canonical"]
+
+
+def is_duplicate(pid, canonical_map):
+    return canonical_map.get(pid, pid) != pid
+
+
+def drop_duplicates(paths, root, canonical_map):
+    """Keep only paths whose pattern is canonical (or unknown to the dedup map)."""
+    if not canonical_map:
+        return list(paths)
+    kept = [path for path in paths if not is_duplicate(pattern_id(path, root), canonical_map)]
+    skipped = len(paths) - len(kept)
+    if skipped:
+        print(f"[INFO] Skipping {skipped} near-duplicate patterns.")
+    return kept
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Map near-duplicate patterns to a canonical pattern id.")
+    parser.add_argument("--text", default="processed/raw_instructions", help="Directory with extracted .txt files.")
+    parser.add_argument("--images", default="processed/raw_image", help="Directory with extracted cover images.")
+    parser.add_argument("--manifest", default="processed/pdf_manifest.sqlite",
+                        help="pdf_processor manifest; its exact duplicates are merged too.")
+    parser.add_argument("--output", default=DEDUP_MAP_PATH, help="Where to write the canonical-id map.")
+    parser.add_argument("--text-threshold", type=float, default=0.8,
+                        help="Estimated Jaccard similarity at which two texts are duplicates.")
+    parser.add_argument("--image-text-threshold", type=float, default=0.5,
+                        help="Lower text similarity required when the covers also match.")
+    parser.add_argument("--max-distance", type=int, default=4, help="Largest cover pHash distance that matches.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Fingerprinting processes.")
+    return parser.parse_args()
+
+
+def build_canonical_map(text_root, image_root, output, exact=(), text_threshold=0.8,
+                        image_text_threshold=0.5, max_distance=4, workers=None):
+    """
+    Fingerprint every extracted pattern, group duplicates and write the canonical-id map.
+
+    Args:
+        text_root (str): Directory with extracted .txt files.
+        image_root (str): Directory with extracted cover images.
+        output (str): Path of the JSON map.
+        exact (iterable): (duplicate id, original id) pairs already known to be identical.
+        text_threshold (float): Estimated Jaccard similarity at which two texts are duplicates.
+        image_text_threshold (float): Lower text similarity required when the covers also match.
+        max_distance (int): Largest cover pHash distance that matches.
+        workers (int): Fingerprinting processes; None uses one per CPU.
+
+    Returns:
+        dict: Pattern id -> canonical id.
+    """
+    start = time.perf_counter()
+    patterns = collect_patterns(text_root, image_root)
+    ids = sorted(patterns)
+    print(f"[INFO] Fingerprinting {len(ids)} patterns with {workers or os.cpu_count()} worker(s)...")
+
+    signatures, image_hashes = {}, {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(fingerprint, *zip(*(patterns[pid] for pid in ids)), chunksize=64) if ids else []
+        for pid, (signature, image_hash) in zip(ids, results):
+            if signature is not None:
+                signatures[pid] = signature
+            if image_hash is not None:
+                image_hashes[pid] = image_hash
+    fingerprinted = time.perf_counter()
+
+    groups, links = find_duplicates(signatures, image_hashes, text_threshold, image_text_threshold, max_distance)
+    exact = list(exact)
+    for duplicate, original in exact:
+        groups.union(duplicate, original)
+
+    members = defaultdict(list)
+    for pid in set(ids) | set(groups.parent):
+        members[groups.find(pid)].append(pid)
+    canonical, duplicate_groups = {}, {}
+    for group in members.values():
+        chosen = choose_canonical(group, patterns)
+        for pid in group:
+            canonical[pid] = chosen
+        if len(group) > 1:
+            duplicate_groups[chosen] = sorted(group)
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    tmp_path = output + ".partial"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "params": {
+                "text_threshold": text_threshold,
+                "image_text_threshold": image_text_threshold,
+                "max_distance": max_distance,
+                "num_perm": NUM_PERM,
+                "bands": BANDS,
+                "shingle_words": SHINGLE_WORDS,
+            },
+            "canonical": dict(sorted(canonical.items())),
+            "groups": dict(sorted(duplicate_groups.items())),
+        }, f, indent=2)
+    os.replace(tmp_path, output)
+
+    duplicates = sum(len(group) - 1 for group in duplicate_groups.values())
+    record("dedup_fingerprint", fingerprinted - start)
+    record("dedup_match", time.perf_counter() - fingerprinted)
+    inc("dedup_patterns_total", len(canonical) - duplicates, kind="canonical")
+    inc("dedup_patterns_total", duplicates, kind="duplicate")
+    print(f"[INFO] Fingerprints: {len(signatures)} texts, {len(image_hashes)} covers "
+          f"in {fingerprinted - start:.1f}s; matching took {time.perf_counter() - fingerprinted:.1f}s")
+    print(f"[INFO] Links: {links['text']} text, {links['image']} cover, {len(exact)} exact")
+    print(f"[SUCCESS] {duplicates} duplicates in {len(duplicate_groups)} groups; "
+          f"{len(canonical) - duplicates} canonical patterns written to {output}")
+    return canonical
+
+
+def main():
+    args = parse_args()
+    start_profiler_if_enabled()
+    build_canonical_map(
+        args.text, args.images, args.output,
+        exact=exact_duplicates(args.manifest),
+        text_threshold=args.text_threshold,
+        image_text_threshold=args.image_text_threshold,
+        max_distance=args.max_distance,
+        workers=args.workers,
+    )
+    write_summary("dedup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+DEFAULT_CACHE_PATH = os.getenv("DESCRIPTION_CACHE_PATH", "cache/descriptions.sqlite")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class DescriptionCache:
+    """
+    Persistent, content-addressed cache of image descriptions backed by SQLite.
+
+    Entries are keyed by a hash of everything that influences the model output
+    (image bytes, prompt, model, temperature, max_tokens), so moving or renaming an
+    image still hits. When the stored text exceeds ``max_bytes`` the least recently
+    used entries are evicted.
+
+    Args:
+        path: SQLite database file.
+        max_bytes: Upper bound on the total size of cached descriptions.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS descriptions ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS descriptions_last_access ON descriptions (last_access)"
+        )
+        self._conn.commit()
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM descriptions"
+        ).fetchone()[0]
+
+    @staticmethod
+    def make_key(
+        image_bytes: bytes,
+        prompt: str,
+        model: str,
+        temperature: float,
+        max_tokens: int
+    ) -> str:
+        """Hash the image content together with every request parameter."""
+        params = json.dumps(
+            {"prompt": prompt, "model": model, "temperature": temperature, "max_tokens": max_tokens},
+            sort_keys=True
+        )
+        digest = hashlib.sha256(image_bytes)
+        digest.update(b"\0")
+        digest.update(params.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached description for ``key`` or None, updating recency and counters."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM descriptions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE descriptions SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        """Store a description and evict least recently used entries if over budget."""
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT size FROM descriptions WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO descriptions (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time())
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM descriptions ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self._total_bytes <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM descriptions WHERE key = ?", (key,))
+                self._total_bytes -= size
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": self._total_bytes
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> DescriptionCache:
+    """Process-wide cache opened lazily at ``DESCRIPTION_CACHE_PATH``."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = DescriptionCache()
+        return _default_cache
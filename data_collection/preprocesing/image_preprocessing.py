@@ -1,22 +1,74 @@
 import os
+import sys
 import base64
+import random
 import requests
 import time
 import json
+import argparse
 import openai
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 from urllib.parse import unquote
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
+from rate_limiter import AdaptiveTokenBucket, parse_retry_after
+from description_cache import DescriptionCache, get_default_cache
+from dedup import DEDUP_MAP_PATH, load_canonical_map, is_duplicate, pattern_id
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.metrics import inc, retry, start_profiler_if_enabled, timed, write_summary
+
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Overridable so the concurrent pipeline can be pointed at a local stub server.
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+MODEL_NAME = "gpt-4o-mini"
+
+DEFAULT_PROMPT = (
+    "Analyze this image in detail. Describe:\n"
+    "1. Key visual elements and composition\n"
+    "2. Colors and textures\n"
+    "3. Style and aesthetic qualities\n"
+    "4. Potential patterns or design elements\n"
+    "5. Notable fashion or textile characteristics"
+)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def build_messages(b64_image: str, prompt: str) -> List[dict]:
+    """Construct the chat message payload as required by GPT‑Vision."""
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{b64_image}"}}
+            ]
+        }
+    ]
+
+
+def category_prompt(category: str) -> str:
+    """Prompt used when describing an image from a given category folder."""
+    return (
+        f"Analyze this fashion item from the category '{category}'. Focus on:\n"
+        "1. Materials and textures\n"
+        "2. Construction techniques\n"
+        "3. Pattern details\n"
+        "4. Styling elements"
+    )
 
 
 def get_image_description(
     image_path: str,
     prompt: Optional[str] = None,
     temperature: float = 0.2,
-    max_tokens: int = 300
+    max_tokens: int = 300,
+    cache: Optional[DescriptionCache] = None,
+    use_cache: bool = True
 ) -> str:
     """
     Analyze an image using GPT‑Vision capabilities via OpenAI's chat completions API.
@@ -26,6 +78,8 @@ def get_image_description(
         prompt: Custom prompt instructing the model.
         temperature: Controls randomness (0 is deterministic).
         max_tokens: Maximum response length.
+        cache: Description cache to consult; defaults to the shared on-disk cache.
+        use_cache: Set to False to always call the API.
     
     Returns:
         Generated analysis (description) of the image.
@@ -33,51 +87,51 @@ def get_image_description(
     if not os.path.isfile(image_path):
         raise FileNotFoundError(f"Image not found: {image_path}")
     
-    # Read and encode the image as base64
     with open(image_path, "rb") as image_file:
-        b64_image = base64.b64encode(image_file.read()).decode("utf-8")
-    
+        image_bytes = image_file.read()
+
     # Default prompt if none provided
-    prompt = prompt or (
-        "Analyze this image in detail. Describe:\n"
-        "1. Key visual elements and composition\n"
-        "2. Colors and textures\n"
-        "3. Style and aesthetic qualities\n"
-        "4. Potential patterns or design elements\n"
-        "5. Notable fashion or textile characteristics"
-    )
-    
-    # Construct the message payload as required by GPT‑Vision
-    messages = [
-        {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{b64_image}"}}
-            ]
-        }
-    ]
+    prompt = prompt or DEFAULT_PROMPT
+
+    # Check the cache before paying for a network call
+    if use_cache:
+        cache = cache or get_default_cache()
+        cache_key = DescriptionCache.make_key(image_bytes, prompt, MODEL_NAME, temperature, max_tokens)
+        cached = cache.get(cache_key)
+        inc("describe_cache_total", result="miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+
+    # Encode the image as base64
+    b64_image = base64.b64encode(image_bytes).decode("utf-8")
+    messages = build_messages(b64_image, prompt)
     
     try:
         response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
+            model=MODEL_NAME,
             messages=messages,
             max_tokens=max_tokens,
             temperature=temperature
         )
         # Access the response using dictionary keys (new interface)
-        return response["choices"][0]["message"]["content"]
+        description = response["choices"][0]["message"]["content"]
     except Exception as e:
         print(f"API request failed: {str(e)}")
         return ""
 
+    if use_cache and description:
+        cache.put(cache_key, description)
+    return description
+
 
 def process_image_directory(
     base_input_path: str = "processed/raw_image",
     output_root: str = "descriptions",
     api_key: str = OPENAI_API_KEY,
     batch_size: int = 10,
-    delay: float = 1.0
+    delay: float = 1.0,
+    canonical_map: Optional[Dict[str, str]] = None,
+    use_cache: bool = True
 ) -> Dict[str, List[str]]:
     """
     Process all images in categorized subfolders and save GPT‑Vision descriptions.
@@ -88,6 +142,8 @@ def process_image_directory(
         api_key: API key for GPT‑Vision.
         batch_size: Number of images per batch.
         delay: Seconds to wait between batches.
+        canonical_map: Pattern id -> canonical id from the dedup stage; duplicates are skipped.
+        use_cache: Reuse cached descriptions instead of calling the API again.
     
     Returns:
         Dictionary mapping categories to a list of processed image file paths.
@@ -107,7 +163,11 @@ def process_image_directory(
         output_dir = os.path.join(output_root, category)
         os.makedirs(output_dir, exist_ok=True)
         
-        image_files = [f for f in files if f.lower().endswith('.png')]
+        image_files = [
+            f for f in files
+            if f.lower().endswith('.png')
+            and not is_duplicate(pattern_id(os.path.join(root, f), base_input_path), canonical_map or {})
+        ]
         processed[category] = []
         
         
@@ -122,14 +182,8 @@ def process_image_directory(
                 try:
                     description = get_image_description(
                         image_path=image_path,
-                        
-                        prompt=(
-                            f"Analyze this fashion item from the category '{category}'. Focus on:\n"
-                            "1. Materials and textures\n"
-                            "2. Construction techniques\n"
-                            "3. Pattern details\n"
-                            "4. Styling elements"
-                        )
+                        prompt=category_prompt(category),
+                        use_cache=use_cache
                     )
                     
                     with open(output_path, 'w', encoding='utf-8') as f:
@@ -145,11 +199,267 @@ def process_image_directory(
     
     return processed
 
+
+def request_image_description(
+    session: requests.Session,
+    image_path: str,
+    prompt: str,
+    limiter: AdaptiveTokenBucket,
+    api_key: str = OPENAI_API_KEY,
+    api_base: str = OPENAI_API_BASE,
+    temperature: float = 0.2,
+    max_tokens: int = 300,
+    max_retries: int = 5,
+    backoff_base: float = 1.0,
+    backoff_max: float = 60.0,
+    timeout: float = 60.0,
+    cache: Optional[DescriptionCache] = None
+) -> str:
+    """
+    Describe an image by calling the chat completions endpoint directly over HTTP.
+
+    Unlike ``get_image_description`` this talks to the REST API through a shared
+    session so that status codes and rate-limit headers are visible. Each attempt
+    takes a token from ``limiter``; 429s and 5xx responses are retried with
+    exponential backoff and full jitter, never sooner than a Retry-After hint.
+
+    Args:
+        session: Shared HTTP session (connection pool).
+        image_path: Path to the image file.
+        prompt: Prompt instructing the model.
+        limiter: Rate limiter shared by all workers.
+        api_key: API key sent as a bearer token.
+        api_base: Base URL of the OpenAI-compatible API.
+        temperature: Controls randomness (0 is deterministic).
+        max_tokens: Maximum response length.
+        max_retries: Retries after the first attempt before giving up.
+        backoff_base: Initial backoff in seconds, doubled on every retry.
+        backoff_max: Upper bound for a single backoff.
+        timeout: Per-request timeout in seconds.
+        cache: Description cache consulted before the request is sent.
+
+    Returns:
+        Generated description of the image.
+
+    Raises:
+        requests.exceptions.RequestException: If the request fails permanently.
+    """
+    if not os.path.isfile(image_path):
+        raise FileNotFoundError(f"Image not found: {image_path}")
+
+    with open(image_path, "rb") as image_file:
+        image_bytes = image_file.read()
+
+    if cache is not None:
+        cache_key = DescriptionCache.make_key(image_bytes, prompt, MODEL_NAME, temperature, max_tokens)
+        cached = cache.get(cache_key)
+        inc("describe_cache_total", result="miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+
+    b64_image = base64.b64encode(image_bytes).decode("utf-8")
+    url = f"{api_base.rstrip('/')}/chat/completions"
+    headers = {"Authorization": f"Bearer {api_key}"}
+    payload = {
+        "model": MODEL_NAME,
+        "messages": build_messages(b64_image, prompt),
+        "max_tokens": max_tokens,
+        "temperature": temperature
+    }
+
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        retry_after = None
+        try:
+            response = session.post(url, json=payload, headers=headers, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = e
+            inc("describe_requests_total", status="connection_error")
+        else:
+            inc("describe_requests_total", status=response.status_code)
+            if response.status_code == 200:
+                limiter.on_success()
+                description = response.json()["choices"][0]["message"]["content"]
+                if cache is not None and description:
+                    cache.put(cache_key, description)
+                return description
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                response.raise_for_status()
+            retry_after = parse_retry_after(response.headers)
+            if response.status_code == 429:
+                limiter.on_throttle(retry_after)
+            error = requests.exceptions.HTTPError(
+                f"{response.status_code} from {url}", response=response
+            )
+
+        if attempt == max_retries:
+            raise error
+        retry("describe_image")
+        backoff = random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+        time.sleep(max(backoff, retry_after or 0.0))
+
+
+def _collect_image_tasks(
+    base_input_path: str,
+    output_root: str,
+    canonical_map: Optional[Dict[str, str]] = None
+) -> List[Tuple[str, str, str]]:
+    """List (category, image_path, output_path) for every non-duplicate PNG under the category folders."""
+    tasks = []
+    skipped = 0
+    for root, dirs, files in os.walk(base_input_path):
+        if root == base_input_path:
+            continue
+
+        rel_path = os.path.relpath(root, base_input_path)
+        category = unquote(rel_path).replace('+', ' ')
+        output_dir = os.path.join(output_root, category)
+
+        for filename in files:
+            if not filename.lower().endswith('.png'):
+                continue
+            if is_duplicate(pattern_id(os.path.join(root, filename), base_input_path), canonical_map or {}):
+                skipped += 1
+                continue
+            output_path = os.path.join(output_dir, f"{os.path.splitext(filename)[0]}.txt")
+            tasks.append((category, os.path.join(root, filename), output_path))
+    if skipped:
+        print(f"Skipping {skipped} near-duplicate images")
+    return tasks
+
+
+def process_image_directory_concurrent(
+    base_input_path: str = "processed/raw_image",
+    output_root: str = "descriptions",
+    api_key: str = OPENAI_API_KEY,
+    api_base: str = OPENAI_API_BASE,
+    concurrency: int = 8,
+    rate: float = 5.0,
+    max_retries: int = 5,
+    report_every: int = 50,
+    use_cache: bool = True,
+    canonical_map: Optional[Dict[str, str]] = None
+) -> Dict[str, List[str]]:
+    """
+    Same as ``process_image_directory`` but with a bounded pool of concurrent requests.
+
+    Pacing comes from an adaptive token bucket instead of a fixed sleep per batch,
+    so the pool runs as fast as the API allows and backs off on 429s.
+
+    Args:
+        base_input_path: Root directory containing category folders.
+        output_root: Where to save description files.
+        api_key: API key for GPT‑Vision.
+        api_base: Base URL of the OpenAI-compatible API.
+        concurrency: Maximum number of requests in flight.
+        rate: Initial (and maximum) request rate in requests per second.
+        max_retries: Retries per image for throttled or failed requests.
+        report_every: Print throughput after this many completed images.
+        use_cache: Reuse cached descriptions instead of calling the API again.
+        canonical_map: Pattern id -> canonical id from the dedup stage; duplicates are skipped.
+
+    Returns:
+        Dictionary mapping categories to a list of processed image file paths.
+    """
+    tasks = _collect_image_tasks(base_input_path, output_root, canonical_map)
+    print(f"Found {len(tasks)} images, running with concurrency={concurrency}, rate={rate}/s")
+
+    processed = {category: [] for category, _, _ in tasks}
+    for _, _, output_path in tasks:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    limiter = AdaptiveTokenBucket(rate=rate)
+    cache = get_default_cache() if use_cache else None
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    def describe(category: str, image_path: str, output_path: str) -> None:
+        with timed("describe_image"):
+            description = request_image_description(
+                session,
+                image_path=image_path,
+                prompt=category_prompt(category),
+                limiter=limiter,
+                api_key=api_key,
+                api_base=api_base,
+                max_retries=max_retries,
+                cache=cache
+            )
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(description)
+
+    done = failed = 0
+    start = time.perf_counter()
+
+    with session, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(describe, *task): task for task in tasks}
+        for future in as_completed(futures):
+            category, image_path, _ = futures[future]
+            filename = os.path.basename(image_path)
+            try:
+                future.result()
+                processed[category].append(image_path)
+                print(f"✓ Processed: {filename}")
+            except Exception as e:
+                failed += 1
+                print(f"✗ Failed {filename}: {str(e)}")
+            done += 1
+            if done % report_every == 0:
+                elapsed = time.perf_counter() - start
+                print(f"[{done}/{len(tasks)}] {done / elapsed:.2f} images/sec, "
+                      f"current rate limit {limiter.rate:.2f}/s")
+
+    elapsed = time.perf_counter() - start
+    throughput = len(tasks) / elapsed if elapsed > 0 else 0.0
+    print(f"\nDescribed {len(tasks) - failed}/{len(tasks)} images in {elapsed:.1f}s "
+          f"({throughput:.2f} images/sec, {limiter.throttled} throttled responses)")
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+    return processed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate GPT‑Vision descriptions for extracted pattern images.")
+    parser.add_argument("--input", default="processed/raw_image", help="Root directory containing category folders.")
+    parser.add_argument("--output", default="descriptions", help="Where to save description files.")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Requests in flight; values above 1 enable the concurrent pipeline.")
+    parser.add_argument("--rate", type=float, default=5.0, help="Initial request rate (requests/sec).")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries per image on 429/5xx.")
+    parser.add_argument("--api-base", default=OPENAI_API_BASE, help="Base URL of the chat completions API.")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore the on-disk description cache.")
+    parser.add_argument("--dedup-map", default=DEDUP_MAP_PATH,
+                        help="Canonical-id map from dedup.py; near-duplicate patterns are not described.")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    start_profiler_if_enabled()
     try:
-        results = process_image_directory()
+        canonical_map = load_canonical_map(args.dedup_map)
+        if args.concurrency > 1:
+            results = process_image_directory_concurrent(
+                base_input_path=args.input,
+                output_root=args.output,
+                api_base=args.api_base,
+                concurrency=args.concurrency,
+                rate=args.rate,
+                max_retries=args.max_retries,
+                use_cache=not args.no_cache,
+                canonical_map=canonical_map
+            )
+        else:
+            results = process_image_directory(
+                base_input_path=args.input, output_root=args.output, canonical_map=canonical_map,
+                use_cache=not args.no_cache
+            )
         print("\nProcessing complete!")
         print(f"Categories processed: {len(results)}")
         print(f"Total images processed: {sum(len(v) for v in results.values())}")
     except Exception as e:
         print(f"Fatal error: {str(e)}")
+    write_summary("image_preprocessing", concurrency=args.concurrency)
@@ -0,0 +1,122 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+
+
+class AdaptiveTokenBucket:
+    """
+    Thread-safe token bucket whose refill rate adapts to server feedback.
+
+    Every 429 response cuts the rate multiplicatively and every success raises it
+    additively (AIMD), so the client settles near the highest rate the API accepts.
+    A Retry-After hint pauses all callers until it has elapsed.
+
+    Args:
+        rate: Initial refill rate in requests per second.
+        capacity: Maximum burst size. Defaults to the initial rate (at least 1).
+        min_rate: Lower bound for the adapted rate.
+        max_rate: Upper bound for the adapted rate. Defaults to the initial rate.
+        decrease_factor: Multiplier applied to the rate on a 429.
+        increase_step: Requests/sec added back after each success.
+    """
+
+    def __init__(
+        self,
+        rate: float = 5.0,
+        capacity: Optional[float] = None,
+        min_rate: float = 0.2,
+        max_rate: Optional[float] = None,
+        decrease_factor: float = 0.5,
+        increase_step: float = 0.05
+    ):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate or self.rate
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step
+
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.throttled = 0
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+
+    def acquire(self) -> None:
+        """Block until a token is available and no Retry-After pause is active."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1.0:
+                        self._tokens -= 1.0
+                        return
+                    wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self) -> None:
+        """Additively raise the rate after a successful request."""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        """
+        Multiplicatively lower the rate after a 429 and honour any Retry-After hint.
+
+        Args:
+            retry_after: Seconds the server asked us to wait, if it said so.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            # Drain the bucket so queued callers do not burst straight back in.
+            self._refill(now)
+            self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """
+    Read a retry delay in seconds from response headers.
+
+    Understands ``retry-after-ms`` (sent by OpenAI) and the standard ``Retry-After``
+    header in both its delta-seconds and HTTP-date forms.
+
+    Args:
+        headers: Response headers (case-insensitive mapping).
+
+    Returns:
+        Delay in seconds, or None if no usable hint was present.
+    """
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000.0)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
@@ -0,0 +1,213 @@
+import os
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.metrics import inc, record, retry
+
+
+class StreamInterrupted(Exception):
+    """The response body broke off after some of it was written to the ``.part`` file."""
+
+
+class PDFDownloader:
+    """
+    Concurrent PDF download engine with a shared connection pool.
+
+    Downloads run on a bounded thread pool independent of the page crawl, so the
+    crawler only enqueues URLs. Every URL is fetched once per run, even if it shows
+    up under several project types. Files are streamed to ``<name>.part`` and
+    renamed into place when complete; an interrupted ``.part`` file is resumed
+    with an HTTP Range request on the next attempt or run.
+
+    Connection errors and 429/5xx responses are retried by urllib3 (honouring
+    Retry-After) before any body is read. The download loop itself only resumes
+    a body that broke off mid-stream, so the two never multiply. A resume sends
+    ``If-Range`` with the ETag or Last-Modified seen when the ``.part`` file was
+    started; if the file changed since, the server answers 200 and the download
+    starts over instead of splicing two versions together.
+
+    Args:
+        download_dir (str): Target directory template containing ``{project_type}``.
+        workers (int): Maximum number of parallel downloads (and pooled connections).
+        timeout (tuple): (connect, read) timeouts in seconds.
+        max_retries (int): urllib3 retries for connection errors and 429/5xx, and
+            also the number of resumes after a broken stream.
+        chunk_size (int): Bytes written per streamed chunk.
+    """
+
+    def __init__(self, download_dir, workers=4, timeout=(10, 60), max_retries=3, chunk_size=256 * 1024):
+        self.download_dir = download_dir
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.chunk_size = chunk_size
+
+        retry_policy = Retry(
+            total=max_retries,
+            backoff_factor=1.0,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET", "HEAD"),
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry_policy)
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = "Mozilla/5.0 (crochet-pattern-downloader)"
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf-download")
+        self._futures = []
+        self._seen = set()
+        self._lock = threading.Lock()
+        self.stats = {"downloaded": 0, "resumed": 0, "skipped": 0, "duplicates": 0, "failed": 0, "bytes": 0}
+
+    @staticmethod
+    def normalize_url(pdf_url):
+        """Drop the fragment so the same file is only queued once."""
+        return urllib.parse.urldefrag(pdf_url.strip())[0]
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+        if key == "bytes":
+            inc("pdf_download_bytes_total", amount)
+        else:
+            inc("pdf_download_events_total", amount, event=key)
+
+    def submit(self, pdf_url, file_name, project_type):
+        """
+        Queue a download unless the URL was already queued in this run.
+
+        Returns:
+            bool: True if the download was queued.
+        """
+        url = self.normalize_url(pdf_url)
+        with self._lock:
+            if url in self._seen:
+                self.stats["duplicates"] += 1
+                print(f"[INFO] Already queued, skipping duplicate: {url}")
+                return False
+            self._seen.add(url)
+            self._futures.append(self._pool.submit(self.download, url, file_name, project_type))
+        return True
+
+    def download(self, pdf_url, file_name, project_type):
+        """
+        Download a single PDF synchronously, resuming a previous partial file.
+
+        Returns:
+            str: Final path of the PDF, or None if the download failed.
+        """
+        project_dir = self.download_dir.format(project_type=project_type)
+        os.makedirs(project_dir, exist_ok=True)
+        pdf_path = os.path.join(project_dir, file_name)
+
+        if os.path.exists(pdf_path):
+            self._count("skipped")
+            print(f"[INFO] {file_name} already downloaded, skipping.")
+            return pdf_path
+
+        print(f"[INFO] Attempting to download {file_name} from {pdf_url}...")
+        part_path = pdf_path + ".part"
+        start = time.perf_counter()
+        for attempt in range(1, self.max_retries + 2):
+            try:
+                self._fetch(pdf_url, part_path)
+                os.replace(part_path, pdf_path)
+                if os.path.exists(part_path + ".validator"):
+                    os.remove(part_path + ".validator")
+                self._count("downloaded")
+                record("pdf_download", time.perf_counter() - start)
+                print(f"[SUCCESS] Downloaded: {file_name} at {pdf_path}")
+                return pdf_path
+            except StreamInterrupted as e:
+                # The .part file is kept and resumed from where the stream broke off.
+                if attempt > self.max_retries:
+                    print(f"[ERROR] Failed to download {file_name}: {e}")
+                    break
+                print(f"[WARNING] Download of {file_name} interrupted, resuming "
+                      f"({attempt}/{self.max_retries}): {e}")
+                retry("pdf_download")
+            except requests.exceptions.RequestException as e:
+                print(f"[ERROR] Failed to download {file_name}: {e}")
+                break
+            except Exception as e:
+                print(f"[ERROR] Error saving {file_name}: {e}")
+                break
+        self._count("failed")
+        record("pdf_download", time.perf_counter() - start, outcome="failure")
+        return None
+
+    @staticmethod
+    def _validator(response):
+        """Strong validator usable in If-Range: the ETag unless weak, else Last-Modified."""
+        etag = response.headers.get("ETag")
+        if etag and not etag.startswith("W/"):
+            return etag
+        return response.headers.get("Last-Modified")
+
+    def _fetch(self, pdf_url, part_path):
+        validator_path = part_path + ".validator"
+        offset = 0
+        headers = {}
+        if os.path.exists(part_path) and os.path.exists(validator_path):
+            with open(validator_path, "r", encoding="utf-8") as f:
+                validator = f.read().strip()
+            offset = os.path.getsize(part_path)
+            if offset:
+                headers = {"Range": f"bytes={offset}-", "If-Range": validator}
+
+        with self.session.get(pdf_url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 416 and offset:
+                # Nothing left to fetch: the partial file already holds the whole body.
+                return
+            response.raise_for_status()
+
+            if offset and response.status_code == 206:
+                mode = "ab"
+                self._count("resumed")
+            else:
+                # A fresh download, or the file changed since the .part was started: start over.
+                mode, offset = "wb", 0
+                validator = self._validator(response)
+                if validator:
+                    with open(validator_path, "w", encoding="utf-8") as f:
+                        f.write(validator)
+                elif os.path.exists(validator_path):
+                    # Without a validator a later resume could not be checked; it starts over.
+                    os.remove(validator_path)
+
+            expected = response.headers.get("Content-Length")
+            written = 0
+            try:
+                with open(part_path, mode) as pdf_file:
+                    for chunk in response.iter_content(self.chunk_size):
+                        pdf_file.write(chunk)
+                        written += len(chunk)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                raise StreamInterrupted(f"connection lost after {written} bytes: {e}") from e
+            finally:
+                self._count("bytes", written)
+
+            if expected is not None and written < int(expected):
+                raise StreamInterrupted(f"connection closed after {written} of {expected} bytes")
+
+    def close(self):
+        """
+        Wait for all queued downloads and release the pool.
+
+        Returns:
+            dict: Download statistics.
+        """
+        self._pool.shutdown(wait=True)
+        self.session.close()
+        print(f"[INFO] Downloads finished: {self.stats}")
+        return self.stats
@@ -5,70 +5,88 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 import time
 import os
-import requests
 from selenium.webdriver.chrome.options import Options
 from webdriver_manager.chrome import ChromeDriverManager
 import urllib.parse
+import argparse
+import sys
+
+from downloader import PDFDownloader
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.metrics import start_profiler_if_enabled, write_summary
 
 # PDF folder (inside Docker container or local machine)
-download_dir = os.path.expanduser("~/naizaCrochetingDev/scrapper/input_file/{project_type}")
+# Overridable so the pipeline runner can point downloads at its own input folder.
+download_dir = os.getenv(
+    "PDF_DOWNLOAD_DIR", os.path.expanduser("~/naizaCrochetingDev/scrapper/input_file/{project_type}")
+)
 if not os.path.exists(download_dir):
     os.makedirs(download_dir)
 
-# Set Chrome options for headless scraping
-chrome_options = Options()
-chrome_options.add_argument("--headless")  # Running in headless mode
-chrome_options.add_argument("--no-sandbox")
-chrome_options.add_argument("--disable-dev-shm-usage")
+# Listing page of crochet clothing patterns for one project type
+# base_url = "https://www.yarnspirations.com/collections/patterns?filter.p.m.global.project_type={project_type}&page={page_num}"
+base_url = 'https://www.yarnspirations.com/collections/patterns?filter.p.m.global.pattern_category=Clothing&filter.p.m.global.project_type={project_type}&filter.p.m.global.skill_type=Crochet&page={page_num}'
+
+# Crawl log used by the Playwright crawler to resume interrupted runs
+crawl_state_path = os.path.join(os.path.dirname(download_dir), "crawl_state.jsonl")
+
+driver = None
+
+def start_driver():
+    """
+    Start the headless Chrome WebDriver on first use instead of at import time.
+    """
+    global driver
+    if driver is not None:
+        return driver
 
-print("[INFO] Automatically detecting and installing the correct ChromeDriver...")
+    # Set Chrome options for headless scraping
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")  # Running in headless mode
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
 
-# Automatically install the matching ChromeDriver version
-try:
-    service = Service(ChromeDriverManager().install())  
-    # Initialize the WebDriver using the chrome_options
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-    print("[INFO] WebDriver started successfully.")
-except Exception as e:
-    print(f"[ERROR] Failed to start WebDriver: {e}")
-    exit()
+    print("[INFO] Automatically detecting and installing the correct ChromeDriver...")
+
+    # Automatically install the matching ChromeDriver version
+    try:
+        service = Service(ChromeDriverManager().install())
+        # Initialize the WebDriver using the chrome_options
+        driver = webdriver.Chrome(service=service, options=chrome_options)
+        print("[INFO] WebDriver started successfully.")
+    except Exception as e:
+        print(f"[ERROR] Failed to start WebDriver: {e}")
+        exit()
+    return driver
+
+# Shared download engine: PDFs are fetched on its own thread pool while the crawl continues
+downloader = PDFDownloader(download_dir, workers=4)
 
 # Download function
 def download_pdf(pdf_url, file_name, project_type):
-    print(f"[INFO] Attempting to download {file_name} from {pdf_url}...")
-    try:
-        # Ensure that the project-specific directory exists
-        project_dir = download_dir.format(project_type=project_type)
-        if not os.path.exists(project_dir):
-            os.makedirs(project_dir)
-        
-        # Construct the full path for the PDF file
-        pdf_path = os.path.join(project_dir, file_name)
-        
-        # Download the PDF file in streaming mode
-        response = requests.get(pdf_url, stream=True)
-        response.raise_for_status()
-        
-        with open(pdf_path, 'wb') as pdf_file:
-            for chunk in response.iter_content(1024):
-                pdf_file.write(chunk)
+    return downloader.download(pdf_url, file_name, project_type)
 
-        print(f"[SUCCESS] Downloaded: {file_name} at {pdf_path}")
-    except requests.exceptions.RequestException as e:
-        print(f"[ERROR] Failed to download {file_name}: {e}")
-    except Exception as e:
-        print(f"[ERROR] Error saving {file_name}: {e}")
+def queue_pdf_link(pdf_url, project_type):
+    """
+    Hand a pattern link to the downloader if it points to a PDF.
+    """
+    # Check if the link is a PDF link
+    if pdf_url and pdf_url.endswith('.pdf'):
+        file_name = pdf_url.split('/')[-1]
+        print(f"[INFO] Found PDF link: {pdf_url} for {project_type} - Queued for download")
+        downloader.submit(pdf_url, file_name, project_type)
+    else:
+        print(f"[WARNING] Skipping non-PDF or invalid link: {pdf_url}")
 
 # Function to scrape and download patterns from Yarnspirations for a given cloth type
-def download_yarnspirations(project_type, total_page_num):
-    # base_url = "https://www.yarnspirations.com/collections/patterns?filter.p.m.global.project_type={project_type}&page={page_num}"
-    base_url = 'https://www.yarnspirations.com/collections/patterns?filter.p.m.global.pattern_category=Clothing&filter.p.m.global.project_type={project_type}&filter.p.m.global.skill_type=Crochet&page={page_num}'
-
+def download_yarnspirations(project_type, total_page_num, listing_url=base_url):
+    start_driver()
     print(f"[INFO] Starting scraping for project type: {project_type}, Total pages: {total_page_num}")
 
     for page_num in range(1, total_page_num + 1):
         print(f"[INFO] Scraping page {page_num} for {project_type}...")
-        driver.get(base_url.format(project_type=project_type, page_num=page_num))
+        driver.get(listing_url.format(project_type=project_type, page_num=page_num))
         
         # Wait until the "Free Pattern" buttons are loaded
         try:
@@ -86,32 +104,57 @@ def download_yarnspirations(project_type, total_page_num):
         print(f"[INFO] Found {len(pattern_links)} pattern links on page {page_num} for {project_type}")
 
         for pattern_link in pattern_links:
-            pdf_url = pattern_link.get_attribute('href')
-            # Check if the link is a PDF link
-            if pdf_url and pdf_url.endswith('.pdf'):
-                file_name = pdf_url.split('/')[-1]
-                print(f"[INFO] Found PDF link: {pdf_url} for {project_type} - Downloading...")
-                download_pdf(pdf_url, file_name, project_type)
-            else:
-                print(f"[WARNING] Skipping non-PDF or invalid link: {pdf_url}")
+            queue_pdf_link(pattern_link.get_attribute('href'), project_type)
 
     print(f"[INFO] Completed scraping for project type: {project_type}")
 
 # Quit WebDriver after the task is done
 def quit_driver():
+    global driver
+    if driver is None:
+        return
     print("[INFO] Quitting WebDriver...")
     driver.quit()
+    driver = None
     print("[INFO] WebDriver closed.")
 
-# List of clothing types to scrape
-#clothes_list = ['Tops', 'Dresses', 'Skirts', 'Pants', 'Jackets', 'Bunting Bags', 'Costumes', 'Sets', 'Shorts', 'Super Scarves', 'Tank Tops', 'Tunics', 'Vests', 'CAPES+%26+PONCHOS', 'ONESIES+%26+ROMPERS', 'SWEATERS+%26+CARDIGANS']
-# left_clothes = ['Capes & Ponchos', 'Onesies & Rompers', 'Sweaters & Cardigans']
-one_item = ['Onesies & Rompers']
-# Loop through each cloth type with a counter
-for index, cloth in enumerate(one_item, start=1):
-    encoded_cloth = urllib.parse.quote(cloth).replace('%20', '+')
-    print(f"\n[INFO] [{index}/{len(one_item)}] Starting scraping for cloth type: {cloth}")
-    download_yarnspirations(encoded_cloth, total_page_num=3)
-    print(f"[INFO] [{index}/{len(one_item)}] Completed scraping for cloth type: {cloth}\n")
-# Quit WebDriver after all scraping tasks are finished
-quit_driver()
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scrape crochet pattern PDFs from Yarnspirations.")
+    parser.add_argument("--crawler", choices=("selenium", "playwright"), default="selenium",
+                        help="'playwright' crawls listing pages with a pool of browser contexts.")
+    parser.add_argument("--contexts", type=int, default=4, help="Parallel browser contexts (playwright only).")
+    parser.add_argument("--pages", type=int, default=3, help="Listing pages per project type.")
+    parser.add_argument("--base-url", default=base_url,
+                        help="Listing URL template with {project_type} and {page_num} (e.g. local fixtures).")
+    parser.add_argument("--state", default=crawl_state_path, help="Crawl log used to resume (playwright only).")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    start_profiler_if_enabled()
+
+    # List of clothing types to scrape
+    #clothes_list = ['Tops', 'Dresses', 'Skirts', 'Pants', 'Jackets', 'Bunting Bags', 'Costumes', 'Sets', 'Shorts', 'Super Scarves', 'Tank Tops', 'Tunics', 'Vests', 'CAPES+%26+PONCHOS', 'ONESIES+%26+ROMPERS', 'SWEATERS+%26+CARDIGANS']
+    # left_clothes = ['Capes & Ponchos', 'Onesies & Rompers', 'Sweaters & Cardigans']
+    one_item = ['Onesies & Rompers']
+    encoded = [urllib.parse.quote(cloth).replace('%20', '+') for cloth in one_item]
+
+    if args.crawler == "playwright":
+        from playwright_crawler import crawl
+        work = [(project_type, page_num) for project_type in encoded for page_num in range(1, args.pages + 1)]
+        crawl(work, args.base_url, queue_pdf_link, args.state, contexts=args.contexts)
+    else:
+        # Loop through each cloth type with a counter
+        for index, (cloth, encoded_cloth) in enumerate(zip(one_item, encoded), start=1):
+            print(f"\n[INFO] [{index}/{len(one_item)}] Starting scraping for cloth type: {cloth}")
+            download_yarnspirations(encoded_cloth, total_page_num=args.pages, listing_url=args.base_url)
+            print(f"[INFO] [{index}/{len(one_item)}] Completed scraping for cloth type: {cloth}\n")
+        # Quit WebDriver after all scraping tasks are finished
+        quit_driver()
+
+    # Let the queued downloads finish
+    stats = downloader.close()
+    write_summary("scraper", downloads=stats)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import hashlib
+import os
+import sqlite3
+import time
+
+STAGES = ("text", "image")
+
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_EMPTY = "empty"      # stage ran fine but there was nothing to extract
+STATUS_FAILED = "failed"
+STATUS_DUPLICATE = "duplicate"  # byte-identical to another PDF, whose outputs stand for both
+
+FINISHED_STATUSES = (STATUS_DONE, STATUS_EMPTY, STATUS_DUPLICATE)
+# Statuses of an original whose outputs can stand in for its duplicates.
+EXTRACTED_STATUSES = (STATUS_DONE, STATUS_EMPTY)
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """
+    Hash a file's content without loading it into memory at once.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    SQLite record of every PDF seen by the extractor and the status of each stage.
+
+    A PDF is considered up to date only when its size, mtime (or, failing that, its
+    content hash) match the recorded values and every stage finished. Outputs are
+    only marked done after they were moved into place, so a crash mid-write leaves
+    the stage pending and it is redone on the next run.
+
+    Only the parent process writes to the manifest; workers just report results.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        stage_columns = ", ".join(f"{stage}_status TEXT NOT NULL DEFAULT '{STATUS_PENDING}'" for stage in STAGES)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pdfs ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime REAL NOT NULL,"
+            " sha256 TEXT NOT NULL,"
+            f" {stage_columns},"
+            " error TEXT,"
+            " duplicate_of TEXT,"
+            " updated_at REAL NOT NULL)"
+        )
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(pdfs)")]
+        if "duplicate_of" not in columns:
+            # Manifests written before duplicate tracking existed.
+            self.conn.execute("ALTER TABLE pdfs ADD COLUMN duplicate_of TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS pdfs_sha256 ON pdfs (sha256)")
+        self.conn.commit()
+
+    def _row(self, rel_path):
+        columns = ", ".join(f"{stage}_status" for stage in STAGES)
+        return self.conn.execute(
+            f"SELECT size, mtime, sha256, {columns} FROM pdfs WHERE path = ?", (rel_path,)
+        ).fetchone()
+
+    def _original_holds(self, original, sha256):
+        """True if ``original`` still has the given content and every stage of it was extracted."""
+        row = self._row(original)
+        return row is not None and row[2] == sha256 and all(status in EXTRACTED_STATUSES for status in row[3:])
+
+    def needs_processing(self, pdf_path, rel_path):
+        """
+        Decide whether a PDF has to be (re)processed and refresh its fingerprint.
+
+        A duplicate whose original has since changed or failed is reset to pending,
+        so it is deduplicated again or extracted on its own.
+
+        Args:
+            pdf_path (str): Absolute path of the PDF.
+            rel_path (str): Path relative to the input root, used as the manifest key.
+
+        Returns:
+            bool: True if the PDF is new, changed or has an unfinished stage.
+        """
+        stat = os.stat(pdf_path)
+        row = self._row(rel_path)
+
+        if row is not None:
+            size, mtime, sha256 = row[:3]
+            finished = all(status in FINISHED_STATUSES for status in row[3:])
+            original = self.conn.execute("SELECT duplicate_of FROM pdfs WHERE path = ?", (rel_path,)).fetchone()[0]
+            if finished and original is not None and not self._original_holds(original, sha256):
+                print(f"[INFO] Original {original} of {rel_path} changed or failed, re-queueing.")
+                self._reset(rel_path, stat, sha256)
+                return True
+            if size == stat.st_size and mtime == stat.st_mtime:
+                return not finished
+            # Size or mtime moved: only the content hash can tell if it really changed.
+            new_sha256 = file_sha256(pdf_path)
+            if new_sha256 == sha256:
+                self.conn.execute(
+                    "UPDATE pdfs SET size = ?, mtime = ? WHERE path = ?",
+                    (stat.st_size, stat.st_mtime, rel_path)
+                )
+                self.conn.commit()
+                return not finished
+        else:
+            new_sha256 = file_sha256(pdf_path)
+
+        self._reset(rel_path, stat, new_sha256)
+        return True
+
+    def _reset(self, rel_path, stat, sha256):
+        """Store a PDF's fingerprint with every stage pending and no duplicate link."""
+        pending = ", ".join(f"{stage}_status = '{STATUS_PENDING}'" for stage in STAGES)
+        self.conn.execute(
+            "INSERT INTO pdfs (path, size, mtime, sha256, updated_at) VALUES (?, ?, ?, ?, ?) "
+            f"ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime = excluded.mtime, "
+            f"sha256 = excluded.sha256, updated_at = excluded.updated_at, error = NULL, duplicate_of = NULL, {pending}",
+            (rel_path, stat.st_size, stat.st_mtime, sha256, time.time())
+        )
+        self.conn.commit()
+
+    def record(self, rel_path, statuses, error=None):
+        """
+        Store the per-stage outcome reported by a worker.
+
+        Args:
+            rel_path (str): Manifest key of the PDF.
+            statuses (dict): Mapping of stage name to status.
+            error (str): Error message of the last failing stage, if any.
+        """
+        assignments = ", ".join(f"{stage}_status = ?" for stage in statuses)
+        self.conn.execute(
+            f"UPDATE pdfs SET {assignments}, error = ?, updated_at = ? WHERE path = ?",
+            (*statuses.values(), error, time.time(), rel_path)
+        )
+        self.conn.commit()
+
+    def find_original(self, rel_path, queued=()):
+        """
+        Look for another PDF with the same content whose outputs can stand in for this one.
+
+        The original must not be a duplicate itself, and must either have every
+        stage extracted already or be queued for extraction in this run; a copy of
+        a PDF that failed is not a duplicate of it.
+
+        Args:
+            rel_path (str): Manifest key of the PDF, already fingerprinted by ``needs_processing``.
+            queued (container): Manifest keys of the PDFs being extracted in this run.
+
+        Returns:
+            str: Manifest key of the original, or None if this PDF has to be extracted itself.
+        """
+        columns = ", ".join(f"other.{stage}_status" for stage in STAGES)
+        rows = self.conn.execute(
+            f"SELECT other.path, {columns} FROM pdfs AS this JOIN pdfs AS other"
+            " ON other.sha256 = this.sha256 AND other.path != this.path AND other.duplicate_of IS NULL"
+            " WHERE this.path = ? ORDER BY other.path",
+            (rel_path,)
+        ).fetchall()
+        for path, *statuses in rows:
+            if path in queued or all(status in EXTRACTED_STATUSES for status in statuses):
+                return path
+        return None
+
+    def mark_duplicate(self, rel_path, original):
+        """Record that a PDF needs no extraction because ``original`` has the same content."""
+        statuses = ", ".join(f"{stage}_status = '{STATUS_DUPLICATE}'" for stage in STAGES)
+        self.conn.execute(
+            f"UPDATE pdfs SET {statuses}, duplicate_of = ?, error = NULL, updated_at = ? WHERE path = ?",
+            (original, time.time(), rel_path)
+        )
+        self.conn.commit()
+
+    def duplicates(self):
+        """List (path, duplicate_of) for every PDF recorded as an exact duplicate."""
+        return self.conn.execute(
+            "SELECT path, duplicate_of FROM pdfs WHERE duplicate_of IS NOT NULL ORDER BY path"
+        ).fetchall()
+
+    def summary(self):
+        """Count PDFs per status for every stage."""
+        counts = {}
+        for stage in STAGES:
+            rows = self.conn.execute(
+                f"SELECT {stage}_status, COUNT(*) FROM pdfs GROUP BY {stage}_status"
+            ).fetchall()
+            counts[stage] = dict(rows)
+        return counts
+
+    def close(self):
+        self.conn.close()
@@ -1,127 +1,486 @@
 import os
+import sys
 import glob
+import time
+import resource
+import argparse
 import pdfplumber
 import cv2
 import numpy as np
-import time
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pdfminer.pdftypes import resolve1
+
+from manifest import Manifest, STATUS_DONE, STATUS_EMPTY, STATUS_FAILED
 
-raw_pdf_folder = os.path.join(os.getcwd(), "scrapper/input_file/")  
-print(f"Found the folder with the raw pdf files: {raw_pdf_folder}")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", ".."))
+from common import metrics
+
+raw_pdf_folder = os.path.join(os.getcwd(), "scrapper/input_file/")
 raw_image_folder = os.path.join(os.getcwd(), "processed/raw_image")
 raw_instructions_folder = os.path.join(os.getcwd(), "processed/raw_instructions")
+manifest_path = os.path.join(os.getcwd(), "processed/pdf_manifest.sqlite")
 
 def makedirs():
     os.makedirs(raw_pdf_folder, exist_ok=True)
     os.makedirs(raw_image_folder, exist_ok=True)
     os.makedirs(raw_instructions_folder, exist_ok=True)
 
+def partial_path(path):
+    """
+    Temporary path next to ``path``. The suffix goes after the extension, so the
+    ``*.txt`` / ``*.png`` scans downstream never pick up an unfinished file.
+    """
+    return f"{path}.partial-{os.getpid()}"
+
+def remove_stale_partials(*roots):
+    """
+    Delete temporary files left behind by a run that was killed mid-write.
+
+    Returns:
+        int: Number of files removed.
+    """
+    removed = 0
+    for root in roots:
+        for path in glob.glob(os.path.join(root, "**", "*.partial-*"), recursive=True):
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError as e:
+                print(f"[WARNING] Could not remove stale partial file {path}: {e}")
+    if removed:
+        print(f"[INFO] Removed {removed} partial files left by an interrupted run.")
+    return removed
+
+# Filters pdfminer can fully decode to raw samples, by full and abbreviated name.
+RAW_DECODABLE_FILTERS = {
+    "FlateDecode", "Fl", "LZWDecode", "LZW", "ASCII85Decode", "A85",
+    "ASCIIHexDecode", "AHx", "RunLengthDecode", "RL",
+}
+JPEG_FILTERS = {"DCTDecode", "DCT"}
+COLORSPACE_COMPONENTS = {"DeviceRGB": 3, "CalRGB": 3, "DeviceGray": 1, "CalGray": 1}
+
+class StageTimer:
+    """
+    Accumulates wall-clock and CPU seconds spent in named stages of a PDF extraction.
+    """
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            totals = self.stages.setdefault(name, [0.0, 0.0])
+            totals[0] += time.perf_counter() - wall
+            totals[1] += time.process_time() - cpu
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process and its reaped children, in MiB.
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(usage, children) / 1024
+
+def _extract_text(pdf_path):
+    text = ""
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            page_text = page.extract_text()
+            if page_text:
+                text += page_text + "\n"
+    return text
+
 def extract_text_from_pdf_local(pdf_path):
     """
     Extract text from a PDF using pdfplumber.
     """
-    text = ""
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+        return _extract_text(pdf_path)
     except Exception as e:
         print(f"[ERROR] Failed to extract text from {pdf_path}: {e}")
-    return text
+        return ""
 
 def extract_largest_image(pdf_path, output_image_path):
     """
     Extract the largest image from the first page of the PDF.
+
+    The image is written to a temporary file and renamed into place, so a crash
+    never leaves a truncated PNG behind.
+
+    Returns:
+        str: STATUS_DONE, STATUS_EMPTY (no usable image) or STATUS_FAILED.
     """
     try:
         with pdfplumber.open(pdf_path) as pdf:
             first_page = pdf.pages[0]
-            images = first_page.images
-            if not images:
+            largest_image = _largest_image(first_page)
+            if largest_image is None:
                 print(f"[WARNING] No images found on the first page of {pdf_path}.")
-                return
-            # Find the largest image by area
-            largest_image = max(images, key=lambda img: (img["x1"] - img["x0"]) * (img["bottom"] - img["top"]))
-            
-            # Get image bounding box
-            x0, y0, x1, y1 = largest_image["x0"], largest_image["top"], largest_image["x1"], largest_image["bottom"]
-            page_width, page_height = first_page.width, first_page.height
-            
-            # Clamp the bounding box within page dimensions
-            x0 = max(0, x0)
-            y0 = max(0, y0)
-            x1 = min(page_width, x1)
-            y1 = min(page_height, y1)
-            
-            if x1 <= x0 or y1 <= y0:
-                print(f"[ERROR] Invalid bounding box in {pdf_path}: ({x0}, {y0}, {x1}, {y1})")
-                return
-            
-            # Crop and save the image
-            cropped_img = first_page.within_bbox((x0, y0, x1, y1)).to_image().original
-            output_img = cv2.cvtColor(np.array(cropped_img), cv2.COLOR_RGB2BGR)
-            
-            # Ensure output directory exists
-            os.makedirs(os.path.dirname(output_image_path), exist_ok=True)
-            cv2.imwrite(output_image_path, output_img)
+                return STATUS_EMPTY
+
+            # Crop and rasterize the image region
+            output_img = render_image(first_page, largest_image)
+            if output_img is None:
+                print(f"[ERROR] Invalid bounding box in {pdf_path}")
+                return STATUS_EMPTY
+
+            write_image(output_img, output_image_path)
             print(f"[SUCCESS] Extracted image saved as {output_image_path}")
+            return STATUS_DONE
+    except Exception as e:
+        print(f"[ERROR] Failed to extract image from {pdf_path}: {e}")
+        return STATUS_FAILED
+
+def _largest_image(page):
+    """
+    Largest image on a page by displayed area, or None.
+    """
+    if not page.images:
+        return None
+    return max(page.images, key=lambda img: (img["x1"] - img["x0"]) * (img["bottom"] - img["top"]))
+
+def _colorspace_components(colorspace):
+    """
+    Number of colour components for gray/RGB colour spaces, None for anything else.
+    """
+    if not colorspace:
+        return None
+    cs = resolve1(colorspace[0])
+    if isinstance(cs, list) and cs:
+        if getattr(resolve1(cs[0]), "name", None) == "ICCBased":
+            components = resolve1(cs[1]).get("N")
+            return components if components in (1, 3) else None
+        return None
+    return COLORSPACE_COMPONENTS.get(getattr(cs, "name", None))
+
+def decode_embedded_image(image):
+    """
+    Decode an image XObject straight from its stream, without rendering the page.
+
+    Handles JPEG (DCTDecode) streams and 8-bit gray/RGB streams compressed with
+    filters pdfminer understands. Everything else (CMYK, JPEG2000, CCITT, masks,
+    custom Decode arrays) returns None so the caller can fall back to rendering.
+
+    Returns:
+        numpy.ndarray: BGR image ready for cv2.imwrite, or None.
+    """
+    stream = image.get("stream")
+    if stream is None or image.get("imagemask"):
+        return None
+    components = _colorspace_components(image.get("colorspace"))
+    if components is None or stream.get("Decode") is not None:
+        return None
+
+    filters = [getattr(f, "name", f) for f, _ in stream.get_filters()]
+    if filters and filters[-1] in JPEG_FILTERS and all(f in RAW_DECODABLE_FILTERS for f in filters[:-1]):
+        # pdfminer leaves the DCT stage alone, so this is the embedded JPEG file.
+        data = np.frombuffer(stream.get_data(), dtype=np.uint8)
+        decoded = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        return decoded if decoded is not None and decoded.size else None
+
+    if all(f in RAW_DECODABLE_FILTERS for f in filters) and image.get("bits") == 8:
+        width, height = image["srcsize"]
+        data = stream.get_data()
+        if len(data) < width * height * components:
+            return None
+        pixels = np.frombuffer(data, dtype=np.uint8, count=width * height * components)
+        pixels = pixels.reshape((height, width, components))
+        if components == 1:
+            return cv2.cvtColor(pixels, cv2.COLOR_GRAY2BGR)
+        return cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR)
+
+    return None
+
+def render_image(page, image):
+    """
+    Rasterize the page region covered by ``image``.
+
+    Returns:
+        numpy.ndarray: BGR image, or None if the bounding box lies outside the page.
+    """
+    x0, y0, x1, y1 = image["x0"], image["top"], image["x1"], image["bottom"]
+    x0, y0 = max(0, x0), max(0, y0)
+    x1, y1 = min(page.width, x1), min(page.height, y1)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    cropped_img = page.within_bbox((x0, y0, x1, y1)).to_image().original
+    return cv2.cvtColor(np.array(cropped_img), cv2.COLOR_RGB2BGR)
+
+def write_image(output_img, output_image_path):
+    """
+    Write a BGR image via a temporary file so readers never see a partial PNG.
+    """
+    os.makedirs(os.path.dirname(output_image_path), exist_ok=True)
+    # The temporary name has no image extension, so encode by the real one and write the bytes.
+    ok, encoded = cv2.imencode(os.path.splitext(output_image_path)[1], output_img)
+    if not ok:
+        raise IOError(f"cv2 could not encode {output_image_path}")
+    tmp_path = partial_path(output_image_path)
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(encoded.tobytes())
+        os.replace(tmp_path, output_image_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def extract_pdf(pdf_path, text_file_path, image_file_path, timer):
+    """
+    Extract text and the largest first-page image while opening the PDF only once.
+
+    Page text is streamed to the output file as each page is parsed, and page
+    caches are released straight after, so memory stays flat on long patterns.
+    The cover image is taken from the embedded stream when possible and only
+    rendered when the stream cannot be decoded directly.
+
+    Returns:
+        tuple: (statuses, error) where statuses maps each stage to its status.
+    """
+    statuses = {"text": STATUS_FAILED, "image": STATUS_FAILED}
+
+    try:
+        with timer.stage("open"):
+            pdf = pdfplumber.open(pdf_path)
+    except Exception as e:
+        print(f"[ERROR] Failed to open {pdf_path}: {e}")
+        return statuses, f"open: {e}"
+
+    error = None
+    with pdf:
+        if not pdf.pages:
+            # No first page means no cover: nothing to extract rather than a failure.
+            print(f"[WARNING] {pdf_path} has no pages.")
+            statuses["image"] = STATUS_EMPTY
+        tmp_text_path = partial_path(text_file_path)
+        has_text = False
+        try:
+            with open(tmp_text_path, "w", encoding="utf-8") as text_file:
+                for page_number, page in enumerate(pdf.pages):
+                    if page_number == 0:
+                        statuses["image"], error = _extract_cover(pdf_path, page, image_file_path, timer)
+                    with timer.stage("text"):
+                        page_text = page.extract_text()
+                        if page_text:
+                            text_file.write(page_text)
+                            text_file.write("\n")
+                            has_text = has_text or bool(page_text.strip())
+                        page.close()
+            os.replace(tmp_text_path, text_file_path)
+            statuses["text"] = STATUS_DONE if has_text else STATUS_EMPTY
+            print(f"[SUCCESS] Extracted text saved to {text_file_path}")
+        except Exception as e:
+            error = f"text: {e}"
+            print(f"[ERROR] Failed to extract text for {pdf_path}: {e}")
+        finally:
+            # Also covers KeyboardInterrupt; a hard kill is cleaned up by remove_stale_partials.
+            if os.path.exists(tmp_text_path):
+                os.remove(tmp_text_path)
+
+    return statuses, error
+
+def _extract_cover(pdf_path, page, image_file_path, timer):
+    try:
+        with timer.stage("image_select"):
+            image = _largest_image(page)
+        if image is None:
+            print(f"[WARNING] No images found on the first page of {pdf_path}.")
+            return STATUS_EMPTY, None
+
+        with timer.stage("image_decode"):
+            output_img = decode_embedded_image(image)
+        if output_img is None:
+            with timer.stage("image_render"):
+                output_img = render_image(page, image)
+        if output_img is None:
+            print(f"[ERROR] Invalid bounding box in {pdf_path}")
+            return STATUS_EMPTY, None
+
+        with timer.stage("image_write"):
+            write_image(output_img, image_file_path)
+        print(f"[SUCCESS] Extracted image saved as {image_file_path}")
+        return STATUS_DONE, None
     except Exception as e:
         print(f"[ERROR] Failed to extract image from {pdf_path}: {e}")
+        return STATUS_FAILED, f"image: {e}"
 
-def process_pdf(pdf_path):
+def output_paths(pdf_path, input_root=None, text_root=None, image_root=None):
+    """
+    Text and image output paths for a PDF, preserving its subfolder structure.
+
+    The roots default to the folders under the current working directory.
+    """
+    # Get the relative path of the PDF file with respect to the input root
+    relative_path = os.path.relpath(pdf_path, input_root or raw_pdf_folder)
+    pdf_base, _ = os.path.splitext(relative_path)
+    text_file_path = os.path.join(text_root or raw_instructions_folder, pdf_base + ".txt")
+    image_file_path = os.path.join(image_root or raw_image_folder, pdf_base + ".png")
+    return text_file_path, image_file_path
+
+def process_pdf(pdf_path, mode="single", input_root=None, text_root=None, image_root=None):
     """
     Process a single PDF: extract text and the largest image.
     This function preserves the subfolder structure in the output directories.
+
+    Args:
+        pdf_path (str): Path of the PDF.
+        mode (str): "single" opens the PDF once and decodes the embedded image;
+            "render" is the original two-pass path that rasterizes the image.
+        input_root, text_root, image_root (str): Override the default folders
+            (see ``output_paths``).
+
+    Returns:
+        tuple: (statuses, error, timings) where statuses maps each stage to its
+        status and timings maps timed stages to [wall seconds, CPU seconds].
     """
-    # Get the relative path of the PDF file with respect to the raw_pdf_folder
-    relative_path = os.path.relpath(pdf_path, raw_pdf_folder)
-    pdf_base, _ = os.path.splitext(relative_path)
-    
-    # Construct output paths that preserve the subfolder structure
-    text_file_path = os.path.join(raw_instructions_folder, pdf_base + ".txt")
-    image_file_path = os.path.join(raw_image_folder, pdf_base + ".png")
-    
+    text_file_path, image_file_path = output_paths(pdf_path, input_root, text_root, image_root)
+
     # Ensure the output directories exist
     os.makedirs(os.path.dirname(text_file_path), exist_ok=True)
     os.makedirs(os.path.dirname(image_file_path), exist_ok=True)
-    
+
+    timer = StageTimer()
+    if mode == "single":
+        statuses, error = extract_pdf(pdf_path, text_file_path, image_file_path, timer)
+        return statuses, error, timer.stages
+
+    statuses = {}
+    error = None
+
     # Extract text
-    text = extract_text_from_pdf_local(pdf_path)
     try:
-        with open(text_file_path, "w", encoding="utf-8") as f:
-            f.write(text)
+        with timer.stage("text"):
+            text = _extract_text(pdf_path)
+            tmp_path = partial_path(text_file_path)
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(tmp_path, text_file_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        statuses["text"] = STATUS_DONE if text.strip() else STATUS_EMPTY
         print(f"[SUCCESS] Extracted text saved to {text_file_path}")
     except Exception as e:
-        print(f"[ERROR] Failed to save extracted text for {pdf_path}: {e}")
-    
+        statuses["text"] = STATUS_FAILED
+        error = f"text: {e}"
+        print(f"[ERROR] Failed to extract text for {pdf_path}: {e}")
+
     # Extract image
-    extract_largest_image(pdf_path, image_file_path)
+    with timer.stage("image_render"):
+        statuses["image"] = extract_largest_image(pdf_path, image_file_path)
+    if statuses["image"] == STATUS_FAILED:
+        error = "image: extraction failed"
+
+    return statuses, error, timer.stages
+
+def print_timing_report(stage_totals, pdf_count, elapsed):
+    """
+    Print wall/CPU time per stage summed over all PDFs, plus peak memory.
+    """
+    print(f"[INFO] Timing report for {pdf_count} PDFs ({elapsed:.1f}s wall overall):")
+    print(f"       {'stage':<14}{'wall s':>10}{'cpu s':>10}{'ms/pdf':>10}")
+    for name, (wall, cpu) in stage_totals.items():
+        per_pdf = 1000 * wall / pdf_count if pdf_count else 0.0
+        print(f"       {name:<14}{wall:>10.2f}{cpu:>10.2f}{per_pdf:>10.1f}")
+    if elapsed > 0:
+        print(f"       throughput    {pdf_count / elapsed:.2f} PDFs/s")
+    print(f"       peak RSS      {peak_rss_mb():.1f} MiB (largest single process)")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extract instruction text and cover images from pattern PDFs.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Number of worker processes (1 processes PDFs in this process).")
+    parser.add_argument("--manifest", default=manifest_path, help="SQLite manifest tracking processed PDFs.")
+    parser.add_argument("--force", action="store_true", help="Reprocess every PDF regardless of the manifest.")
+    parser.add_argument("--mode", choices=("single", "render"), default="single",
+                        help="'single': one open per PDF, embedded image decoded directly; "
+                             "'render': legacy two-pass extraction with rasterized image.")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
     makedirs()
+    remove_stale_partials(raw_instructions_folder, raw_image_folder)
+    metrics.start_profiler_if_enabled()
+    print(f"Found the folder with the raw pdf files: {raw_pdf_folder}")
+    manifest = Manifest(args.manifest)
     processed_count = 0
-    
+    failed_count = 0
+
     pdf_files = glob.glob(os.path.join(raw_pdf_folder, '**', '*.pdf'), recursive=True)
-    print(f"[INFO] Found {len(pdf_files)} PDF files to process.")
+    print(f"[INFO] Found {len(pdf_files)} PDF files.")
 
+    candidates = []
     for pdf_file in pdf_files:
         relative_path = os.path.relpath(pdf_file, raw_pdf_folder)
-        pdf_base, _ = os.path.splitext(relative_path)
-        image_path = os.path.join(raw_image_folder, pdf_base + ".png")
-        text_path = os.path.join(raw_instructions_folder, pdf_base + ".txt")
-        
-        if os.path.exists(image_path) and os.path.exists(text_path):
+        if manifest.needs_processing(pdf_file, relative_path) or args.force:
+            candidates.append((pdf_file, relative_path))
+        else:
             print(f"[INFO] {pdf_file} already processed, skipping!")
-            continue
-        
-        print(f"[INFO] Processing {pdf_file}...")
-        process_pdf(pdf_file)
+
+    # The scraper saves the same PDF under several project types; extract one copy.
+    todo = []
+    queued = set()
+    duplicate_count = 0
+    for pdf_file, relative_path in candidates:
+        original = manifest.find_original(relative_path, queued)
+        if original is not None:
+            manifest.mark_duplicate(relative_path, original)
+            duplicate_count += 1
+            print(f"[INFO] {relative_path} is identical to {original}, skipping!")
+        else:
+            todo.append((pdf_file, relative_path))
+            queued.add(relative_path)
+    print(f"[INFO] {len(todo)} new, changed or failed PDFs to process with {args.workers} worker(s), "
+          f"{duplicate_count} exact duplicates skipped.")
+
+    stage_totals = {}
+    start = time.perf_counter()
+
+    def record(relative_path, statuses, error, timings):
+        nonlocal processed_count, failed_count
+        manifest.record(relative_path, statuses, error)
+        # Timings come back from the worker processes, so they are recorded here in the parent.
+        for name, (wall, cpu) in timings.items():
+            totals = stage_totals.setdefault(name, [0.0, 0.0])
+            totals[0] += wall
+            totals[1] += cpu
+            metrics.record(name, wall, metric="pdf_stage")
         processed_count += 1
-        print(f"[INFO] Processed PDF count: {processed_count}")
-        time.sleep(1)  # Optional delay
+        if error:
+            failed_count += 1
+        metrics.inc("pdf_total", outcome="failure" if error else "success")
+        print(f"[INFO] Processed PDF count: {processed_count}/{len(todo)}")
+
+    if args.workers <= 1:
+        for pdf_file, relative_path in todo:
+            print(f"[INFO] Processing {pdf_file}...")
+            record(relative_path, *process_pdf(pdf_file, args.mode))
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = {pool.submit(process_pdf, pdf_file, args.mode): relative_path for pdf_file, relative_path in todo}
+            for future in as_completed(futures):
+                relative_path = futures[future]
+                try:
+                    statuses, error, timings = future.result()
+                except Exception as e:
+                    # The worker died before reporting; keep every stage marked as failed.
+                    statuses = {"text": STATUS_FAILED, "image": STATUS_FAILED}
+                    error, timings = str(e), {}
+                    print(f"[ERROR] Worker failed on {relative_path}: {e}")
+                record(relative_path, statuses, error, timings)
 
-    print(f"[INFO] Processing complete. Total PDFs processed: {processed_count}")
+    print(f"[INFO] Processing complete. Total PDFs processed: {processed_count} ({failed_count} with failures)")
+    print_timing_report(stage_totals, processed_count, time.perf_counter() - start)
+    print(f"[INFO] Manifest status: {manifest.summary()}")
+    metrics.inc("pdf_total", duplicate_count, outcome="duplicate")
+    metrics.write_summary("pdf_processor", mode=args.mode, workers=args.workers,
+                          wall_seconds=round(time.perf_counter() - start, 3), manifest=manifest.summary())
+    manifest.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import os
+import time
+
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+
+PATTERN_LINK_XPATH = "//a[contains(@class, 'card-button--full')]"
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media", "stylesheet"}
+BLOCKED_HOSTS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "facebook.net",
+    "facebook.com/tr", "hotjar.com", "klaviyo.com", "pinterest.com", "tiktok.com",
+    "bing.com", "clarity.ms", "criteo", "nr-data.net",
+)
+
+
+def load_state(state_path):
+    """
+    Read the crawl log written by earlier runs.
+
+    Returns:
+        dict: Mapping of (project_type, page_num) to the PDF links found there.
+    """
+    done = {}
+    if not os.path.exists(state_path):
+        return done
+    with open(state_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a truncated last line; that page is simply crawled again.
+                continue
+            done[(entry["project_type"], entry["page"])] = entry["links"]
+    return done
+
+
+async def _block_unneeded(route):
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or any(host in request.url for host in BLOCKED_HOSTS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+async def _worker(worker_id, browser, queue, base_url, timeout_ms, on_page_done):
+    context = await browser.new_context()
+    await context.route("**/*", _block_unneeded)
+    page = await context.new_page()
+    try:
+        while True:
+            try:
+                project_type, page_num = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            url = base_url.format(project_type=project_type, page_num=page_num)
+            print(f"[INFO] [ctx {worker_id}] Scraping page {page_num} for {project_type}...")
+            try:
+                await page.goto(url, wait_until="domcontentloaded", timeout=timeout_ms)
+                await page.wait_for_selector(f"xpath={PATTERN_LINK_XPATH}", timeout=timeout_ms)
+                links = await page.eval_on_selector_all(
+                    f"xpath={PATTERN_LINK_XPATH}", "els => els.map(e => e.href)"
+                )
+            except PlaywrightTimeoutError as e:
+                print(f"[ERROR] Timed out on page {page_num} for {project_type}: {e}")
+                continue
+            except Exception as e:
+                print(f"[ERROR] Failed to load page {page_num} for {project_type}: {e}")
+                continue
+            print(f"[INFO] [ctx {worker_id}] Found {len(links)} pattern links on page {page_num} for {project_type}")
+            on_page_done(project_type, page_num, links)
+    finally:
+        await context.close()
+
+
+async def crawl_async(work, base_url, on_link, state_path, contexts=4, timeout_ms=10000, headless=True):
+    """
+    Crawl listing pages with a pool of isolated browser contexts.
+
+    Every finished page is appended to ``state_path`` together with its links,
+    so an interrupted crawl resumes with the pages that are still missing.
+    Links from pages completed in earlier runs are handed to ``on_link`` again;
+    the downloader skips files it already has.
+
+    Args:
+        work (list): (project_type, page_num) pairs to crawl.
+        base_url (str): Listing URL template with {project_type} and {page_num}.
+        on_link (callable): Called with (pdf_url, project_type) for every link found.
+        state_path (str): JSONL crawl log used for resuming.
+        contexts (int): Number of browser contexts crawling in parallel.
+        timeout_ms (int): Navigation and selector timeout per page.
+        headless (bool): Run Chromium headless.
+
+    Returns:
+        dict: Number of pages crawled, resumed and failed, and elapsed seconds.
+    """
+    start = time.perf_counter()
+    done = load_state(state_path)
+    for (project_type, _), links in done.items():
+        for link in links:
+            on_link(link, project_type)
+
+    queue = asyncio.Queue()
+    for item in work:
+        if tuple(item) not in done:
+            queue.put_nowait(tuple(item))
+    pending = queue.qsize()
+    print(f"[INFO] {len(work) - pending} pages already crawled, {pending} to go with {contexts} contexts.")
+
+    state_dir = os.path.dirname(state_path)
+    if state_dir:
+        os.makedirs(state_dir, exist_ok=True)
+    crawled = 0
+
+    with open(state_path, "a", encoding="utf-8") as state_file:
+        def on_page_done(project_type, page_num, links):
+            nonlocal crawled
+            crawled += 1
+            state_file.write(json.dumps({"project_type": project_type, "page": page_num, "links": links}) + "\n")
+            state_file.flush()
+            for link in links:
+                on_link(link, project_type)
+
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=headless)
+            try:
+                await asyncio.gather(*(
+                    _worker(i, browser, queue, base_url, timeout_ms, on_page_done)
+                    for i in range(max(1, min(contexts, pending)))
+                ))
+            finally:
+                await browser.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"[INFO] Crawled {crawled}/{pending} pages in {elapsed:.1f}s")
+    return {"crawled": crawled, "resumed": len(work) - pending, "failed": pending - crawled, "seconds": elapsed}
+
+
+def crawl(work, base_url, on_link, state_path, contexts=4, timeout_ms=10000, headless=True):
+    """Synchronous wrapper around ``crawl_async``."""
+    return asyncio.run(crawl_async(work, base_url, on_link, state_path, contexts, timeout_ms, headless))